@@ -8,12 +8,14 @@ __metaclass__ = type
 import os
 
 from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.module_utils.six import raise_from
 from ansible.plugins.action import ActionBase
 from ansible.utils.display import Display
 from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
     HAS_INFRAHUBCLIENT,
-    InfrahubclientWrapper,
+    get_arg_or_env,
+    get_shared_client,
 )
 
 
@@ -66,6 +68,9 @@ class ActionModule(ActionBase):
 
         timeout = args.get("timeout", 10)
         branch = args.get("branch", "main")
+        schema_cache_dir = args.get("schema_cache_dir") or os.getenv("INFRAHUB_SCHEMA_CACHE_DIR")
+        broker_socket = args.get("broker_socket") or os.getenv("INFRAHUB_BROKER_SOCKET")
+        use_async = boolean(get_arg_or_env(args, "use_async", "INFRAHUB_USE_ASYNC") or False)
 
         artifact_name = args.get("artifact_name")
         target_id = args.get("target_id")
@@ -77,11 +82,14 @@ class ActionModule(ActionBase):
 
         try:
             Display().v("Initializing Infrahub Client")
-            client = InfrahubclientWrapper(
+            client = get_shared_client(
                 api_endpoint=api_endpoint,
                 token=token,
                 branch=branch,
                 timeout=timeout,
+                schema_cache_dir=schema_cache_dir,
+                broker_socket=broker_socket,
+                use_async=use_async,
             )
             Display().v("Fetch Artifacts")
             result = client.fetch_single_artifact(filters=filters)
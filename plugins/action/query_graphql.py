@@ -9,14 +9,17 @@ import os
 from typing import Dict
 
 from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.module_utils.six import raise_from
 from ansible.plugins.action import ActionBase
 from ansible.utils.display import Display
 from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
     HAS_INFRAHUBCLIENT,
-    InfrahubclientWrapper,
     InfrahubQueryProcessor,
+    get_arg_or_env,
+    get_shared_client,
 )
+from ansible_collections.opsmill.infrahub.plugins.module_utils.result_cache import get_result_cache
 
 
 class ActionModule(ActionBase):
@@ -84,13 +87,22 @@ class ActionModule(ActionBase):
         results = {}
         try:
             Display().v("Initializing Infrahub Client")
-            client = InfrahubclientWrapper(
+            client = get_shared_client(
                 api_endpoint=api_endpoint,
                 token=token,
                 branch=branch,
                 timeout=timeout,
+                broker_socket=args.get("broker_socket") or os.getenv("INFRAHUB_BROKER_SOCKET"),
+                use_async=boolean(get_arg_or_env(args, "use_async", "INFRAHUB_USE_ASYNC") or False),
+            )
+            processor = InfrahubQueryProcessor(
+                client=client,
+                result_cache=get_result_cache(
+                    ttl=int(get_arg_or_env(args, "result_cache_ttl", "INFRAHUB_RESULT_CACHE_TTL") or 0),
+                    cache_dir=args.get("result_cache_dir") or os.getenv("INFRAHUB_RESULT_CACHE_DIR"),
+                    max_size=get_arg_or_env(args, "result_cache_max_size", "INFRAHUB_RESULT_CACHE_MAX_SIZE"),
+                ),
             )
-            processor = InfrahubQueryProcessor(client=client)
             Display().v("Processing Query")
             response = processor.fetch_and_process(query=graphql_query, variables=graph_variables)
             results["data"] = response
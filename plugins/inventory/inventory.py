@@ -68,12 +68,146 @@ DOCUMENTATION = """
                             type: list
                             elements: str
                             default: []
+                        lazy_relationships:
+                            description:
+                                - List of relationships of node_type left out of the inventory, and loaded only for the
+                                  hosts used by a play by the opsmill.infrahub.vars plugin, which must be enabled.
+                                - Keeps the inventory small when some relationships are large, e.g. the interfaces.
+                            type: list
+                            elements: str
+                            default: []
+                        max_depth_by_relationship:
+                            description:
+                                - Depth up to which each listed relationship of node_type is resolved, overriding
+                                  O(max_depth) for these relationships.
+                            type: dict
+                            default: {}
         branch:
             required: False
             description:
                 - Branch in which the request is made
             type: str
             default: main
+        batch_query:
+            required: False
+            description:
+                - Fetch all the node kinds defined in O(nodes) with a single GraphQL query per page,
+                  instead of one query per node kind and per page.
+            type: bool
+            default: False
+        max_concurrency:
+            required: False
+            description:
+                - Maximum number of requests sent at the same time to Infrahub when fetching the nodes.
+                - The node kinds, the related node kinds and their pages are fetched concurrently.
+            type: int
+            default: 1
+        use_async:
+            required: False
+            description:
+                - Send the requests through the async client of the Infrahub SDK, the requests fetched together
+                  (pages, node kinds, related node kinds) being awaited concurrently from a single event loop
+                  instead of being sent from threads.
+                - O(max_concurrency) still bounds the number of requests sent at the same time.
+            type: bool
+            default: False
+            env:
+                - name: INFRAHUB_USE_ASYNC
+        incremental_refresh:
+            required: False
+            description:
+                - Refresh the cached inventory on each run instead of reusing it as-is, requires O(cache).
+                - Only the hosts which have been added or updated since the last run, or which reference an updated
+                  related node, are fetched and processed again. The hosts which don't exist anymore are removed.
+                - The whole inventory is fetched again once O(cache_timeout) seconds have passed since it was last
+                  fetched as a whole, however often it has been refreshed in the meantime.
+            type: bool
+            default: False
+        cache_soft_ttl:
+            required: False
+            description:
+                - Age in seconds after which the cached inventory is refreshed in the background, requires O(cache)
+                  and a persistent cache plugin, e.g. C(ansible.builtin.jsonfile). The age is counted from the last
+                  refresh.
+                - The cached inventory is still returned right away while a detached process refreshes it, only one
+                  refresh runs at a time. The inventory is built in the foreground only once the cache has expired,
+                  O(cache_timeout) being the hard TTL.
+                - Disabled when set to 0.
+            type: int
+            default: 0
+        cache_format:
+            required: False
+            description:
+                - Encoding of the cached inventory, requires O(cache).
+                - V(compact) serializes it with C(orjson) or C(msgpack) and compresses it with C(zstandard),
+                  each of them being used if installed, the standard C(json) and C(zlib) modules otherwise.
+                - V(json) stores it as plain JSON.
+            type: str
+            choices: ['json', 'compact']
+            default: json
+        schema_cache_dir:
+            required: False
+            description:
+                - Directory where the schema of the branch is persisted between runs, e.g. C(~/.ansible/cache/infrahub).
+                - The schema is downloaded again only when its hash on the Infrahub server has changed.
+                - The schema is not persisted if not defined.
+            type: str
+            env:
+                - name: INFRAHUB_SCHEMA_CACHE_DIR
+        lean_query:
+            required: False
+            description:
+                - Query only the value of the attributes and the id of the related nodes, without the properties
+                  (source, owner, is_protected...), and turn the responses into plain dicts instead of SDK nodes.
+                - Lowers the size of the responses and the memory and CPU used to process them, the inventory is the same.
+            type: bool
+            default: False
+        limit:
+            required: False
+            description:
+                - Fetch only the hosts matching the limit.
+                - Each item is either a host name, possibly with wildcards, e.g. V(device-1*), or a selector in the
+                  form V(attribute=value), V(relationship=value) or V(relationship.attribute=value), e.g. V(role=edge)
+                  or V(site=paris). A relationship alone is matched on the default filter of its peer.
+                - The hosts matching one of the host names and all the selectors are kept. The node kinds without
+                  the attributes or relationships selected are skipped.
+                - The selectors are matched by Infrahub, the other hosts aren't fetched at all. The host names are
+                  matched on the name of the hosts, their display label, once they are fetched.
+            type: list
+            elements: str
+            default: []
+            env:
+                - name: INFRAHUB_LIMIT
+        max_depth:
+            required: False
+            description:
+                - Depth up to which the relationships of the hosts are resolved.
+                - At 1 the related nodes are resolved with their attributes only, at 2 with their relationships too,
+                  resolved with their attributes only, and so on.
+                - Each related node is resolved once per depth and shared by the hosts referencing it. A related node
+                  referencing one of the nodes it's resolved from is replaced by its id, to break the cycle.
+                - O(incremental_refresh) is disabled when a relationship is resolved beyond the first depth.
+            type: int
+            default: 1
+        metrics_report:
+            required: False
+            description:
+                - Path of a JSON file where a report of the run is written. It holds the wall time, the number of
+                  requests, the bytes received and the number of nodes of each phase (cache, schema, nodes, peers,
+                  resolve, compose) and of each node kind.
+                - The same metrics are displayed with C(-vvv).
+            type: str
+            env:
+                - name: INFRAHUB_METRICS_REPORT
+        auto_include:
+            required: False
+            description:
+                - Fetch only the attributes and relationships referenced by O(compose), O(keyed_groups) and O(groups),
+                  along with the ones listed in the O(nodes) include option.
+                - The attributes being fetched are the only ones set as host vars. All the attributes of a node kind are
+                  fetched if none of them are referenced.
+            type: bool
+            default: False
         compose:
             description:
                 - List of custom ansible host vars to create from the objects fetched from Infrahub
@@ -140,18 +274,33 @@ RETURN = """
       - list of composed dictionaries with key and value
     type: list
 """
+import fcntl
+import hashlib
 import json
-from typing import Any, Dict, Optional, Tuple
+import os
+import re
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
 
+from ansible import constants as ansible_constants
 from ansible.errors import AnsibleError
 from ansible.module_utils.ansible_release import __version__ as ansible_version
+from ansible.module_utils.common.text.converters import to_text
 from ansible.module_utils.six import raise_from
 from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from ansible_collections.opsmill.infrahub.plugins.module_utils.cache_utils import (
+    decode_cache_payload,
+    encode_cache_payload,
+)
 from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
     HAS_INFRAHUBCLIENT,
+    InfrahubclientAsyncWrapper,
     InfrahubclientWrapper,
     InfrahubNodesProcessor,
+    register_lazy_token,
 )
+from ansible_collections.opsmill.infrahub.plugins.module_utils.metrics import InfrahubMetrics
 
 try:
     from packaging import version
@@ -161,8 +310,16 @@ else:
     PACKAGING_IMPORT_ERROR = None
 
 
+# Expressions made of variable names only, e.g. "platform.ansible_network_os"
+ATTRIBUTE_PATH_RE = re.compile(r"^\s*[A-Za-z_]\w*(\.[A-Za-z_]\w*)*\s*$")
+JINJA_RESERVED_NAMES = {"true", "false", "none", "True", "False", "None", "and", "or", "not", "in", "is", "if", "else"}
+
+
 class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
     NAME = "opsmill.infrahub.inventory"
+    CACHE_FORMAT_VERSION = 2
+    # The metrics are displayed from -vvv
+    METRICS_VERBOSITY = 3
 
     def verify_file(self, path: str) -> bool:
         """
@@ -194,6 +351,141 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
         else:
             self.templar.available_variables = self._vars
             self.token = self.templar.template(self.get_option("token"), fail_on_undefined=False)
+        # The vars plugin loads the lazy relationships with the same token, even when the hosts come from the cache
+        register_lazy_token(self.token)
+
+    def _get_cache_key(self) -> str:
+        """
+        Build the cache key of the inventory from the endpoint and from the options which define its content,
+        so that several inventories against the same Infrahub instance don't overwrite each other's cache.
+
+        Returns:
+            str: The cache key.
+        """
+        nodes = {}
+        for node_kind, node_options in (self.nodes or {}).items():
+            nodes[node_kind] = dict(node_options or {})
+            for option in ("include", "exclude"):
+                if nodes[node_kind].get(option):
+                    nodes[node_kind][option] = sorted(nodes[node_kind][option])
+        config = {
+            "api_endpoint": self.api_endpoint,
+            "branch": self.branch,
+            "nodes": nodes,
+            "compose": self.compose,
+            "keyed_groups": self.keyed_groups,
+            # The conditionals of the groups are part of the attributes fetched with auto_include
+            "groups": self.get_option("groups"),
+            "auto_include": self.auto_include,
+            "max_depth": self.max_depth,
+            "limit": self.limit,
+        }
+        config_hash = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+        return f"{self.get_cache_key(self.api_endpoint)}_{config_hash[:16]}"
+
+    def _resolves_nested_relationships(self) -> bool:
+        """
+        Tells whether some relationships are resolved beyond the first depth, see max_depth.
+
+        Returns:
+            bool: True if the related nodes of the hosts are resolved with their own relationships.
+        """
+        depths = [self.max_depth]
+        for node_options in (self.nodes or {}).values():
+            depths.extend(((node_options or {}).get("max_depth_by_relationship") or {}).values())
+        return any(int(depth) > 1 for depth in depths)
+
+    def _get_cache_meta(self) -> Dict[str, Any]:
+        """
+        Fetches the metadata stored along with the cached inventory: when it was built as a whole, when it was
+        last refreshed, incrementally or not, and its own TTL.
+
+        Returns:
+            Dict[str, Any]: The metadata of the cached inventory, empty if not available.
+        """
+        try:
+            return json.loads(self._cache[f"{self._get_cache_key()}_meta"])
+        except (KeyError, TypeError, ValueError):
+            return {}
+
+    def _get_cache_age(self, since_refresh: bool = False) -> float:
+        """
+        Age in seconds of the cached inventory, since it was built as a whole or, if since_refresh is True, since it
+        was last refreshed. Infinite if unknown.
+        """
+        meta = self._get_cache_meta()
+        timestamp = (since_refresh and meta.get("refreshed_at")) or meta.get("timestamp")
+        return time.time() - timestamp if timestamp else float("inf")
+
+    def _get_cache_ttl(self) -> float:
+        """
+        TTL in seconds of the cached inventory, recorded along with it when it was built. Infinite if not defined.
+        """
+        ttl = self._get_cache_meta().get("ttl")
+        return ttl if ttl else float("inf")
+
+    @classmethod
+    def _pack_hosts(cls, host_node_attributes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Normalize the host node attributes to be cached: each related node is stored once in a table of peers,
+        the hosts referencing it by key.
+
+        Parameters:
+            host_node_attributes (Dict[str, Any]): Dictionary containing attributes for each host node.
+
+        Returns:
+            Dict[str, Any]: The normalized host node attributes.
+        """
+        peers: Dict[str, Any] = {}
+        keys_by_object: Dict[int, str] = {}
+
+        def pack(value: Any) -> Any:
+            if not isinstance(value, dict):
+                return value
+            # The peers resolved once are shared by the hosts, only hash each of them once
+            key = keys_by_object.get(id(value))
+            if key is None:
+                key = hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:16]
+                keys_by_object[id(value)] = key
+                peers[key] = value
+            return {"__peer__": key}
+
+        hosts = {}
+        for host_node, attributes in host_node_attributes.items():
+            hosts[host_node] = {
+                name: [pack(item) for item in value] if isinstance(value, list) else pack(value)
+                for name, value in attributes.items()
+            }
+        return {"version": cls.CACHE_FORMAT_VERSION, "peers": peers, "hosts": hosts}
+
+    @classmethod
+    def _unpack_hosts(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Rebuild the host node attributes from their normalized form, the hosts sharing the same peer objects.
+
+        Parameters:
+            data (Dict[str, Any]): The normalized host node attributes, or the host node attributes themselves
+                if cached by a previous version.
+
+        Returns:
+            Dict[str, Any]: Dictionary containing attributes for each host node.
+        """
+        if data.get("version") != cls.CACHE_FORMAT_VERSION:
+            return data
+        peers = data["peers"]
+
+        def unpack(value: Any) -> Any:
+            if isinstance(value, dict) and "__peer__" in value:
+                return peers[value["__peer__"]]
+            return value
+
+        return {
+            host_node: {
+                name: [unpack(item) for item in value] if isinstance(value, list) else unpack(value)
+                for name, value in attributes.items()
+            }
+            for host_node, attributes in data["hosts"].items()
+        }
 
     def _fetch_from_cache(self) -> Tuple[Optional[Dict], bool]:
         """
@@ -208,30 +500,219 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
         if not self.use_cache:
             return None, True
 
-        cache_key: str = self.get_cache_key(self.api_endpoint)
+        cache_key: str = self._get_cache_key()
 
         if self.user_cache_setting and self.use_cache:
             self.display.v("Fetching cache.")
             try:
-                host_node_attributes: Dict = json.loads(self._cache[cache_key])
-                return host_node_attributes, not bool(host_node_attributes)
+                host_node_attributes: Dict = self._unpack_hosts(decode_cache_payload(self._cache[cache_key]))
             except KeyError:
                 self.display.v("Cache key not found. Need to load from API.")
                 return None, True
+            except ValueError as exp:
+                self.display.v(f"Unable to read the cache: {exp}. Need to load from API.")
+                return None, True
+            if self._get_cache_age() > self._get_cache_ttl():
+                self.display.v("Cache key expired. Need to load from API.")
+                return None, True
+            return host_node_attributes, not bool(host_node_attributes)
 
         return None, True
 
-    def _store_in_cache(self, host_node_attributes: Dict[str, Any]):
+    def _store_in_cache(
+        self, host_node_attributes: Dict[str, Any], state: Optional[Dict[str, Any]] = None, incremental: bool = False
+    ):
         """
         Store the host node attributes in the cache if the user cache setting is enabled.
 
         Parameters:
             host_node_attributes (Dict[str, Any]): Dictionary containing attributes for each host node.
+            state (Optional[Dict[str, Any]]): The state of the host nodes, used to refresh the cache incrementally.
+            incremental (bool): The cached inventory has been refreshed incrementally. It keeps the time at which it
+                was built as a whole, O(cache_timeout) forcing a full build once expired.
         """
 
         if self.user_cache_setting:
-            cache_key: str = self.get_cache_key(self.api_endpoint)
-            self._cache[cache_key] = json.dumps(host_node_attributes)
+            cache_key: str = self._get_cache_key()
+            compact = self.cache_format == "compact"
+            now = time.time()
+            built_at = (incremental and self._get_cache_meta().get("timestamp")) or now
+            self._cache[cache_key] = encode_cache_payload(self._pack_hosts(host_node_attributes), compact=compact)
+            self._cache[f"{cache_key}_meta"] = json.dumps(
+                {"timestamp": built_at, "refreshed_at": now, "ttl": self.cache_timeout}
+            )
+            if state is not None:
+                self._cache[f"{cache_key}_state"] = encode_cache_payload(state, compact=compact)
+
+    def _fetch_state_from_cache(self) -> Optional[Dict]:
+        """
+        Fetches the state of the host nodes stored along with the cached inventory, used to refresh it incrementally.
+
+        Returns:
+            Optional[Dict]: The state of the host nodes, or None if not available.
+        """
+        if not (self.use_cache and self.user_cache_setting):
+            return None
+
+        cache_key: str = self._get_cache_key()
+        try:
+            return decode_cache_payload(self._cache[f"{cache_key}_state"])
+        except (KeyError, ValueError):
+            self.display.v("State not found in cache. Need to load the whole inventory from API.")
+            return None
+
+    def _is_cache_stale(self) -> bool:
+        """
+        Check whether the cached inventory is older than the soft TTL.
+
+        Returns:
+            bool: True if the cached inventory should be refreshed in the background.
+        """
+        return self._get_cache_age(since_refresh=True) > self.cache_soft_ttl
+
+    def _load_from_api(
+        self, host_node_attributes: Optional[Dict[str, Any]] = None, state: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Iterator[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Build the inventory from Infrahub, or refresh the cached one if its state is provided.
+
+        Parameters:
+            host_node_attributes (Optional[Dict[str, Any]]): The cached host node attributes, to refresh incrementally.
+            state (Optional[Dict[str, Any]]): The cached state of the host nodes, to refresh incrementally.
+
+        Returns:
+            Tuple[Iterator[Dict[str, Any]], Optional[Dict[str, Any]]]: The host node attributes, page by page, and
+                their state, the state being None if O(incremental_refresh) is disabled.
+        """
+        self.display.v("Initializing Infrahub Client")
+        wrapper_class = InfrahubclientAsyncWrapper if self.use_async else InfrahubclientWrapper
+        client = wrapper_class(
+            api_endpoint=self.api_endpoint,
+            branch=self.branch,
+            token=self.token,
+            timeout=self.timeout,
+            max_concurrency=self.max_concurrency,
+            schema_cache_dir=self.schema_cache_dir,
+            lean=self.lean_query,
+            metrics=self.metrics,
+        )
+        lazy_relationships = {
+            node_kind: node_options["lazy_relationships"]
+            for node_kind, node_options in (self.nodes or {}).items()
+            if node_options and node_options.get("lazy_relationships")
+        }
+        processor = InfrahubNodesProcessor(
+            client=client, max_depth=self.max_depth, lazy_relationships=lazy_relationships
+        )
+        nodes = self.nodes
+        if self.auto_include:
+            nodes = processor.apply_auto_include(
+                nodes=nodes, compose=self.compose, groups=self.keyed_groups, conditionals=self.get_option("groups")
+            )
+            included = {kind: options.get("include", "all") for kind, options in nodes.items()}
+            self.display.vvv(f"Attributes and relationships fetched: {included}")
+        if self.limit:
+            nodes = processor.apply_limit(nodes=nodes, limit=self.limit)
+            limited = {kind: options.get("filters") for kind, options in nodes.items()}
+            self.display.vvv(f"Filters of the limit: {limited}")
+            if processor.limit_patterns:
+                self.display.vvv(f"Host names of the limit matched once fetched: {processor.limit_patterns}")
+
+        pages: Iterator[Dict[str, Any]]
+
+        if host_node_attributes and state is not None:
+            self.display.v("Refreshing Nodes from cache")
+            host_node_attributes, state = processor.refresh_and_process(
+                nodes=nodes, host_node_attributes=host_node_attributes, state=state
+            )
+            pages = iter([host_node_attributes])
+        else:
+            if self.incremental_refresh:
+                # Fetched before the nodes, so that the changes made in the meantime are caught next time
+                state = processor.fetch_state(nodes=nodes)
+            self.display.v("Processing Nodes request")
+            pages = processor.iter_process(nodes=nodes, batch_query=self.batch_query)
+        return self._close_when_done(pages=pages, client=client), state
+
+    @staticmethod
+    def _close_when_done(pages: Iterator[Dict[str, Any]], client: InfrahubclientWrapper) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the pages of hosts, then close the client, its connections and, if async, its event loop.
+        """
+        try:
+            yield from pages
+        finally:
+            client.close()
+
+    def _refresh_in_background(self, host_node_attributes: Dict[str, Any]):
+        """
+        Refresh the cached inventory in a detached process, the current run carrying on with the cached inventory.
+        The refresh holds a file lock, a refresh already in progress is never started twice.
+
+        Parameters:
+            host_node_attributes (Dict[str, Any]): The cached host node attributes.
+        """
+        # The memory cache plugin is lost at the end of the run, a detached process could only refresh its own copy
+        if self.get_option("cache_plugin").split(".")[-1] == "memory":
+            self.display.warning(
+                "cache_soft_ttl requires a persistent cache plugin, the inventory cache isn't refreshed in the "
+                f"background with the {self.get_option('cache_plugin')} cache plugin."
+            )
+            return
+        cache_dir = self.get_option("cache_connection")
+        if not cache_dir or not os.path.isdir(cache_dir):
+            cache_dir = tempfile.gettempdir()
+        lock_path = os.path.join(cache_dir, f"{self._get_cache_key()}.lock")
+
+        try:
+            pid = os.fork()
+        except OSError as exp:
+            self.display.warning(f"Unable to refresh the inventory cache in the background: {exp}")
+            return
+        if pid:
+            # The intermediate process exits right away, once the refresh is detached
+            os.waitpid(pid, 0)
+            return
+
+        try:
+            os.setsid()
+            if os.fork():
+                os._exit(0)
+            # Release the standard streams, the caller of the current run may be waiting for them to be closed
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for stream in range(3):
+                os.dup2(devnull, stream)
+
+            self._refresh_with_lock(lock_path=lock_path, host_node_attributes=host_node_attributes)
+        finally:
+            os._exit(0)
+
+    def _refresh_with_lock(self, lock_path: str, host_node_attributes: Dict[str, Any]) -> bool:
+        """
+        Refresh the cached inventory unless another refresh holds the lock, see _refresh_in_background.
+
+        Parameters:
+            lock_path (str): The path of the lock file of the cached inventory.
+            host_node_attributes (Dict[str, Any]): The cached host node attributes.
+
+        Returns:
+            bool: False if another refresh is in progress.
+        """
+        with open(lock_path, "a", encoding="utf-8") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            state = self._fetch_state_from_cache() if self.incremental_refresh else None
+            incremental = bool(host_node_attributes) and state is not None
+            pages, state = self._load_from_api(host_node_attributes=host_node_attributes, state=state)
+            host_node_attributes = {}
+            for page in pages:
+                host_node_attributes.update(page)
+            if host_node_attributes:
+                self._store_in_cache(host_node_attributes=host_node_attributes, state=state, incremental=incremental)
+                self.set_cache_plugin()
+        return True
 
     def set_hosts_and_groups(self, host_node_attributes: Dict[str, Any]):
         """
@@ -262,6 +743,91 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
 
         self._set_composite_vars(self.compose, attributes, host_node, strict=self.strict)
 
+    def _load_hosts_from_api(
+        self, host_node_attributes: Optional[Dict[str, Any]] = None, state: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Add the hosts to the inventory page by page as they are fetched, then store them in the cache.
+        The host node attributes are only kept in memory when they have to be cached.
+
+        Parameters:
+            host_node_attributes (Optional[Dict[str, Any]]): The cached host node attributes, to refresh incrementally.
+            state (Optional[Dict[str, Any]]): The cached state of the host nodes, to refresh incrementally.
+        """
+        processed_hosts = 0
+        incremental = bool(host_node_attributes) and state is not None
+        try:
+            pages, state = self._load_from_api(host_node_attributes=host_node_attributes, state=state)
+            host_node_attributes = {}
+            for page in pages:
+                with self.metrics.phase("compose"):
+                    self.set_hosts_and_groups(host_node_attributes=page)
+                processed_hosts += len(page)
+                if self.user_cache_setting:
+                    host_node_attributes.update(page)
+        except AnsibleError:
+            raise
+        except Exception as exp:
+            raise_from(AnsibleError(str(exp)), exp)
+
+        if not processed_hosts:
+            self.display.v("No nodes processed.")
+        elif host_node_attributes:
+            with self.metrics.phase("cache_write"):
+                self._store_in_cache(host_node_attributes=host_node_attributes, state=state, incremental=incremental)
+
+    def _compile_expressions(self):
+        """
+        Detect the compose and keyed_groups expressions which are plain attribute paths, e.g. "site.name",
+        to evaluate them without rendering a Jinja template for every host.
+        """
+        self._attribute_paths: Dict[str, Tuple[str, ...]] = {}
+        try:
+            use_extra_vars = self.get_option("use_extra_vars")
+        except Exception:
+            use_extra_vars = False
+        if ansible_constants.DEFAULT_JINJA2_NATIVE or use_extra_vars:
+            return
+
+        expressions = list((self.compose or {}).values())
+        expressions += [keyed.get("key") for keyed in self.keyed_groups or [] if isinstance(keyed, dict)]
+        for expression in expressions:
+            if not isinstance(expression, str) or not ATTRIBUTE_PATH_RE.match(expression):
+                continue
+            path = tuple(expression.strip().split("."))
+            # Jinja looks up the attributes of a dict before its keys, e.g. "site.items" is a method
+            if path[0] in JINJA_RESERVED_NAMES or any(hasattr(dict, name) for name in path[1:]):
+                continue
+            self._attribute_paths[expression] = path
+
+    def _compose(self, template, variables, disable_lookups=True):
+        """
+        Evaluate the plain attribute paths directly, the other expressions being rendered by Jinja.
+        Jinja is also used whenever the path can't be resolved, to keep the same result and errors.
+        """
+        path = self._attribute_paths.get(template) if isinstance(template, str) else None
+        if path:
+            value = variables
+            for name in path:
+                if not isinstance(value, dict) or name not in value:
+                    break
+                value = value[name]
+            else:
+                if isinstance(value, (dict, list)):
+                    return value
+                # Same result as the rendering of a single expression for the plain strings. The other values
+                # (None, booleans and numbers, kept as is or not depending on Jinja), the strings evaluated as
+                # literals (e.g. "True" or "[1, 2]") and the strings holding a template are left to Jinja.
+                if isinstance(value, str):
+                    text = to_text(value)
+                    if (
+                        not text.startswith(("{", "["))
+                        and text not in ("True", "False")
+                        and not self.templar.is_possibly_template(text)
+                    ):
+                        return text
+        return super(InventoryModule, self)._compose(template, variables, disable_lookups=disable_lookups)
+
     def main(self):
         """Main function"""
         if not HAS_INFRAHUBCLIENT:
@@ -273,28 +839,51 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
         except ValueError as exp:
             raise (AnsibleError(str(exp)))
 
-        host_node_attributes, need_to_load_from_api = self._fetch_from_cache()
-
-        if need_to_load_from_api:
-            try:
-                self.display.v("Initializing Infrahub Client")
-                client = InfrahubclientWrapper(
-                    api_endpoint=self.api_endpoint,
-                    branch=self.branch,
-                    token=self.token,
-                    timeout=self.timeout,
-                )
-                processor = InfrahubNodesProcessor(client=client)
-                self.display.v("Processing Nodes request")
-                host_node_attributes = processor.fetch_and_process(nodes=self.nodes)
-            except Exception as exp:
-                raise_from(AnsibleError(str(exp)), exp)
-
-        if not host_node_attributes:
+        with self.metrics.phase("cache_read"):
+            host_node_attributes, need_to_load_from_api = self._fetch_from_cache()
+            state = None
+            if not need_to_load_from_api and not self.cache_soft_ttl and self.incremental_refresh:
+                state = self._fetch_state_from_cache()
+                need_to_load_from_api = state is None
+        if not need_to_load_from_api and self.cache_soft_ttl and self._is_cache_stale():
+            self.display.v("Cache is stale. Refreshing it in the background.")
+            self._refresh_in_background(host_node_attributes=host_node_attributes)
+
+        if need_to_load_from_api or state is not None:
+            self._load_hosts_from_api(host_node_attributes=host_node_attributes, state=state)
+        elif not host_node_attributes:
             self.display.v("No nodes processed.")
         else:
-            self.set_hosts_and_groups(host_node_attributes=host_node_attributes)
-            self._store_in_cache(host_node_attributes=host_node_attributes)
+            with self.metrics.phase("compose"):
+                self.set_hosts_and_groups(host_node_attributes=host_node_attributes)
+
+    def _report_metrics(self):
+        """
+        Display the metrics collected during the run with -vvv, and write them to O(metrics_report) if defined.
+        """
+        if not self.metrics.enabled:
+            return
+        for line in self.metrics.summary():
+            self.display.vvv(line)
+        if not self.metrics_report:
+            return
+
+        report = self.metrics.report()
+        report.update(
+            api_endpoint=self.api_endpoint,
+            branch=self.branch,
+            hosts=len(self.inventory.hosts),
+            groups=len(self.inventory.groups),
+        )
+        path = os.path.expanduser(self.metrics_report)
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, encoding="utf-8") as report_file:
+                json.dump(report, report_file, indent=2)
+            os.replace(report_file.name, path)
+        except OSError as exp:
+            self.display.warning(f"Unable to write the metrics report to {path}: {exp}")
 
     def parse(self, inventory, loader, path, cache=True):
         """
@@ -305,6 +894,8 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
 
         self.use_cache = cache
         self.user_cache_setting = self.get_option("cache")
+        self.cache_timeout = self.get_option("cache_timeout")
+        self.cache_format = self.get_option("cache_format")
 
         # Handle extra "/" from api_endpoint configuration and trim if necessary
         self.api_endpoint = self.get_option("api_endpoint").strip("/")
@@ -313,11 +904,32 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
 
         self.branch = self.get_option("branch")
         self.nodes = self.get_option("nodes")
+        self.batch_query = self.get_option("batch_query")
+        self.max_concurrency = self.get_option("max_concurrency")
+        self.use_async = self.get_option("use_async")
+        # The state of the hosts is only used along with the cached inventory
+        self.incremental_refresh = self.get_option("incremental_refresh") and self.user_cache_setting
+        self.cache_soft_ttl = self.get_option("cache_soft_ttl")
+        self.schema_cache_dir = self.get_option("schema_cache_dir")
+        self.auto_include = self.get_option("auto_include")
+        self.max_depth = self.get_option("max_depth")
+        self.limit = self.get_option("limit")
+        if self.incremental_refresh and self._resolves_nested_relationships():
+            # The state only tells whether the hosts and the attributes of their related nodes changed
+            self.display.warning("incremental_refresh is disabled, relationships are resolved beyond the first depth")
+            self.incremental_refresh = False
+        self.lean_query = self.get_option("lean_query")
+        self.metrics_report = self.get_option("metrics_report")
+        self.metrics = InfrahubMetrics(
+            enabled=bool(self.metrics_report) or self.display.verbosity >= self.METRICS_VERBOSITY
+        )
 
         self.strict = self.get_option("strict")
         self.compose = self.get_option("compose")
         self.keyed_groups = self.get_option("keyed_groups")
 
         self._set_authorization()
+        self._compile_expressions()
 
         self.main()
+        self._report_metrics()
@@ -17,6 +17,14 @@ DOCUMENTATION = """
     description:
         - Get inventory hosts from Infrahub
     options:
+        _terms:
+            description:
+                - GraphQL queries to send to Infrahub with a single request, as strings or dictionaries, instead of
+                  O(query). The list of edges returned for each query is returned, in the same order.
+                - A query can also be a dictionary with the C(query) and its C(graph_variables).
+                - The queries are merged into a single document, the root fields, the variables and the fragments of
+                  each query being prefixed to avoid collisions. A mutation is sent on its own.
+            required: False
         api_endpoint:
             description: Endpoint of the Infrahub API
             required: True
@@ -34,13 +42,15 @@ DOCUMENTATION = """
             type: int
             default: 10
         query:
-            required: True
+            required: False
             description:
                 - GraphQL query to send to Infrahub to obtain desired data
+                - Required unless the queries are given as terms.
             type: str
         graph_variables:
             description:
                 - Dictionary of keys/values to pass into the GraphQL query
+                - Passed to each query given as terms which has no graph_variables of its own.
             required: False
             type: dict
             default: {}
@@ -55,6 +65,50 @@ DOCUMENTATION = """
                 - Whether or not to validate SSL of the Infrahub instance
             required: False
             default: True
+        broker_socket:
+            description:
+                - Path of the unix socket of a local broker sharing the connections to Infrahub, and the responses
+                  of the identical queries, between the forks of the controller.
+                - The broker is started on demand and exits once idle. Disabled when not set.
+            required: False
+            type: str
+            env:
+                - name: INFRAHUB_BROKER_SOCKET
+        use_async:
+            description:
+                - Send the requests through the async client of the Infrahub SDK
+            required: False
+            type: bool
+            default: False
+            env:
+                - name: INFRAHUB_USE_ASYNC
+        result_cache_ttl:
+            description:
+                - Seconds during which the results of the identical queries are reused, instead of sending them again
+                  each time a template using the lookup is evaluated. Disabled when 0.
+                - The results are cached by endpoint, token, branch, query and variables. The mutations are never cached.
+            required: False
+            type: int
+            default: 0
+            env:
+                - name: INFRAHUB_RESULT_CACHE_TTL
+        result_cache_dir:
+            description:
+                - Directory where the cached results are shared between the forks of the controller, along with the
+                  results kept in memory by each process. Memory only when not set.
+            required: False
+            type: str
+            env:
+                - name: INFRAHUB_RESULT_CACHE_DIR
+        result_cache_max_size:
+            description:
+                - Maximum size of the results kept in O(result_cache_dir), in MiB. The oldest results are removed first.
+                - Must be positive.
+            required: False
+            type: int
+            default: 100
+            env:
+                - name: INFRAHUB_RESULT_CACHE_MAX_SIZE
 """
 
 EXAMPLES = """
@@ -85,6 +139,24 @@ EXAMPLES = """
     - name: Print result
       ansible.builtin.debug:
         msg: "{{ query_response }}"
+
+    - name: Obtain the sites and the devices of a site from Infrahub, with a single request
+      ansible.builtin.set_fact:
+        sites: "{{ results[0] }}"
+        devices: "{{ results[1] }}"
+      vars:
+        results: "{{ query('opsmill.infrahub.lookup', query_string, devices_query) }}"
+        devices_query:
+          query:
+            InfraDevice:
+              "@filters":
+                site__name__value: "$site"
+              edges:
+                node:
+                  name:
+                    value:
+          graph_variables:
+            site: atl1
 """
 
 RETURN = """
@@ -96,17 +168,20 @@ RETURN = """
 
 
 import os
-from typing import Dict
+from typing import Any, Dict, Optional, Tuple, Union
 
 from ansible.errors import AnsibleError, AnsibleLookupError
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.module_utils.six import raise_from
 from ansible.plugins.lookup import LookupBase
 from ansible.utils.display import Display
 from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
     HAS_INFRAHUBCLIENT,
-    InfrahubclientWrapper,
     InfrahubQueryProcessor,
+    get_arg_or_env,
+    get_shared_client,
 )
+from ansible_collections.opsmill.infrahub.plugins.module_utils.result_cache import get_result_cache
 
 
 class LookupModule(LookupBase):
@@ -145,31 +220,73 @@ class LookupModule(LookupBase):
 
         timeout = kwargs.get("timeout", 10)
         branch = kwargs.get("branch", "main")
+        broker_socket = kwargs.get("broker_socket") or os.getenv("INFRAHUB_BROKER_SOCKET")
+        use_async = boolean(get_arg_or_env(kwargs, "use_async", "INFRAHUB_USE_ASYNC") or False)
+        try:
+            result_cache = get_result_cache(
+                ttl=int(get_arg_or_env(kwargs, "result_cache_ttl", "INFRAHUB_RESULT_CACHE_TTL") or 0),
+                cache_dir=kwargs.get("result_cache_dir") or os.getenv("INFRAHUB_RESULT_CACHE_DIR"),
+                max_size=get_arg_or_env(kwargs, "result_cache_max_size", "INFRAHUB_RESULT_CACHE_MAX_SIZE"),
+            )
+        except ValueError as exp:
+            raise AnsibleLookupError(str(exp))
 
-        if query is None:
+        if graph_variables is not None:
+            if not isinstance(graph_variables, Dict):
+                raise AnsibleLookupError("graph_variables parameter must be a list of Dict")
+        queries = None
+        if query is None and terms:
+            queries = [self._get_term_query(term=term, graph_variables=graph_variables) for term in terms]
+        elif query is None:
             raise AnsibleLookupError("Query parameter was not passed")
-        if isinstance(query, (Dict, str)):
+        elif isinstance(query, (Dict, str)):
             graphql_query = query
         else:
             raise AnsibleLookupError("Query parameter must be either a string or a Dictionary")
-        if graph_variables is not None:
-            if not isinstance(graph_variables, Dict):
-                raise AnsibleLookupError("graph_variables parameter must be a list of Dict")
 
         results = {}
         try:
             Display().v("Initializing Infrahub Client")
-            client = InfrahubclientWrapper(
+            client = get_shared_client(
                 api_endpoint=api_endpoint,
                 token=token,
                 branch=branch,
                 timeout=timeout,
+                broker_socket=broker_socket,
+                use_async=use_async,
             )
-            processor = InfrahubQueryProcessor(client=client)
-            Display().v("Processing Query")
-            results = processor.fetch_and_process(query=graphql_query, variables=graph_variables)
+            processor = InfrahubQueryProcessor(client=client, result_cache=result_cache)
+            if queries is not None:
+                Display().v(f"Processing {len(queries)} Queries")
+                results = processor.fetch_and_process_many(queries=queries)
+            else:
+                Display().v("Processing Query")
+                results = processor.fetch_and_process(query=graphql_query, variables=graph_variables)
 
         except Exception as exp:
             raise_from(AnsibleError(str(exp)), exp)
 
         return results
+
+    @staticmethod
+    def _get_term_query(term: Any, graph_variables: Optional[Dict]) -> Tuple[Union[Dict, str], Optional[Dict]]:
+        """
+        Read a query given as a term.
+
+        Parameters:
+            term (Any): The query, a string or a Dictionary, or a Dictionary with the query and its graph_variables
+            graph_variables (Optional[Dict]): Variables of the queries which have none of their own
+
+        Returns:
+            Tuple[Union[Dict, str], Optional[Dict]]: The query and its variables
+        """
+        if isinstance(term, Dict) and "query" in term:
+            query = term["query"]
+            graph_variables = term.get("graph_variables", graph_variables)
+        else:
+            query = term
+        if not isinstance(query, (Dict, str)):
+            raise AnsibleLookupError("Each query must be either a string or a Dictionary")
+        if graph_variables is not None and not isinstance(graph_variables, Dict):
+            raise AnsibleLookupError("graph_variables parameter must be a list of Dict")
+        return query, graph_variables
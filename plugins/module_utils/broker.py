@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Local broker multiplexing the requests sent to Infrahub by the forks of an Ansible controller.
+
+The broker is a daemon listening on a unix socket, started on demand by the first plugin using it. It sends the
+requests to Infrahub through a single pool of connections, caches the responses of the read-only requests (schema,
+GraphQL queries, artifacts) for a short time and coalesces the identical requests in flight, so that N forks sending
+the same query result in a single request to Infrahub. It exits once idle.
+
+This file only depends on the standard library and httpx, it is run as a script:
+    python broker.py --socket ~/.ansible/infrahub-broker.sock
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import argparse
+import asyncio
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+try:
+    import httpx
+except ImportError:
+    HAS_HTTPX = False
+else:
+    HAS_HTTPX = True
+
+BROKER_PROTOCOL_VERSION = 1
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_CACHE_TTL = 30
+DEFAULT_MAX_CONNECTIONS = 20
+# Seconds waited for a broker started on demand to accept connections
+BROKER_START_TIMEOUT = 5
+MAX_CACHED_RESPONSES = 10000
+# Headers telling who sends the request, part of the cache key
+AUTH_HEADERS = ("authorization", "x-infrahub-key")
+
+
+class InfrahubBroker:
+    """
+    Serve the requests of the forks over a unix socket, one JSON request and one JSON response per connection.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        idle_timeout: int = DEFAULT_IDLE_TIMEOUT,
+        cache_ttl: int = DEFAULT_CACHE_TTL,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ):
+        """
+        Initializes InfrahubBroker.
+
+        Parameters:
+            socket_path (str): Path of the unix socket to listen on.
+            idle_timeout (int): Seconds without request after which the broker exits.
+            cache_ttl (int): Seconds during which the responses of the read-only requests are reused. 0 disables it.
+            max_connections (int): Maximum number of connections opened to Infrahub.
+        """
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.cache_ttl = cache_ttl
+        self.max_connections = max_connections
+        self.cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.in_flight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self.clients: Dict[Union[bool, str], httpx.AsyncClient] = {}
+        self.last_activity = time.monotonic()
+        self.stats = {"requests": 0, "upstream": 0, "cached": 0, "coalesced": 0}
+
+    @staticmethod
+    def is_read_only(request: Dict[str, Any]) -> bool:
+        """
+        Tell whether a request only reads data, its response can then be shared with the identical requests.
+
+        Parameters:
+            request (Dict[str, Any]): The request sent by a fork.
+
+        Returns:
+            bool: True for the GET requests and the GraphQL queries, False for the mutations and the logins.
+        """
+        method = request["method"].upper()
+        if method == "GET":
+            return True
+        if method != "POST" or "/graphql" not in request["url"]:
+            return False
+        query = ((request.get("payload") or {}).get("query") or "").lstrip()
+        return query.startswith(("query", "{"))
+
+    @staticmethod
+    def get_key(request: Dict[str, Any]) -> str:
+        """
+        Build the key of a request, the requests of different users never share their responses.
+        """
+        headers = {name.lower(): value for name, value in (request.get("headers") or {}).items()}
+        identity = [headers.get(name) for name in AUTH_HEADERS]
+        data = [request["method"].upper(), request["url"], request.get("payload"), identity, request.get("verify")]
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _get_client(self, verify: Union[bool, str]) -> httpx.AsyncClient:
+        if verify not in self.clients:
+            self.clients[verify] = httpx.AsyncClient(
+                verify=verify, limits=httpx.Limits(max_connections=self.max_connections)
+            )
+        return self.clients[verify]
+
+    async def _send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self.stats["upstream"] += 1
+        client = self._get_client(verify=request.get("verify", True))
+        params = {"json": request["payload"]} if request.get("payload") else {}
+        try:
+            response = await client.request(
+                method=request["method"],
+                url=request["url"],
+                headers=request.get("headers") or {},
+                timeout=request.get("timeout"),
+                **params,
+            )
+        except httpx.NetworkError as exc:
+            return {"error": "unreachable", "message": str(exc)}
+        except httpx.ReadTimeout as exc:
+            return {"error": "timeout", "message": str(exc)}
+        return {
+            "status": response.status_code,
+            "headers": {"content-type": response.headers.get("content-type", "")},
+            "content": base64.b64encode(response.content).decode("ascii"),
+        }
+
+    def _store(self, key: str, response: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        if len(self.cache) >= MAX_CACHED_RESPONSES:
+            self.cache = {key: entry for key, entry in self.cache.items() if entry[0] > now}
+            if len(self.cache) >= MAX_CACHED_RESPONSES:
+                self.cache.clear()
+        self.cache[key] = (now + self.cache_ttl, response)
+
+    async def fetch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a request to Infrahub, or reuse the response of an identical read-only request.
+
+        Parameters:
+            request (Dict[str, Any]): The request sent by a fork.
+
+        Returns:
+            Dict[str, Any]: The response to send back to the fork.
+        """
+        self.stats["requests"] += 1
+        if not self.is_read_only(request):
+            return await self._send(request)
+
+        key = self.get_key(request)
+        cached = self.cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.stats["cached"] += 1
+            return cached[1]
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        task = asyncio.ensure_future(self._send(request))
+        self.in_flight[key] = task
+        try:
+            response = await asyncio.shield(task)
+        finally:
+            self.in_flight.pop(key, None)
+        if self.cache_ttl and "error" not in response and response["status"] < 400:  # noqa: PLR2004
+            self._store(key, response)
+        return response
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.last_activity = time.monotonic()
+        try:
+            request = json.loads(await reader.readline())
+            if request.get("version") != BROKER_PROTOCOL_VERSION:
+                response = {"error": "version", "message": f"Unsupported protocol version {request.get('version')}"}
+            elif request.get("method") == "STATS":
+                response = dict(self.stats, cached_responses=len(self.cache))
+            else:
+                response = await self.fetch(request)
+        except Exception as exc:
+            response = {"error": "broker", "message": str(exc)}
+        self.last_activity = time.monotonic()
+        try:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        """
+        Listen on the unix socket until the broker has been idle for idle_timeout seconds.
+        """
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        try:
+            while True:
+                await asyncio.sleep(min(self.idle_timeout, 5))
+                if not self.in_flight and time.monotonic() - self.last_activity > self.idle_timeout:
+                    break
+        finally:
+            server.close()
+            await server.wait_closed()
+            for client in self.clients.values():
+                await client.aclose()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def _is_listening(socket_path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+    except OSError:
+        return False
+    return True
+
+
+def start_broker(socket_path: str, idle_timeout: int = DEFAULT_IDLE_TIMEOUT, cache_ttl: int = DEFAULT_CACHE_TTL):
+    """
+    Start a broker in a detached process, if none is running, and wait for it to accept connections.
+
+    Parameters:
+        socket_path (str): Path of the unix socket of the broker.
+        idle_timeout (int): Seconds without request after which the broker exits.
+        cache_ttl (int): Seconds during which the responses of the read-only requests are reused.
+
+    Raises:
+        OSError: If the broker doesn't accept connections in time.
+    """
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__), "--socket", socket_path]
+    command += ["--idle-timeout", str(idle_timeout), "--cache-ttl", str(cache_ttl)]
+    subprocess.Popen(  # noqa: S603
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        close_fds=True,
+    )
+    deadline = time.monotonic() + BROKER_START_TIMEOUT
+    while not _is_listening(socket_path):
+        if time.monotonic() > deadline:
+            raise OSError(f"The Infrahub broker didn't start on {socket_path}")
+        time.sleep(0.05)
+
+
+def send_to_broker(socket_path: str, request: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Send a request to the broker, starting it if it isn't running.
+
+    Parameters:
+        socket_path (str): Path of the unix socket of the broker.
+        request (Dict[str, Any]): The request (method, url, headers, payload, timeout and verify).
+        timeout (Optional[float]): Seconds to wait for the response.
+
+    Returns:
+        Dict[str, Any]: The response (status, headers and base64 encoded content), or the error.
+    """
+    payload = json.dumps(dict(request, version=BROKER_PROTOCOL_VERSION)).encode() + b"\n"
+    for attempt in range(2):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(socket_path)
+                sock.sendall(payload)
+                with sock.makefile("rb") as stream:
+                    return json.loads(stream.readline())
+        except (FileNotFoundError, ConnectionRefusedError):
+            if attempt:
+                raise
+            start_broker(socket_path=socket_path)
+    raise OSError(f"Unable to reach the Infrahub broker on {socket_path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local broker multiplexing the requests sent to Infrahub")
+    parser.add_argument("--socket", required=True, help="Path of the unix socket to listen on")
+    parser.add_argument("--idle-timeout", type=int, default=DEFAULT_IDLE_TIMEOUT, help="Exit after being idle")
+    parser.add_argument("--cache-ttl", type=int, default=DEFAULT_CACHE_TTL, help="TTL of the cached responses")
+    parser.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS)
+    args = parser.parse_args()
+    if not HAS_HTTPX:
+        sys.exit("httpx must be installed to run the Infrahub broker")
+
+    # A single broker per socket, the ones started concurrently by other forks exit right away.
+    # The lock is only waited for while a broker about to exit releases it.
+    with open(f"{args.socket}.lock", "a", encoding="utf-8") as lock_file:
+        deadline = time.monotonic() + BROKER_START_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if _is_listening(args.socket) or time.monotonic() > deadline:
+                    return
+                time.sleep(0.1)
+        broker = InfrahubBroker(
+            socket_path=args.socket,
+            idle_timeout=args.idle_timeout,
+            cache_ttl=args.cache_ttl,
+            max_connections=args.max_connections,
+        )
+        asyncio.run(broker.serve())
+
+
+if __name__ == "__main__":
+    main()
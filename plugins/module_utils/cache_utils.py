@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import base64
+import json
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+try:
+    import orjson
+except ImportError:
+    HAS_ORJSON = False
+else:
+    HAS_ORJSON = True
+
+try:
+    import msgpack
+except ImportError:
+    HAS_MSGPACK = False
+else:
+    HAS_MSGPACK = True
+
+try:
+    import zstandard
+except ImportError:
+    HAS_ZSTANDARD = False
+else:
+    HAS_ZSTANDARD = True
+
+CACHE_HEADER = "infrahub-cache"
+CACHE_HEADER_VERSION = 1
+
+# Ordered by preference, the first available one is used to encode
+SERIALIZERS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {}
+if HAS_ORJSON:
+    SERIALIZERS["orjson"] = (orjson.dumps, orjson.loads)
+if HAS_MSGPACK:
+    SERIALIZERS["msgpack"] = (msgpack.packb, lambda payload: msgpack.unpackb(payload, raw=False))
+SERIALIZERS["json"] = (lambda data: json.dumps(data, separators=(",", ":")).encode(), json.loads)
+
+COMPRESSORS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {}
+if HAS_ZSTANDARD:
+    COMPRESSORS["zstd"] = (
+        lambda payload: zstandard.ZstdCompressor().compress(payload),
+        lambda payload: zstandard.ZstdDecompressor().decompress(payload),
+    )
+COMPRESSORS["zlib"] = (zlib.compress, zlib.decompress)
+
+
+def encode_cache_payload(data: Any, compact: bool = False) -> str:
+    """
+    Encode data to be stored in an Ansible cache plugin.
+
+    Parameters:
+        data (Any): The data to encode.
+        compact (bool): Serialize the data with orjson or msgpack if installed, and compress it with zstandard
+            if installed or zlib otherwise. The encoded payload starts with a versioned header naming the codecs.
+            Plain JSON is used otherwise.
+
+    Returns:
+        str: The encoded data, a string being storable by every cache plugin.
+    """
+    if not compact:
+        return json.dumps(data)
+
+    serializer = next(iter(SERIALIZERS))
+    compressor = next(iter(COMPRESSORS))
+    payload = COMPRESSORS[compressor][0](SERIALIZERS[serializer][0](data))
+    header = f"{CACHE_HEADER}/{CACHE_HEADER_VERSION}/{serializer}/{compressor}:"
+    return header + base64.b64encode(payload).decode("ascii")
+
+
+def decode_cache_payload(encoded: str) -> Any:
+    """
+    Decode data encoded by encode_cache_payload, whether compact or plain JSON.
+
+    Parameters:
+        encoded (str): The encoded data.
+
+    Returns:
+        Any: The decoded data.
+
+    Raises:
+        ValueError: If the payload is corrupted, or has been encoded with another version or with codecs which
+            aren't installed.
+    """
+    if not encoded.startswith(f"{CACHE_HEADER}/"):
+        return json.loads(encoded)
+
+    try:
+        header, payload = encoded.split(":", 1)
+        _, version, serializer, compressor = header.split("/")
+        version = int(version)
+    except ValueError as exc:
+        raise ValueError(f"Invalid cache header: {exc}") from exc
+    if version != CACHE_HEADER_VERSION:
+        raise ValueError(f"Unsupported cache format version {version}")
+    if serializer not in SERIALIZERS or compressor not in COMPRESSORS:
+        raise ValueError(f"Unable to decode the cache, the {serializer} and {compressor} codecs are not available")
+    try:
+        return SERIALIZERS[serializer][1](COMPRESSORS[compressor][1](base64.b64decode(payload)))
+    except Exception as exc:
+        # Each codec raises its own errors, e.g. zlib.error or zstandard.ZstdError
+        raise ValueError(f"Unable to decode the cache, the payload is corrupted: {exc}") from exc
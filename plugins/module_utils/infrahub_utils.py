@@ -2,23 +2,65 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+import asyncio
+import atexit
+import base64
+import copy
+import fnmatch
+import hashlib
+import json
+import os
+import tempfile
+import threading
 import traceback
-from typing import Any, Dict, List, Optional, Union
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+from urllib.parse import urlencode
 
+from ansible_collections.opsmill.infrahub.plugins.module_utils.broker import send_to_broker
 from ansible_collections.opsmill.infrahub.plugins.module_utils.exception import (
     handle_infrahub_exceptions,
 )
+from ansible_collections.opsmill.infrahub.plugins.module_utils.metrics import InfrahubMetrics
+from ansible_collections.opsmill.infrahub.plugins.module_utils.result_cache import InfrahubResultCache
 
 try:
-    from infrahub_sdk import Config, InfrahubClientSync
+    from jinja2 import Environment, TemplateSyntaxError, meta
+
+    HAS_JINJA2 = True
+except ImportError:
+    HAS_JINJA2 = False
+
+try:
+    import httpx
+    from graphql import (
+        DocumentNode,
+        FieldNode,
+        FragmentDefinitionNode,
+        GraphQLError,
+        NameNode,
+        OperationDefinitionNode,
+        OperationType,
+        SelectionSetNode,
+        VariableNode,
+        Visitor,
+        parse,
+        print_ast,
+        visit,
+    )
+    from infrahub_sdk import Config, InfrahubClient, InfrahubClientSync
     from infrahub_sdk.branch import BranchData, InfrahubBranchManagerSync
+    from infrahub_sdk.exceptions import NodeNotFoundError, ServerNotReachableError, ServerNotResponsiveError
     from infrahub_sdk.graphql import Query
-    from infrahub_sdk.node import InfrahubNodeSync
+    from infrahub_sdk.node import InfrahubNodeSync, RelatedNodeSync
     from infrahub_sdk.schema import (
+        GenericSchema,
         NodeSchema,
         RelationshipCardinality,
         RelationshipKind,
     )
+    from infrahub_sdk.store import NodeStoreSync
 
     HAS_INFRAHUBCLIENT = True
     INFRAHUBCLIENT_IMP_ERR = None
@@ -28,11 +70,69 @@ except ImportError:
 else:
     HAS_INFRAHUBCLIENT = True
 
+# Host variable set by the inventory for the relationships loaded on demand by the vars plugin
+LAZY_RELATIONSHIPS_VARIABLE = "infrahub_lazy_relationships"
+# Tokens of the inventories of the current process by key, see register_lazy_token
+LAZY_TOKENS: Dict[str, str] = {}
+
+
+def register_lazy_token(token: Optional[str]) -> str:
+    """
+    Register the token of an inventory for the vars plugin running in the same process. The host variables hold
+    the key of the token, never the token itself.
+
+    Parameters:
+        token (Optional[str]): Infrahub API token.
+
+    Returns:
+        str: The key of the token.
+    """
+    key = hashlib.sha256((token or "").encode()).hexdigest()[:32]
+    LAZY_TOKENS[key] = token or ""
+    return key
+
+
+def get_arg_or_env(args: Dict[str, Any], name: str, env: str) -> Any:
+    """
+    Return an argument of a plugin, or the environment variable if the argument isn't set. An argument set to a
+    false value, e.g. use_async: false or result_cache_ttl: 0, isn't overridden by the environment.
+
+    Parameters:
+        args (Dict[str, Any]): The arguments of the plugin.
+        name (str): The name of the argument.
+        env (str): The name of the environment variable.
+
+    Returns:
+        Any: The value of the argument, or of the environment variable, None if neither is set.
+    """
+    value = args.get(name)
+    return os.getenv(env) if value is None else value
+
+
 if HAS_INFRAHUBCLIENT:
     TYPE_MAPPING = {"str": str, "int": int, "float": float, "bool": bool}
-
-    class InfrahubclientWrapper:
-        def __init__(self, api_endpoint: str, branch: str, token: str, timeout: Optional[int] = 10):
+    # Number of pages of peers kept in the store while streaming the hosts
+    MAX_STORED_PAGES = 10
+    # Prefix of the tracker of the queries of each type of page, see _build_page_query
+    PAGE_TRACKERS = {"nodes": "query", "lean": "lean", "digests": "digest"}
+    # Clients shared by the plugins running in the same process, see get_shared_client
+    SHARED_CLIENTS: Dict[Tuple[Any, ...], "InfrahubclientWrapper"] = {}
+    SHARED_CLIENTS_LOCK = threading.Lock()
+
+    class InfrahubclientWrapper:  # noqa: PLR0904
+        def __init__(
+            self,
+            api_endpoint: str,
+            branch: str,
+            token: str,
+            timeout: Optional[int] = 10,
+            *,
+            max_concurrency: int = 1,
+            schema_cache_dir: Optional[str] = None,
+            lean: bool = False,
+            metrics: Optional[InfrahubMetrics] = None,
+            broker_socket: Optional[str] = None,
+        ):
             """
             Initializes InfrahubclientWrapper.
 
@@ -41,12 +141,171 @@ if HAS_INFRAHUBCLIENT:
                 branch (str): Branch in which the request is made.
                 token (str): Toto API token.
                 timeout (int): Timeout for Toto requests in seconds.
+                max_concurrency (int): Maximum number of requests sent at the same time when fetching nodes.
+                schema_cache_dir (Optional[str]): Directory where the schema is persisted between runs. Disabled if None.
+                lean (bool): Fetch the nodes page by page, or by ids, as plain dicts holding the values only,
+                    see _build_lean_query.
+                metrics (Optional[InfrahubMetrics]): Record the requests sent and the bytes received in these metrics.
+                broker_socket (Optional[str]): Send the requests through the local broker listening on this unix
+                    socket, started if needed, see broker.py. The requests are sent directly if it can't be reached.
             """
-            self.client = InfrahubClientSync(
-                address=api_endpoint,
-                config=Config(api_token=token, timeout=timeout, default_branch=branch),
+            self.max_concurrency = max_concurrency
+            self.lean = lean
+            self.metrics = metrics or InfrahubMetrics(enabled=False)
+            self.stored_nodes = 0
+            self.schema_cache_dir = os.path.expanduser(schema_cache_dir) if schema_cache_dir else None
+            # The SDK opens a new connection, with a new SSL context, for every request: its requests are sent
+            # through the connection pool of the wrapper instead
+            config = Config(
+                api_token=token,
+                timeout=timeout,
+                default_branch=branch,
+                insert_tracker=self.metrics.enabled,
+                sync_requester=self._send_request,
             )
+            self.client = InfrahubClientSync(address=api_endpoint, config=config)
             self.branch_manager = InfrahubBranchManagerSync(self.client)
+            self.verify = config.tls_ca_file if config.tls_ca_file else not config.tls_insecure
+            # Loading the CA certificates is slow, the context is shared by the connection pools
+            self.ssl_context = httpx.create_ssl_context(verify=self.verify)
+            self.http_client = httpx.Client(verify=self.ssl_context, **self._proxy_options(httpx.HTTPTransport))
+            # The broker doesn't go through the proxies
+            proxied = config.proxy or config.proxy_mounts
+            self.broker_socket = os.path.expanduser(broker_socket) if broker_socket and not proxied else None
+
+        def _proxy_options(self, transport_class: type) -> Dict[str, Any]:
+            """
+            Build the proxy options of an httpx client, the same as the SDK.
+
+            Parameters:
+                transport_class (type): httpx.HTTPTransport, or httpx.AsyncHTTPTransport for an async client.
+
+            Returns:
+                Dict[str, Any]: The proxy or the mounts of the client, if any.
+            """
+            config = self.client.config
+            if config.proxy:
+                return {"proxy": config.proxy}
+            if config.proxy_mounts:
+                return {
+                    "mounts": {
+                        key: transport_class(proxy=value, verify=self.ssl_context)
+                        for key, value in config.proxy_mounts.dict(by_alias=True).items()
+                    }
+                }
+            return {}
+
+        def _send_request(
+            self,
+            url: str,
+            method: Any,
+            headers: Dict[str, Any],
+            timeout: int,
+            payload: Optional[Dict] = None,
+        ) -> httpx.Response:
+            """
+            Send a request of the SDK client, the sync_requester of its config: through the local broker if enabled,
+            through the connection pool of the wrapper otherwise.
+            """
+            if self.broker_socket:
+                response = self._send_request_to_broker(
+                    url=url, method=method, headers=headers, timeout=timeout, payload=payload
+                )
+            else:
+                response = self._send_pooled_request(
+                    url=url, method=method, headers=headers, timeout=timeout, payload=payload
+                )
+            self._record_request(headers=headers, response=response)
+            return response
+
+        def _send_pooled_request(
+            self,
+            url: str,
+            method: Any,
+            headers: Dict[str, Any],
+            timeout: int,
+            payload: Optional[Dict] = None,
+        ) -> httpx.Response:
+            """
+            Send a request through the connection pool of the wrapper.
+            Same as the default request method of the SDK, which opens a new connection for every request.
+            """
+            params: Dict[str, Any] = {"json": payload} if payload else {}
+            try:
+                return self.http_client.request(
+                    method=method.value, url=url, headers=headers, timeout=timeout, **params
+                )
+            except httpx.NetworkError as exc:
+                raise ServerNotReachableError(address=self.client.address) from exc
+            except httpx.ReadTimeout as exc:
+                raise ServerNotResponsiveError(url=url, timeout=timeout) from exc
+
+        def _record_request(self, headers: Dict[str, Any], response: httpx.Response) -> None:
+            """
+            Record a request sent by the SDK client, along with the size of its response, in the metrics.
+            The tracker of the GraphQL queries tells the node kind they are about.
+            """
+            if self.metrics.enabled:
+                tracker = (headers or {}).get("X-Infrahub-Tracker")
+                self.metrics.record_request(size=len(response.content), tracker=tracker)
+
+        def _send_request_to_broker(
+            self,
+            url: str,
+            method: Any,
+            headers: Dict[str, Any],
+            timeout: int,
+            payload: Optional[Dict] = None,
+        ) -> httpx.Response:
+            """
+            Send a request of the SDK client through the local broker, shared with the other forks.
+            The request is sent directly if the broker can't be reached.
+            """
+            if not self.broker_socket:
+                return self._send_pooled_request(
+                    url=url, method=method, headers=headers, timeout=timeout, payload=payload
+                )
+            request = {
+                "method": method.value,
+                "url": url,
+                "headers": headers,
+                "payload": payload,
+                "timeout": timeout,
+                "verify": self.verify,
+            }
+            try:
+                # The broker waits for Infrahub up to the timeout of the request
+                response = send_to_broker(socket_path=self.broker_socket, request=request, timeout=timeout * 2)
+            except (OSError, ValueError):
+                self.broker_socket = None
+                return self._send_pooled_request(
+                    url=url, method=method, headers=headers, timeout=timeout, payload=payload
+                )
+
+            if response.get("error") == "unreachable":
+                raise ServerNotReachableError(address=self.client.address)
+            if response.get("error") == "timeout":
+                raise ServerNotResponsiveError(url=url, timeout=timeout)
+            if response.get("error"):
+                raise Exception(f"Infrahub broker error: {response.get('message')}")
+            return httpx.Response(
+                status_code=response["status"],
+                headers=response["headers"],
+                content=base64.b64decode(response["content"]),
+                request=httpx.Request(method=method.value, url=url),
+            )
+
+        def close(self) -> None:
+            """
+            Close the connections to Infrahub of the wrapper.
+            """
+            self.http_client.close()
+
+        def __enter__(self) -> "InfrahubclientWrapper":
+            return self
+
+        def __exit__(self, *exc: object) -> None:
+            self.close()
 
         @handle_infrahub_exceptions
         def fetch_single_artifact(
@@ -143,6 +402,7 @@ if HAS_INFRAHUBCLIENT:
             if not filters:
                 raise Exception("At least one filter must be provided")
 
+            self.load_schema(branch=branch)
             node = self.client.get(
                 kind=kind,
                 include=include,
@@ -151,6 +411,8 @@ if HAS_INFRAHUBCLIENT:
                 branch=branch,
                 **filters,
             )
+            # Counted to be released along with the other nodes of the store, see release_store
+            self.stored_nodes += 1
             return node
 
         @handle_infrahub_exceptions
@@ -177,6 +439,7 @@ if HAS_INFRAHUBCLIENT:
             """
             nodes = List[InfrahubNodeSync]
 
+            self.load_schema(branch=branch)
             if not filters:
                 nodes = self.client.all(kind=kind, populate_store=True, include=include, exclude=exclude, branch=branch)
             else:
@@ -188,298 +451,2245 @@ if HAS_INFRAHUBCLIENT:
                     branch=branch,
                     **filters,
                 )
+            self.stored_nodes += len(nodes)
             return nodes
 
-        @handle_infrahub_exceptions
-        def fetch_single_schema(self, kind: str, branch: Optional[str] = None) -> NodeSchema:
+        def build_nodes_query(
+            self,
+            kind: str,
+            *,
+            include: Optional[List[str]] = None,
+            exclude: Optional[List[str]] = None,
+            filters: Optional[Dict[str, Any]] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
+            branch: Optional[str] = None,
+        ) -> Dict[str, Any]:
             """
-            Retrieves schema attributes for the given kind.
+            Build the query data (in Dict format) to retrieve one page of nodes of a given kind
 
             Parameters:
-                kind (str): The kind for which the schema attributes are needed.
+                kind (str): kind of the nodes to query
+                include (Optional[List[str]]): list of attributes/relationship to retrieve
+                exclude (Optional[List[str]]): list of attributes/relationship to ignore
+                filters (Optional[Dict[str, Any]]): Dict of filters to apply on the query
+                offset (Optional[int]): Offset of the page
+                limit (Optional[int]): Size of the page
                 branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
 
             Returns:
-                NodeSchema: The schema attributes for the given kind.
+                Dict[str, Any]: Query data for the kind, the root key being the kind
             """
-            return self.client.schema.get(kind=kind, branch=branch)
+            self.load_schema(branch=branch)
+            schema = self.client.schema.get(kind=kind, branch=branch)
+            node = InfrahubNodeSync(client=self.client, schema=schema, branch=branch)
+            # generate_query_data adds the pagination to the filters, work on a copy
+            filters = dict(filters or {})
+            if filters:
+                node.validate_filters(filters=filters)
+
+            return node.generate_query_data(
+                filters=filters,
+                offset=offset,
+                limit=limit,
+                include=include,
+                exclude=exclude,
+            )
 
-        @handle_infrahub_exceptions
-        def fetch_schemas(self, branch: Optional[str] = None) -> Dict[str, NodeSchema]:
+        def _run_concurrently(self, func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
             """
-            Retrieves schema attributes for the given kind.
+            Call func for each item, with at most max_concurrency calls running at the same time
 
             Parameters:
-                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+                func (Callable[[Any], Any]): Function to call with each item
+                items (List[Any]): List of items
 
             Returns:
-                Dict[str, NodeSchema]:: A Dict of node kind, Schema.
+                List[Any]: Results of the calls, in the same order as the items
             """
-            branch = branch or self.default_branch
-            return self.client.schema.get(branch=branch)
+            if self.max_concurrency <= 1 or len(items) <= 1:
+                return [func(item) for item in items]
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as executor:
+                return list(executor.map(func, items))
 
-        @handle_infrahub_exceptions
-        def fetch_branchs(self) -> Dict[str, BranchData]:
+        def _store_nodes(self, nodes: List[InfrahubNodeSync]) -> None:
+            for node in nodes:
+                if node.id:
+                    self.client.store.set(key=node.id, node=node)
+                    self.stored_nodes += 1
+
+        def release_store(self, max_size: int) -> bool:
             """
-            Retrieves all available branches.
+            Empty the store once it holds more than max_size nodes, to bound the memory used by the peers.
+
+            Parameters:
+                max_size (int): Maximum number of nodes kept in the store.
 
             Returns:
-                Dict[str, BranchData]: A dictionary containing all branches.
+                bool: True if the store has been emptied.
             """
-            return self.branch_manager.all()
-
-        @handle_infrahub_exceptions
-        def fetch_branch(self, branch_name: str) -> BranchData:
+            if self.stored_nodes <= max_size:
+                return False
+            self.client.store = NodeStoreSync()
+            self.stored_nodes = 0
+            return True
+
+        def _build_page_query(
+            self, page_type: str, kinds: Dict[str, Dict[str, Any]], offset: int, branch: str
+        ) -> Tuple[str, str]:
             """
-            Retrieves details of a specific branch.
+            Build the GraphQL query retrieving one page of nodes for one or several kinds, and its tracker
 
             Parameters:
-                branch_name (str): The name of the branch to be fetched.
+                page_type (str): "nodes" for the nodes (see build_nodes_query), "lean" for their values only
+                    (see _build_lean_query) or "digests" for their digests (see _build_digest_query)
+                kinds (Dict[str, Dict[str, Any]]): Dict of node kind, options (include, exclude, attrs, filters)
+                offset (int): Offset of the page
+                branch (str): Name of the branch to query from.
 
             Returns:
-                BranchData: Details of the specified branch.
+                Tuple[str, str]: The query and its tracker
             """
-            return self.branch_manager.get(branch_name=branch_name)
+            query_data = {}
+            for kind, kind_options in kinds.items():
+                options = kind_options or {}
+                query_options = {
+                    "kind": kind,
+                    "filters": options.get("filters") or None,
+                    "offset": offset,
+                    "limit": self.client.pagination_size,
+                    "branch": branch,
+                }
+                if page_type == "nodes":
+                    query_options.update(include=options.get("include") or None, exclude=options.get("exclude") or None)
+                    query_data.update(self.build_nodes_query(**query_options))
+                elif page_type == "lean":
+                    query_data.update(self._build_lean_query(attrs=options.get("attrs") or [], **query_options))
+                else:
+                    query_data.update(self._build_digest_query(attrs=options.get("attrs") or [], **query_options))
 
-        def _render_query(self, query: Dict, variables: Optional[Dict] = None) -> str:
+            tracker_kind = str(next(iter(kinds))).lower() if len(kinds) == 1 else "batch"
+            return Query(query=query_data).render(), f"{PAGE_TRACKERS[page_type]}-{tracker_kind}-offset{offset}"
+
+        def _parse_page(
+            self, page_type: str, kinds: Dict[str, Dict[str, Any]], response: Dict[str, Any], branch: str
+        ) -> Dict[str, Tuple[List[Any], int]]:
             """
-            Render a Grapql Query from a Dict to a String
+            Build the nodes of one page from the response to the query built by _build_page_query
 
             Parameters:
-                query (Dict): GraphQL Query to render, can be a query or a mutation
-                variables (Optional[Dict]): Variables to pass along with the GraphQL query. Defaults to None.
+                page_type (str): "nodes", "lean" or "digests", see _build_page_query
+                kinds (Dict[str, Dict[str, Any]]): Dict of node kind, options
+                response (Dict[str, Any]): Data returned by the query
+                branch (str): Name of the branch queried.
 
             Returns:
-                Str: Graphql Query rendered as a string
+                Dict[str, Tuple[List[Any], int]]: Dict of node kind, (Nodes of the page, Total count). The nodes are
+                    InfrahubNodeSync, plain dicts in lean mode (see _lean_node) or digests (see _digest_node).
             """
-            if variables:
-                variables_type = {}
-                for key, value in variables.items():
-                    variables_type[key] = type(value)
-                query_str = Query(query=query, variables=variables_type).render()
-            else:
-                query_str = Query(query=query).render()
-            return query_str
+            page = {}
+            for kind in kinds:
+                edges = response[kind].get("edges", [])
+                if page_type == "nodes":
+                    nodes = [
+                        InfrahubNodeSync.from_graphql(client=self.client, branch=branch, data=item) for item in edges
+                    ]
+                elif page_type == "lean":
+                    nodes = [self._lean_node(data=item["node"], kind=kind) for item in edges]
+                else:
+                    nodes = [dict(self._digest_node(data=item["node"]), id=item["node"]["id"]) for item in edges]
+                page[kind] = (nodes, response[kind].get("count", 0))
+            return page
 
-        @handle_infrahub_exceptions
-        def execute_graphql(
-            self, query: str, variables: Optional[Dict[str, Any]] = None, branch: Optional[str] = None
-        ) -> Dict:
+        def _fetch_page(
+            self, page_type: str, kinds: Dict[str, Dict[str, Any]], offset: int, branch: str
+        ) -> Dict[str, Tuple[List[Any], int]]:
             """
-            Executes a GraphQL query against the Infrahub Endpoint.
+            Retrieve one page of nodes for one or several kinds, with a single GraphQL query
 
             Parameters:
-                query (str): The GraphQL query string to execute.
-                variables (Optional[Dict]): Variables to pass along with the GraphQL query. Defaults to None.
-                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+                page_type (str): "nodes", "lean" or "digests", see _build_page_query
+                kinds (Dict[str, Dict[str, Any]]): Dict of node kind, options (include, exclude, attrs, filters)
+                offset (int): Offset of the page
+                branch (str): Name of the branch to query from.
 
             Returns:
-                Dict: The result of the executed GraphQL query.
+                Dict[str, Tuple[List[Any], int]]: Dict of node kind, (Nodes of the page, Total count)
             """
-            # TODO :  Do something wit the variables ?
-            response = self.client.execute_graphql(query=query, variables=variables, branch_name=branch)
-            return response
+            query, tracker = self._build_page_query(page_type=page_type, kinds=kinds, offset=offset, branch=branch)
+            response = self.client.execute_graphql(query=query, branch_name=branch, tracker=tracker)
+            return self._parse_page(page_type=page_type, kinds=kinds, response=response, branch=branch)
 
-    class InfrahubBaseProcessor:
-        def __init__(self, client: InfrahubclientWrapper):
-            self.client = client
-
-        def resolve_node_mapping(
-            self, node: InfrahubNodeSync, attrs: List[str], schemas: Dict[str, NodeSchema]
-        ) -> Optional[Dict[str, Any]]:
+        def _fetch_pages(
+            self, page_type: str, pages: List[Tuple[Dict[str, Dict[str, Any]], int]], branch: str
+        ) -> List[Dict[str, Tuple[List[Any], int]]]:
             """
-            Resolve the attributes and relationships of a given node based on a list of desired attributes.
+            Retrieve several pages, up to max_concurrency pages at the same time
 
             Parameters:
-                node (InfrahubNodeSync): The node to which attributes/relationships are to be mapped.
-                attrs (List[str]): A list of attribute names that should be fetched for the node.
-                schemas Dict[str, NodeSchema]: A dictionary of Node Kind name, NodeSchema
+                page_type (str): "nodes", "lean" or "digests", see _build_page_query
+                pages (List[Tuple[Dict[str, Dict[str, Any]], int]]): List of kinds (see _fetch_page), offset
+                branch (str): Name of the branch to query from.
 
             Returns:
-                Dict[str, Any]: A dictionary mapping attribute/relationship names to their respective values.
-                        For relationship with "many" cardinality, it will be a List (of related nodes)
+                List[Dict[str, Tuple[List[Any], int]]]: The pages, in the same order
             """
-            attribute_dict = {}
-            for attr in attrs:
-                node_attr = getattr(node, attr)
+            # The queries are built from the schema, loaded once before the threads rather than by each of them
+            self.load_schema(branch=branch)
+            return self._run_concurrently(
+                lambda kinds_offset: self._fetch_page(
+                    page_type=page_type, kinds=kinds_offset[0], offset=kinds_offset[1], branch=branch
+                ),
+                pages,
+            )
 
-                if attr in node._schema.attribute_names:
-                    if node_attr.value:
-                        attribute_dict[node_attr._schema.name] = str(node_attr.value)
-                    else:
-                        attribute_dict[node_attr._schema.name] = node_attr.value
+        def _fetch_all_pages(
+            self,
+            requests: List[Tuple[str, Dict[str, Any]]],
+            branch: str,
+            page_type: str = "nodes",
+        ) -> List[List[Any]]:
+            """
+            Retrieve all the pages of several requests (node kind, options), the requests and their pages being fetched
+            concurrently (up to max_concurrency requests at the same time)
 
-                if attr in node._schema.relationship_names:
-                    # Workaround if peer are generics, we load the nodes inherited from it via fetch
-                    if node_attr.schema.peer not in schemas:
-                        node_attr.fetch()
-                    elif node_attr.schema.peer in schemas:
-                        if not schemas[node_attr.schema.peer]:
-                            node_attr.fetch()
-                    # Should we allow "recursive" depending of node_attr.schema.kind (generics or component)
-                    if node_attr.schema.cardinality == "many":
-                        peers: List[InfrahubNodeSync] = []
-                        for peer in node_attr:
-                            if hasattr(peer.peer._schema, "attribute_names"):
-                                peer_attribute = peer.peer._schema.attribute_names
-                                peers.append(
-                                    self.resolve_node_mapping(node=peer.peer, attrs=peer_attribute, schemas=schemas)
-                                )
-                        attribute_dict[node_attr.schema.name] = peers
-                    elif node_attr.schema.cardinality == "one":
-                        peer = node_attr.peer
-                        peer_attribute = peer._schema.attribute_names
-                        attribute_dict[node_attr.schema.name] = self.resolve_node_mapping(
-                            node=peer, attrs=peer_attribute, schemas=schemas
-                        )
+            Parameters:
+                requests (List[Tuple[str, Dict[str, Any]]]): List of node kind, options (include, exclude, filters)
+                branch (str): Name of the branch to query from.
+                page_type (str): "nodes", "lean" or "digests", see _build_page_query. The nodes are added to the
+                    store for "nodes" only.
 
-            return attribute_dict
+            Returns:
+                List[List[Any]]: List of Nodes for each request, in the same order as the requests
+            """
+            page_size = self.client.pagination_size
+            nodes: List[List[Any]] = [[] for _ in requests]
 
-    class InfrahubNodesProcessor(InfrahubBaseProcessor):
-        @staticmethod
-        def get_attributes_for_schema(schema: NodeSchema, exclude: Optional[List[str]] = None) -> List[str]:
+            # The first page of each request gives the total count, the remaining pages are then fetched all together
+            first_pages = self._fetch_pages(
+                page_type=page_type, pages=[(dict([request]), 0) for request in requests], branch=branch
+            )
+            remaining_pages = []
+            for idx, page in enumerate(first_pages):
+                for nodes_from_page, count in page.values():
+                    nodes[idx].extend(nodes_from_page)
+                    remaining_pages.extend((idx, offset) for offset in range(page_size, count, page_size))
+
+            pages = self._fetch_pages(
+                page_type=page_type,
+                pages=[(dict([requests[idx]]), offset) for idx, offset in remaining_pages],
+                branch=branch,
+            )
+            for (idx, _), page in zip(remaining_pages, pages):
+                for nodes_from_page, _ in page.values():
+                    nodes[idx].extend(nodes_from_page)
+
+            if page_type == "nodes":
+                for nodes_from_request in nodes:
+                    self._store_nodes(nodes_from_request)
+            return nodes
+
+        @handle_infrahub_exceptions
+        def fetch_nodes_by_kinds(
+            self,
+            kinds: Dict[str, Dict[str, Any]],
+            branch: Optional[str] = None,
+        ) -> Dict[str, List[InfrahubNodeSync]]:
             """
-            Build the attributes for the given kind.
+            Retrieve all the nodes of several kinds, the kinds and their pages being fetched concurrently
+            (up to max_concurrency requests at the same time)
 
             Parameters:
-                schema (NodeSchema): The schema from which attributes/relationship are used
-                exclude Optional[List[str]]: list of attributes/relationship to ignore
+                kinds (Dict[str, Dict[str, Any]]): Dict of node kind, options (include, exclude, filters)
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
 
             Returns:
-                List[str]: The schema attributes for the given kind.
+                Dict[str, List[InfrahubNodeSync]]: Dict of node kind, List of Nodes
             """
-            exclude = exclude or []
-            attributes_by_kind = []
-            # From https://docs.infrahub.app/python-sdk/10_query/#control-what-will-be-queried
-            #  "By default the query will include, the attributes, the relationships of cardinality one and the relationships of kind Attribute"
-            for attr_name in schema.attribute_names:
-                if exclude and attr_name in exclude:
-                    continue
-                attributes_by_kind.append(attr_name)
-            for rel_name in schema.relationship_names:
-                if exclude and rel_name in exclude:
-                    continue
-                rel_schema = schema.get_relationship(name=rel_name)
-                if (
-                    rel_schema.cardinality == RelationshipCardinality.MANY  # type: ignore[union-attr]
-                    and rel_schema.kind not in [RelationshipKind.ATTRIBUTE, RelationshipKind.PARENT]  # type: ignore[union-attr]
-                ):
-                    continue
-                if rel_schema and rel_schema.cardinality == "one":
-                    attributes_by_kind.append(rel_name)
-                elif rel_schema and rel_schema.cardinality == "many":
-                    attributes_by_kind.append(rel_name)
-            return attributes_by_kind
+            branch = branch or self.client.default_branch
+            requests = list(kinds.items())
+            return dict(zip(kinds, self._fetch_all_pages(requests=requests, branch=branch)))
 
-        @staticmethod
-        def get_related_nodes(schema: NodeSchema, attrs: List[str]) -> List[str]:
+        @handle_infrahub_exceptions
+        def fetch_nodes_by_ids(
+            self,
+            ids_by_kind: Dict[str, List[str]],
+            branch: Optional[str] = None,
+            options: Optional[Dict[str, Dict[str, Any]]] = None,
+        ) -> Dict[str, List[InfrahubNodeSync]]:
             """
-            Build a list of Node Kind base on the relationships of a given schema
+            Retrieve nodes from their ids, with one query per kind and per chunk of ids
 
             Parameters:
-                schema (NodeSchema): The schema from which relationship are loaded
-                attrs List[str]: list of attributes to compare to the schema
+                ids_by_kind (Dict[str, List[str]]): Dict of node kind, List of node ids
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+                options (Optional[Dict[str, Dict[str, Any]]]): Dict of node kind, options (include, exclude,
+                    attrs in lean mode)
 
             Returns:
-                List[str]: The node kind of the related nodes
+                Dict[str, List[InfrahubNodeSync]]: Dict of node kind, List of Nodes. In lean mode, the nodes are
+                    plain dicts and aren't added to the store.
             """
-            relationship_schemas = [schema.peer for schema in schema.relationships if schema.name in attrs]
-            return list(set(relationship_schemas))
+            branch = branch or self.client.default_branch
+            options = options or {}
+            chunk_size = self.client.pagination_size
+            requests = [
+                (
+                    kind,
+                    {
+                        "include": (options.get(kind) or {}).get("include"),
+                        "exclude": (options.get(kind) or {}).get("exclude"),
+                        "attrs": (options.get(kind) or {}).get("attrs"),
+                        "filters": {"ids": ids[idx : idx + chunk_size]},
+                    },
+                )
+                for kind, ids in ids_by_kind.items()
+                for idx in range(0, len(ids), chunk_size)
+            ]
+
+            page_type = "lean" if self.lean else "nodes"
+            nodes: Dict[str, List[InfrahubNodeSync]] = {kind: [] for kind in ids_by_kind}
+            results = self._fetch_all_pages(requests=requests, branch=branch, page_type=page_type)
+            for (kind, _), nodes_from_request in zip(requests, results):
+                nodes[kind].extend(nodes_from_request)
+            return nodes
 
-        @staticmethod
-        def build_include_from_constructed(compose: Dict, groups: List[Dict]) -> List[str]:
+        def is_in_store(self, node_id: str, kind: Optional[str] = None) -> bool:
             """
-            Build a List of str, based on the compose and keyed_groups options.
+            Check if a node has already been loaded in the store
 
             Parameters:
-                compose (Dict): A dictionary containing the compose options details.
-                groups (List[Dict]): A list of dictionaries, each representing a group with specific attributes.
+                node_id (str): id of the node
+                kind (Optional[str]): kind of the node
 
             Returns:
-                List[str]: A list of strings constructed based on the input parameters.
-
+                bool: True if the node is in the store
             """
-            include = []
-            if compose:
-                include_compose = [value.split(".")[0] for value in compose.values()]
-                include += include_compose
-            if groups:
-                include_groups = [group["key"].split(".")[0] for group in groups if "key" in group]
-                include += include_groups
-            return include
+            return self.client.store.get(key=node_id, kind=kind, raise_when_missing=False) is not None
 
-        def fetch_and_process(self, nodes: List[str]) -> Optional[Dict[str, Any]]:
+        def get_peer(self, related_node: RelatedNodeSync) -> Optional[InfrahubNodeSync]:
             """
-            Fetches schemas and nodes for the given node kinds using the Infrahub client wrapper,
-            then processes and maps these nodes to their corresponding attributes.
+            Retrieve the peer of a relationship from the store
 
             Parameters:
-                nodes (List[str]): A list of node kinds to fetch and process.
+                related_node (RelatedNodeSync): The relationship
 
             Returns:
-                Optional[Dict[str, Any]]: A dictionary with processed host node attributes, or None if no nodes were processed.
+                Optional[InfrahubNodeSync]: The peer, or None if the relationship is not set or the peer is not in the store
             """
-            all_nodes: List[InfrahubNodeSync] = []
-            schema_dict = {}
-            node_attributes_dict = {}
-
-            if not nodes:
+            if not related_node.id:
                 return None
-            for node_kind in nodes:
-                schema_dict[node_kind] = self.client.fetch_single_schema(kind=node_kind)
-                node_options = nodes.get(node_kind, {})
-                if node_options:
-                    include = node_options.get("include", None)
-                    exclude = node_options.get("exclude", None)
-                    filters = node_options.get("filters", None)
-                else:
-                    include = None
-                    exclude = None
-                    filters = None
-
-                nodes_from_kind = self.client.fetch_nodes(
-                    kind=node_kind,
-                    include=include,
-                    exclude=exclude,
-                    filters=filters,
-                )
-
-                if not nodes_from_kind:
-                    continue
-                node_attributes_dict[node_kind] = (
-                    include if include else self.get_attributes_for_schema(schema_dict[node_kind], exclude)
-                )
-                all_nodes.extend(nodes_from_kind)
-
-            if not all_nodes:
+            try:
+                return related_node.peer
+            except (NodeNotFoundError, ValueError):
                 return None
 
-            host_node_attributes = {}
-            for node_kind, node_attributes in node_attributes_dict.items():
-                related_kinds = self.get_related_nodes(schema=schema_dict[node_kind], attrs=node_attributes)
-                for related_kind in related_kinds:
-                    schema_dict[related_kind] = self.client.fetch_single_schema(kind=related_kind)
-                    self.client.fetch_nodes(kind=related_kind)
+        def iter_nodes_pages(
+            self,
+            kinds: Dict[str, Dict[str, Any]],
+            branch: Optional[str] = None,
+            batch_query: bool = False,
+        ) -> Iterator[List[InfrahubNodeSync]]:
+            """
+            Retrieve the nodes of several kinds page by page, the nodes are not added to the store so that they can be
+            released once processed. The pages following the first one are fetched concurrently by groups of
+            max_concurrency pages.
 
-                for host_node in all_nodes:
-                    result = self.resolve_node_mapping(
-                        node=host_node,
-                        attrs=node_attributes_dict[host_node._schema.kind],
-                        schemas=schema_dict,
-                    )
-                    if result:
-                        result["id"] = host_node.id
-                        host_node_attributes[str(host_node)] = result
+            Parameters:
+                kinds (Dict[str, Dict[str, Any]]): Dict of node kind, options (include, exclude, filters,
+                    attrs in lean mode)
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+                batch_query (bool): Fetch all the node kinds with a single GraphQL query per page.
 
-            return host_node_attributes
+            Yields:
+                List[InfrahubNodeSync]: The Nodes of one page, plain dicts in lean mode
+            """
+            branch = branch or self.client.default_branch
+            page_type = "lean" if self.lean else "nodes"
+            page_size = self.client.pagination_size
+            window = max(self.max_concurrency, 1)
+            requests = [kinds] if batch_query else [{kind: options} for kind, options in kinds.items()]
+
+            for request in requests:
+                first_page = self._fetch_page(page_type=page_type, kinds=request, offset=0, branch=branch)
+                yield [node for nodes_from_page, _ in first_page.values() for node in nodes_from_page]
+
+                counts = {kind: count for kind, (_, count) in first_page.items()}
+                remaining_pages = [
+                    ({kind: request[kind] for kind in request if counts[kind] > offset}, offset)
+                    for offset in range(page_size, max(counts.values(), default=0), page_size)
+                ]
+                for idx in range(0, len(remaining_pages), window):
+                    pages = self._fetch_pages(
+                        page_type=page_type, pages=remaining_pages[idx : idx + window], branch=branch
+                    )
+                    for page in pages:
+                        yield [node for nodes_from_page, _ in page.values() for node in nodes_from_page]
 
-    class InfrahubQueryProcessor(InfrahubBaseProcessor):
-        def fetch_and_process(
-            self, query: Union[dict, str], variables: Optional[Dict[str, Any]] = None
-        ) -> Optional[Dict[str, Any]]:
+        @handle_infrahub_exceptions
+        def fetch_nodes_batch(
+            self,
+            kinds: Dict[str, Dict[str, Any]],
+            branch: Optional[str] = None,
+        ) -> Dict[str, List[InfrahubNodeSync]]:
             """
-            Fetches nodes for the given GraphQl query using the Infrahub client wrapper,
-            then processes and maps these nodes to their corresponding attributes.
+            Retrieve the nodes of several kinds, each page of all the kinds being fetched with a single GraphQL query
+
+            Parameters:
+                kinds (Dict[str, Dict[str, Any]]): Dict of node kind, options (include, exclude, filters)
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict[str, List[InfrahubNodeSync]]: Dict of node kind, List of Nodes
+            """
+            branch = branch or self.client.default_branch
+            page_size = self.client.pagination_size
+            nodes: Dict[str, List[InfrahubNodeSync]] = {kind: [] for kind in kinds}
+
+            # The first page gives the total count of each kind, the following pages only contain
+            # the kinds which still have some nodes to fetch and are fetched concurrently
+            counts = {}
+            first_page = self._fetch_page(page_type="nodes", kinds=kinds, offset=0, branch=branch)
+            for kind, (nodes_from_page, count) in first_page.items():
+                nodes[kind].extend(nodes_from_page)
+                counts[kind] = count
+
+            pages = self._fetch_pages(
+                page_type="nodes",
+                pages=[
+                    ({kind: kinds[kind] for kind in kinds if counts[kind] > offset}, offset)
+                    for offset in range(page_size, max(counts.values(), default=0), page_size)
+                ],
+                branch=branch,
+            )
+            for page in pages:
+                for kind, (nodes_from_page, _) in page.items():
+                    nodes[kind].extend(nodes_from_page)
+
+            for nodes_from_kind in nodes.values():
+                self._store_nodes(nodes_from_kind)
+            return nodes
+
+        def _prepare_query(
+            self,
+            kind: str,
+            *,
+            filters: Optional[Dict[str, Any]] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
+            branch: Optional[str] = None,
+        ) -> Tuple[Union[NodeSchema, GenericSchema], Dict[str, Any]]:
+            """
+            Validate the filters of a query built without the SDK and add the pagination to them.
+
+            Parameters:
+                kind (str): kind of the nodes to query
+                filters (Optional[Dict[str, Any]]): Dict of filters to apply on the query
+                offset (Optional[int]): Offset of the page
+                limit (Optional[int]): Size of the page
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Tuple[Union[NodeSchema, GenericSchema], Dict[str, Any]]: The schema of the kind and the filters
+            """
+            self.load_schema(branch=branch)
+            schema = self.client.schema.get(kind=kind, branch=branch)
+            filters = dict(filters or {})
+            if filters:
+                InfrahubNodeSync(client=self.client, schema=schema, branch=branch).validate_filters(filters=filters)
+            if offset is not None:
+                filters["offset"] = offset
+            if limit is not None:
+                filters["limit"] = limit
+            return schema, filters
+
+        def _build_digest_query(
+            self,
+            kind: str,
+            attrs: List[str],
+            *,
+            filters: Optional[Dict[str, Any]] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
+            branch: Optional[str] = None,
+        ) -> Dict[str, Any]:
+            """
+            Build the query data (in Dict format) to retrieve, for one page of nodes of a given kind, only what tells
+            whether a node has changed: the update time of its attributes and relationships, and the ids of its peers.
+
+            Parameters:
+                kind (str): kind of the nodes to query
+                attrs (List[str]): list of attributes/relationship to watch
+                filters (Optional[Dict[str, Any]]): Dict of filters to apply on the query
+                offset (Optional[int]): Offset of the page
+                limit (Optional[int]): Size of the page
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict[str, Any]: Query data for the kind, the root key being the kind
+            """
+            schema, filters = self._prepare_query(kind=kind, filters=filters, offset=offset, limit=limit, branch=branch)
+            node_data: Dict[str, Any] = {"id": None}
+            for attr in attrs:
+                if attr in schema.attribute_names:
+                    node_data[attr] = {"updated_at": None}
+                elif attr in schema.relationship_names:
+                    rel_data = {"node": {"id": None, "__typename": None}, "properties": {"updated_at": None}}
+                    if schema.get_relationship(name=attr).cardinality == "many":
+                        node_data[attr] = {"edges": rel_data}
+                    else:
+                        node_data[attr] = rel_data
+            return {kind: {"@filters": filters, "count": None, "edges": {"node": node_data}}}
+
+        @staticmethod
+        def _digest_node(data: Dict[str, Any]) -> Dict[str, Any]:
+            peers: Dict[str, Set[str]] = defaultdict(set)
+            for value in data.values():
+                if not isinstance(value, dict):
+                    continue
+                edges = value.get("edges") if "edges" in value else [value]
+                for edge in edges or []:
+                    peer = (edge or {}).get("node") or {}
+                    if peer.get("id") and peer.get("__typename"):
+                        peers[peer["__typename"]].add(peer["id"])
+            digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+            return {"digest": digest, "peers": {kind: sorted(ids) for kind, ids in peers.items()}}
+
+        @handle_infrahub_exceptions
+        def fetch_nodes_digests(
+            self,
+            kinds: Dict[str, Dict[str, Any]],
+            branch: Optional[str] = None,
+        ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+            """
+            Retrieve a digest of the current state of the nodes of several kinds, along with the ids of their peers.
+            The digest of a node changes when one of the watched attributes/relationships is updated.
+
+            Parameters:
+                kinds (Dict[str, Dict[str, Any]]): Dict of node kind, options (attrs, filters, ids)
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict[str, Dict[str, Dict[str, Any]]]: Dict of node kind, Dict of node id, digest and ids of the peers
+            """
+            branch = branch or self.client.default_branch
+            chunk_size = self.client.pagination_size
+            requests = []
+            for kind, options in kinds.items():
+                ids = options.get("ids")
+                if ids is None:
+                    requests.append((kind, options))
+                    continue
+                for idx in range(0, len(ids), chunk_size):
+                    filters = dict(options.get("filters") or {}, ids=ids[idx : idx + chunk_size])
+                    requests.append((kind, dict(options, filters=filters)))
+
+            digests: Dict[str, Dict[str, Dict[str, Any]]] = {kind: {} for kind in kinds}
+            results = self._fetch_all_pages(requests=requests, branch=branch, page_type="digests")
+            for (kind, _), digests_from_request in zip(requests, results):
+                for digest in digests_from_request:
+                    digests[kind][digest.pop("id")] = digest
+            return digests
+
+        def _build_lean_query(
+            self,
+            kind: str,
+            attrs: List[str],
+            *,
+            filters: Optional[Dict[str, Any]] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
+            branch: Optional[str] = None,
+        ) -> Dict[str, Any]:
+            """
+            Build the query data (in Dict format) to retrieve one page of nodes of a given kind with their values only:
+            the value of the attributes and the id and kind of the peers, without the properties of the attributes and
+            of the relationships (source, owner, is_protected, updated_at...).
+
+            Parameters:
+                kind (str): kind of the nodes to query
+                attrs (List[str]): list of attributes/relationship to retrieve
+                filters (Optional[Dict[str, Any]]): Dict of filters to apply on the query
+                offset (Optional[int]): Offset of the page
+                limit (Optional[int]): Size of the page
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict[str, Any]: Query data for the kind, the root key being the kind
+            """
+            schema, filters = self._prepare_query(kind=kind, filters=filters, offset=offset, limit=limit, branch=branch)
+            node_data: Dict[str, Any] = {"id": None, "display_label": None}
+            for attr in attrs:
+                if attr in schema.attribute_names:
+                    node_data[attr] = {"value": None}
+                elif attr in schema.relationship_names:
+                    peer_data = {"node": {"id": None, "__typename": None}}
+                    if schema.get_relationship(name=attr).cardinality == "many":
+                        node_data[attr] = {"edges": peer_data}
+                    else:
+                        node_data[attr] = peer_data
+            return {kind: {"@filters": filters, "count": None, "edges": {"node": node_data}}}
+
+        @staticmethod
+        def _lean_node(data: Dict[str, Any], kind: str) -> Dict[str, Any]:
+            """
+            Flatten a node returned by a query built with _build_lean_query into a plain dict: the value of each
+            attribute, a dict (id, __typename) for a relationship of cardinality one, a list of them for a relationship
+            of cardinality many. "__typename" is the kind the node has been queried with.
+            """
+            node: Dict[str, Any] = {"__typename": kind}
+            for name, value in data.items():
+                if not isinstance(value, dict):
+                    node[name] = value
+                elif "edges" in value:
+                    node[name] = [edge["node"] for edge in value["edges"] or [] if edge and edge.get("node")]
+                elif "node" in value:
+                    node[name] = value["node"]
+                else:
+                    node[name] = value.get("value")
+            return node
+
+        def _fetch_schema_hash(self, branch: str) -> Optional[str]:
+            """
+            Retrieves the hash of the whole schema of a branch, a cheap request compared to the schema itself.
+
+            Parameters:
+                branch (str): Name of the branch.
+
+            Returns:
+                Optional[str]: The hash of the schema, or None if the server doesn't provide it.
+            """
+            response = self.client._get(url=self._schema_url(branch=branch, summary=True))
+            if not response.is_success:
+                return None
+            return response.json().get("main")
+
+        def _schema_url(self, branch: str, summary: bool = False) -> str:
+            return f"{self.client.address}/api/schema/{'summary' if summary else ''}?{urlencode({'branch': branch})}"
+
+        def _schema_cache_path(self, branch: str) -> str:
+            key = hashlib.sha256(f"{self.client.address}|{branch}".encode()).hexdigest()
+            return os.path.join(self.schema_cache_dir, f"schema-{key}.json")
+
+        def _read_schema_cache(self, branch: str, schema_hash: str) -> Optional[Dict[str, Any]]:
+            try:
+                with open(self._schema_cache_path(branch=branch), encoding="utf-8") as cache_file:
+                    cached = json.load(cache_file)
+            except (OSError, ValueError):
+                return None
+            if cached.get("hash") != schema_hash or cached.get("address") != self.client.address:
+                return None
+            return cached.get("schema")
+
+        def _write_schema_cache(self, branch: str, schema_hash: str, schema: Dict[str, Any]) -> None:
+            cached = {"address": self.client.address, "branch": branch, "hash": schema_hash, "schema": schema}
+            try:
+                os.makedirs(self.schema_cache_dir, mode=0o700, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.schema_cache_dir, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as cache_file:
+                    json.dump(cached, cache_file)
+                os.replace(tmp_path, self._schema_cache_path(branch=branch))
+            except OSError:
+                # The cache is an optimization only, the schema has been loaded anyway
+                pass
+
+        def load_schema(self, branch: Optional[str] = None) -> None:
+            """
+            Loads the whole schema of a branch in the client, only once per branch.
+
+            When schema_cache_dir is defined, the schema is persisted on disk, keyed by endpoint and branch,
+            along with the hash of the schema on the server. On the next runs, only the hash is requested
+            and the schema is read from the disk unless the hash has changed.
+
+            Parameters:
+                branch (Optional[str]): Name of the branch to load. Defaults to default_branch.
+            """
+            branch = branch or self.client.default_branch
+            if branch in self.client.schema.cache:
+                return
+            if not self.schema_cache_dir:
+                self.client.schema.all(branch=branch)
+                return
+
+            schema_hash = self._fetch_schema_hash(branch=branch)
+            if not schema_hash:
+                self.client.schema.all(branch=branch)
+                return
+
+            data = self._read_schema_cache(branch=branch, schema_hash=schema_hash)
+            if data is None:
+                response = self.client._get(url=self._schema_url(branch=branch))
+                response.raise_for_status()
+                data = response.json()
+                self._write_schema_cache(branch=branch, schema_hash=schema_hash, schema=data)
+            self._set_schema(branch=branch, data=data)
+
+        def _set_schema(self, branch: str, data: Dict[str, Any]) -> None:
+            """
+            Load in the client the schema of a branch, as returned by the schema endpoint.
+            """
+            schemas = {}
+            for node_schema in data.get("nodes", []):
+                schema = NodeSchema(**node_schema)
+                schemas[schema.kind] = schema
+            for generic_schema in data.get("generics", []):
+                schema = GenericSchema(**generic_schema)
+                schemas[schema.kind] = schema
+            self.client.schema.cache[branch] = schemas
+
+        @handle_infrahub_exceptions
+        def fetch_single_schema(self, kind: str, branch: Optional[str] = None) -> NodeSchema:
+            """
+            Retrieves schema attributes for the given kind.
+
+            Parameters:
+                kind (str): The kind for which the schema attributes are needed.
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                NodeSchema: The schema attributes for the given kind.
+            """
+            self.load_schema(branch=branch)
+            return self.client.schema.get(kind=kind, branch=branch)
+
+        @handle_infrahub_exceptions
+        def fetch_schemas(self, branch: Optional[str] = None) -> Dict[str, Union[NodeSchema, GenericSchema]]:
+            """
+            Retrieves the schema of every node and generic kind of a branch, in a single request.
+
+            Parameters:
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict[str, Union[NodeSchema, GenericSchema]]: A Dict of node kind, Schema.
+            """
+            branch = branch or self.client.default_branch
+            self.load_schema(branch=branch)
+            return dict(self.client.schema.cache[branch])
+
+        @handle_infrahub_exceptions
+        def fetch_branchs(self) -> Dict[str, BranchData]:
+            """
+            Retrieves all available branches.
+
+            Returns:
+                Dict[str, BranchData]: A dictionary containing all branches.
+            """
+            return self.branch_manager.all()
+
+        @handle_infrahub_exceptions
+        def fetch_branch(self, branch_name: str) -> BranchData:
+            """
+            Retrieves details of a specific branch.
+
+            Parameters:
+                branch_name (str): The name of the branch to be fetched.
+
+            Returns:
+                BranchData: Details of the specified branch.
+            """
+            return self.branch_manager.get(branch_name=branch_name)
+
+        def _render_query(self, query: Dict, variables: Optional[Dict] = None) -> str:
+            """
+            Render a Grapql Query from a Dict to a String
+
+            Parameters:
+                query (Dict): GraphQL Query to render, can be a query or a mutation
+                variables (Optional[Dict]): Variables to pass along with the GraphQL query. Defaults to None.
+
+            Returns:
+                Str: Graphql Query rendered as a string
+            """
+            if variables:
+                variables_type = {}
+                for key, value in variables.items():
+                    # The subclasses of the base types, such as the strings of Ansible, are declared as the base type
+                    variables_type[key] = next(
+                        (base_type for base_type in (bool, int, float, str) if isinstance(value, base_type)),
+                        type(value),
+                    )
+                query_str = Query(query=query, variables=variables_type).render()
+            else:
+                query_str = Query(query=query).render()
+            return query_str
+
+        @handle_infrahub_exceptions
+        def execute_graphql(
+            self, query: str, variables: Optional[Dict[str, Any]] = None, branch: Optional[str] = None
+        ) -> Dict:
+            """
+            Executes a GraphQL query against the Infrahub Endpoint.
+
+            Parameters:
+                query (str): The GraphQL query string to execute.
+                variables (Optional[Dict]): Variables to pass along with the GraphQL query. Defaults to None.
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict: The result of the executed GraphQL query.
+            """
+            # TODO :  Do something wit the variables ?
+            response = self.client.execute_graphql(query=query, variables=variables, branch_name=branch)
+            return response
+
+    class InfrahubclientAsyncWrapper(InfrahubclientWrapper):
+        """
+        Same as InfrahubclientWrapper, the requests sent together (pages of nodes, peers, schema and artifacts) being
+        sent concurrently from a single event loop, with the async client of the SDK, rather than from threads.
+        The nodes are still returned as InfrahubNodeSync, or plain dicts in lean mode, for the processors.
+        """
+
+        def __init__(self, *args: Any, **kwargs: Any):
+            """
+            Initializes InfrahubclientAsyncWrapper, with the same parameters as InfrahubclientWrapper.
+            max_concurrency is the maximum number of requests awaited at the same time.
+            """
+            super().__init__(*args, **kwargs)
+            config = self.client.config.copy(update={"requester": self._send_request_async})
+            self.async_client = InfrahubClient(address=self.client.address, config=config)
+            # The schema loaded by one client is used by the other
+            self.async_client.schema.cache = self.client.schema.cache
+            self.loop = asyncio.new_event_loop()
+            self.async_http_client = httpx.AsyncClient(
+                verify=self.ssl_context, **self._proxy_options(httpx.AsyncHTTPTransport)
+            )
+
+        async def _send_request_async(
+            self,
+            url: str,
+            method: Any,
+            headers: Dict[str, Any],
+            timeout: int,
+            payload: Optional[Dict] = None,
+        ) -> httpx.Response:
+            """
+            Send a request of the async SDK client, the requester of its config: through the local broker if enabled,
+            through the connection pool of the wrapper otherwise.
+            """
+            if self.broker_socket:
+                # The broker is reached with a blocking socket
+                response = await asyncio.to_thread(
+                    self._send_request_to_broker,
+                    url=url,
+                    method=method,
+                    headers=headers,
+                    timeout=timeout,
+                    payload=payload,
+                )
+            else:
+                params: Dict[str, Any] = {"json": payload} if payload else {}
+                try:
+                    response = await self.async_http_client.request(
+                        method=method.value, url=url, headers=headers, timeout=timeout, **params
+                    )
+                except httpx.NetworkError as exc:
+                    raise ServerNotReachableError(address=self.client.address) from exc
+                except httpx.ReadTimeout as exc:
+                    raise ServerNotResponsiveError(url=url, timeout=timeout) from exc
+            self._record_request(headers=headers, response=response)
+            return response
+
+        def close(self) -> None:
+            """
+            Close the connections to Infrahub and the event loop of the wrapper.
+            """
+            if not self.loop.is_closed():
+                self.loop.run_until_complete(self.async_http_client.aclose())
+                self.loop.close()
+            super().close()
+
+        def __del__(self) -> None:
+            # A wrapper which hasn't been closed, e.g. a shared one, releases its connections and event loop with it
+            loop = getattr(self, "loop", None)
+            if loop is None or loop.is_closed() or loop.is_running():
+                return
+            try:
+                self.close()
+            except RuntimeError:
+                # Another event loop is running in this thread
+                loop.close()
+
+        def run(self, coroutine: Awaitable[Any]) -> Any:
+            """
+            Run a coroutine of the wrapper until it completes, from synchronous code.
+
+            Parameters:
+                coroutine (Awaitable[Any]): The coroutine.
+
+            Returns:
+                Any: The result of the coroutine.
+            """
+            return self.loop.run_until_complete(coroutine)
+
+        async def _gather(self, coroutines: List[Awaitable[Any]]) -> List[Any]:
+            """
+            Await several coroutines, at most max_concurrency at the same time, and return their results in order.
+            """
+            semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+            async def bounded(coroutine: Awaitable[Any]) -> Any:
+                async with semaphore:
+                    return await coroutine
+
+            return await asyncio.gather(*(bounded(coroutine) for coroutine in coroutines))
+
+        async def load_schema_async(self, branch: Optional[str] = None) -> None:
+            """
+            Loads the whole schema of a branch in the clients, only once per branch, see load_schema.
+
+            Parameters:
+                branch (Optional[str]): Name of the branch to load. Defaults to default_branch.
+            """
+            branch = branch or self.client.default_branch
+            if branch in self.client.schema.cache:
+                return
+            if not self.schema_cache_dir:
+                await self.async_client.schema.all(branch=branch)
+                return
+
+            response = await self.async_client._get(url=self._schema_url(branch=branch, summary=True))
+            schema_hash = response.json().get("main") if response.is_success else None
+            data = self._read_schema_cache(branch=branch, schema_hash=schema_hash) if schema_hash else None
+            if data is None:
+                response = await self.async_client._get(url=self._schema_url(branch=branch))
+                response.raise_for_status()
+                data = response.json()
+                if schema_hash:
+                    self._write_schema_cache(branch=branch, schema_hash=schema_hash, schema=data)
+            self._set_schema(branch=branch, data=data)
+
+        def load_schema(self, branch: Optional[str] = None) -> None:
+            branch = branch or self.client.default_branch
+            if branch not in self.client.schema.cache:
+                self.run(self.load_schema_async(branch=branch))
+
+        async def _fetch_page_async(
+            self, page_type: str, kinds: Dict[str, Dict[str, Any]], offset: int, branch: str
+        ) -> Dict[str, Tuple[List[Any], int]]:
+            """
+            Retrieve one page of nodes with the async client, see _fetch_page.
+            """
+            query, tracker = self._build_page_query(page_type=page_type, kinds=kinds, offset=offset, branch=branch)
+            response = await self.async_client.execute_graphql(query=query, branch_name=branch, tracker=tracker)
+            return self._parse_page(page_type=page_type, kinds=kinds, response=response, branch=branch)
+
+        async def _fetch_pages_async(
+            self, page_type: str, pages: List[Tuple[Dict[str, Dict[str, Any]], int]], branch: str
+        ) -> List[Dict[str, Tuple[List[Any], int]]]:
+            """
+            Retrieve several pages concurrently, see _fetch_pages.
+            """
+            # The queries are built from the schema, which must not be loaded synchronously from the event loop
+            await self.load_schema_async(branch=branch)
+            return await self._gather(
+                [
+                    self._fetch_page_async(page_type=page_type, kinds=kinds, offset=offset, branch=branch)
+                    for kinds, offset in pages
+                ]
+            )
+
+        def _fetch_page(
+            self, page_type: str, kinds: Dict[str, Dict[str, Any]], offset: int, branch: str
+        ) -> Dict[str, Tuple[List[Any], int]]:
+            return self._fetch_pages(page_type=page_type, pages=[(kinds, offset)], branch=branch)[0]
+
+        def _fetch_pages(
+            self, page_type: str, pages: List[Tuple[Dict[str, Dict[str, Any]], int]], branch: str
+        ) -> List[Dict[str, Tuple[List[Any], int]]]:
+            return self.run(self._fetch_pages_async(page_type=page_type, pages=pages, branch=branch))
+
+        async def fetch_nodes_async(
+            self,
+            kind: str,
+            include: Optional[List[str]] = None,
+            exclude: Optional[List[str]] = None,
+            filters: Optional[Dict[str, str]] = None,
+            branch: Optional[str] = None,
+        ) -> List[InfrahubNodeSync]:
+            """
+            Retrieve all nodes of a given kind, the pages following the first one being fetched concurrently
+
+            Parameters:
+                kind (str): kind of the nodes to query
+                include (Optional[List[str]]): list of attributes/relationship to retrieve
+                exclude (Optional[List[str]]): list of attributes/relationship to ignore
+                filters (Optional[Dict[str, str]]): Dict of filters to apply on the query
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                List[InfrahubNodeSync]: List of Nodes
+            """
+            branch = branch or self.client.default_branch
+            kinds = {kind: {"include": include, "exclude": exclude, "filters": filters}}
+            first_page = (await self._fetch_pages_async(page_type="nodes", pages=[(kinds, 0)], branch=branch))[0]
+            nodes, count = first_page[kind]
+            pages = await self._fetch_pages_async(
+                page_type="nodes",
+                pages=[
+                    (kinds, offset) for offset in range(self.client.pagination_size, count, self.client.pagination_size)
+                ],
+                branch=branch,
+            )
+            for page in pages:
+                nodes.extend(page[kind][0])
+            self._store_nodes(nodes)
+            return nodes
+
+        @handle_infrahub_exceptions
+        def fetch_nodes(
+            self,
+            kind: str,
+            include: Optional[List[str]] = None,
+            exclude: Optional[List[str]] = None,
+            filters: Optional[Dict[str, str]] = None,
+            branch: Optional[str] = None,
+        ) -> List[InfrahubNodeSync]:
+            return self.run(
+                self.fetch_nodes_async(kind=kind, include=include, exclude=exclude, filters=filters, branch=branch)
+            )
+
+        async def fetch_artifact_async(
+            self, filters: Optional[Dict[str, str]] = None, branch: Optional[str] = None
+        ) -> Dict[str, Any]:
+            """
+            Retrieve the content of an artifact
+
+            Parameters:
+                filters (Optional[Dict[str, str]]): Dict of filters to apply on the query
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict[str, Any]: Artifact Content, "json" or "text" depending on its content type
+            """
+            if not filters:
+                raise Exception("At least one filter must be provided")
+            await self.load_schema_async(branch=branch)
+            node = await self.async_client.get(kind="CoreArtifact", branch=branch, **filters)
+            response = await self.async_client._get(
+                url=f"{self.client.address}/api/storage/object/{node.storage_id.value}"
+            )
+            if node.content_type.value == "application/json":
+                return {"json": response.json(), "text": None}
+            return {"json": None, "text": response.text}
+
+        @handle_infrahub_exceptions
+        def fetch_single_artifact(
+            self, filters: Optional[Dict[str, str]] = None, branch: Optional[str] = None
+        ) -> Dict[str, Any]:
+            return self.run(self.fetch_artifact_async(filters=filters, branch=branch))
+
+        async def execute_graphql_async(
+            self, query: str, variables: Optional[Dict[str, Any]] = None, branch: Optional[str] = None
+        ) -> Dict:
+            """
+            Executes a GraphQL query against the Infrahub Endpoint, with the async client.
+
+            Parameters:
+                query (str): The GraphQL query string to execute.
+                variables (Optional[Dict]): Variables to pass along with the GraphQL query. Defaults to None.
+                branch (Optional[str]): Name of the branch to query from. Defaults to default_branch.
+
+            Returns:
+                Dict: The result of the executed GraphQL query.
+            """
+            return await self.async_client.execute_graphql(query=query, variables=variables, branch_name=branch)
+
+        @handle_infrahub_exceptions
+        def execute_graphql(
+            self, query: str, variables: Optional[Dict[str, Any]] = None, branch: Optional[str] = None
+        ) -> Dict:
+            return self.run(self.execute_graphql_async(query=query, variables=variables, branch=branch))
+
+    def get_shared_client(
+        api_endpoint: str, branch: str, token: str, timeout: Optional[int] = 10, **options: Any
+    ) -> InfrahubclientWrapper:
+        """
+        Return the client shared by the plugins running in the current process for the same endpoint, token,
+        branch, timeout and options, created on first use. The connections to Infrahub are kept alive and the
+        schema is loaded once, the nodes fetched by a previous plugin are released. The shared clients are closed
+        at exit, see close_shared_clients.
+
+        Parameters:
+            api_endpoint (str): API endpoint of Infrahub.
+            branch (str): Branch in which the request is made.
+            token (str): Infrahub API token.
+            timeout (int): Timeout for Infrahub requests in seconds.
+            options (Any): Other options of the client, see __init__. use_async (bool) selects
+                InfrahubclientAsyncWrapper.
+
+        Returns:
+            InfrahubclientWrapper: The shared client.
+        """
+        # A forked process never shares the connections of its parent
+        key = (
+            os.getpid(),
+            api_endpoint,
+            hashlib.sha256((token or "").encode()).hexdigest(),
+            branch,
+            timeout,
+            tuple(sorted(options.items())),
+        )
+        with SHARED_CLIENTS_LOCK:
+            client = SHARED_CLIENTS.get(key)
+            if client is None:
+                use_async = options.pop("use_async", False)
+                wrapper_class = InfrahubclientAsyncWrapper if use_async else InfrahubclientWrapper
+                client = wrapper_class(
+                    api_endpoint=api_endpoint, branch=branch, token=token, timeout=timeout, **options
+                )
+                SHARED_CLIENTS[key] = client
+            else:
+                client.release_store(max_size=0)
+        return client
+
+    def close_shared_clients() -> None:
+        """
+        Close the clients shared by the plugins of the current process, see get_shared_client. Run at exit.
+        """
+        with SHARED_CLIENTS_LOCK:
+            # The clients inherited from the parent process are left to it
+            keys = [key for key in SHARED_CLIENTS if key[0] == os.getpid()]
+            clients = [SHARED_CLIENTS.pop(key) for key in keys]
+        for client in clients:
+            client.close()
+
+    atexit.register(close_shared_clients)
+
+    class InfrahubBaseProcessor:
+        def __init__(self, client: InfrahubclientWrapper, max_depth: int = 1):
+            """
+            Initializes InfrahubBaseProcessor.
+
+            Parameters:
+                client (InfrahubclientWrapper): The client used to fetch the schema and the nodes.
+                max_depth (int): Depth up to which the relationships are resolved. At 1 the peers are resolved with
+                    their attributes only, at 2 with their relationships too, and so on.
+            """
+            self.client = client
+            self.max_depth = max_depth
+            self.schemas: Dict[str, Union[NodeSchema, GenericSchema]] = {}
+            self.implementations: Dict[str, List[str]] = {}
+            # Resolved peers by id, attributes/relationships and depth
+            self.resolved_peers: Dict[Tuple[str, Tuple[str, ...], int], Optional[Dict[str, Any]]] = {}
+            # Peers fetched in lean mode by id, see prefetch_lean_peers
+            self.lean_peers: Dict[str, Dict[str, Any]] = {}
+            self.peer_attributes: Dict[Tuple[str, bool], Tuple[str, ...]] = {}
+            self.cycles_cut = 0
+
+        def load_schemas(self, branch: Optional[str] = None) -> None:
+            """
+            Load the whole schema of the branch once, indexed by kind, along with the implementations of each generic.
+
+            Parameters:
+                branch (Optional[str]): Name of the branch to load the schema from. Defaults to default_branch.
+            """
+            if self.schemas:
+                return
+            self.schemas = self.client.fetch_schemas(branch=branch)
+            self.implementations = {
+                kind: list(schema.used_by or [])
+                for kind, schema in self.schemas.items()
+                if isinstance(schema, GenericSchema)
+            }
+
+        def get_schema(self, kind: str) -> Union[NodeSchema, GenericSchema]:
+            """
+            Retrieves the schema of a kind from the preloaded schema of the branch.
+
+            Parameters:
+                kind (str): The kind for which the schema is needed.
+
+            Returns:
+                Union[NodeSchema, GenericSchema]: The schema for the given kind.
+            """
+            self.load_schemas()
+            if kind not in self.schemas:
+                raise Exception(f"Unable to find the schema for {kind}")
+            return self.schemas[kind]
+
+        def get_implementations(self, kind: str) -> List[str]:
+            """
+            Resolve a kind to the node kinds implementing it.
+
+            Parameters:
+                kind (str): A node or generic kind.
+
+            Returns:
+                List[str]: The kinds using the generic, or the kind itself if it isn't a generic.
+            """
+            self.load_schemas()
+            return self.implementations.get(kind, [kind])
+
+        @staticmethod
+        def get_attributes_for_schema(schema: NodeSchema, exclude: Optional[List[str]] = None) -> List[str]:
+            """
+            Build the attributes for the given kind.
+
+            Parameters:
+                schema (NodeSchema): The schema from which attributes/relationship are used
+                exclude Optional[List[str]]: list of attributes/relationship to ignore
+
+            Returns:
+                List[str]: The schema attributes for the given kind.
+            """
+            exclude = exclude or []
+            attributes_by_kind = []
+            # From https://docs.infrahub.app/python-sdk/10_query/#control-what-will-be-queried
+            #  "By default the query will include, the attributes, the relationships of cardinality one and the relationships of kind Attribute"
+            for attr_name in schema.attribute_names:
+                if exclude and attr_name in exclude:
+                    continue
+                attributes_by_kind.append(attr_name)
+            for rel_name in schema.relationship_names:
+                if exclude and rel_name in exclude:
+                    continue
+                rel_schema = schema.get_relationship(name=rel_name)
+                if (
+                    rel_schema.cardinality == RelationshipCardinality.MANY  # type: ignore[union-attr]
+                    and rel_schema.kind not in [RelationshipKind.ATTRIBUTE, RelationshipKind.PARENT]  # type: ignore[union-attr]
+                ):
+                    continue
+                if rel_schema and rel_schema.cardinality == "one":
+                    attributes_by_kind.append(rel_name)
+                elif rel_schema and rel_schema.cardinality == "many":
+                    attributes_by_kind.append(rel_name)
+            return attributes_by_kind
+
+        def get_peer_attributes(self, kind: str, depth: int) -> Tuple[str, ...]:
+            """
+            Build the attributes/relationships a peer is resolved with: its attributes only once the maximum depth
+            is reached, the same attributes/relationships as a node without include option otherwise.
+
+            Parameters:
+                kind (str): The kind of the peer.
+                depth (int): The depth left to resolve the relationships of the peer.
+
+            Returns:
+                Tuple[str, ...]: The attributes/relationships to resolve.
+            """
+            key = (kind, depth > 0)
+            if key not in self.peer_attributes:
+                schema = self.get_schema(kind=kind)
+                attrs = self.get_attributes_for_schema(schema) if depth > 0 else schema.attribute_names
+                self.peer_attributes[key] = tuple(attrs)
+            return self.peer_attributes[key]
+
+        def get_peers(self, node: InfrahubNodeSync, attr: str) -> List[InfrahubNodeSync]:
+            """
+            Retrieve from the store the peers of a relationship of a node.
+
+            Parameters:
+                node (InfrahubNodeSync): The node.
+                attr (str): The name of the relationship.
+
+            Returns:
+                List[InfrahubNodeSync]: The peers found in the store.
+            """
+            node_attr = getattr(node, attr)
+            related_nodes = node_attr.peers if node_attr.schema.cardinality == "many" else [node_attr]
+            peers = [self.client.get_peer(related_node=related_node) for related_node in related_nodes]
+            return [peer for peer in peers if peer]
+
+        def resolve_node_mapping(
+            self,
+            node: InfrahubNodeSync,
+            attrs: List[str],
+            schemas: Dict[str, NodeSchema],
+            *,
+            depth: Optional[int] = None,
+            depths: Optional[Dict[str, int]] = None,
+            ancestors: Tuple[str, ...] = (),
+        ) -> Optional[Dict[str, Any]]:
+            """
+            Resolve the attributes and relationships of a given node based on a list of desired attributes.
+
+            Parameters:
+                node (InfrahubNodeSync): The node to which attributes/relationships are to be mapped.
+                attrs (List[str]): A list of attribute names that should be fetched for the node.
+                schemas Dict[str, NodeSchema]: A dictionary of Node Kind name, NodeSchema
+                depth (Optional[int]): The depth up to which the relationships are resolved. Defaults to max_depth.
+                depths (Optional[Dict[str, int]]): The depth of some relationships, overriding depth.
+                ancestors (Tuple[str, ...]): The ids of the nodes being resolved, from the host node to this node.
+
+            Returns:
+                Dict[str, Any]: A dictionary mapping attribute/relationship names to their respective values.
+                        For relationship with "many" cardinality, it will be a List (of related nodes)
+            """
+            depth = self.max_depth if depth is None else depth
+            ancestors = (*ancestors, node.id)
+            attribute_dict = {}
+            for attr in attrs:
+                node_attr = getattr(node, attr)
+
+                if attr in node._schema.attribute_names:
+                    if node_attr.value:
+                        attribute_dict[node_attr._schema.name] = str(node_attr.value)
+                    else:
+                        attribute_dict[node_attr._schema.name] = node_attr.value
+
+                if attr in node._schema.relationship_names:
+                    # Peers are read from the store, populated beforehand by prefetch_peers
+                    peer_depth = (depths or {}).get(attr, depth) - 1
+                    if node_attr.schema.cardinality == "many":
+                        peers: List[InfrahubNodeSync] = []
+                        for related_node in node_attr:
+                            peer = self.client.get_peer(related_node=related_node)
+                            if peer and hasattr(peer._schema, "attribute_names"):
+                                peers.append(
+                                    self.resolve_peer(peer=peer, schemas=schemas, depth=peer_depth, ancestors=ancestors)
+                                )
+                        attribute_dict[node_attr.schema.name] = peers
+                    elif node_attr.schema.cardinality == "one":
+                        peer = self.client.get_peer(related_node=node_attr)
+                        if not peer:
+                            attribute_dict[node_attr.schema.name] = None
+                            continue
+                        attribute_dict[node_attr.schema.name] = self.resolve_peer(
+                            peer=peer, schemas=schemas, depth=peer_depth, ancestors=ancestors
+                        )
+
+            return attribute_dict
+
+        def resolve_peer(
+            self,
+            peer: InfrahubNodeSync,
+            schemas: Dict[str, NodeSchema],
+            depth: int = 0,
+            ancestors: Tuple[str, ...] = (),
+        ) -> Optional[Dict[str, Any]]:
+            """
+            Resolve the attributes of a peer, and its relationships as long as depth is positive.
+            A peer is resolved only once per depth: the resolved attributes are shared by all the nodes related to it.
+            A peer which is one of its own ancestors is replaced by its id instead of being resolved again.
+
+            Parameters:
+                peer (InfrahubNodeSync): The peer to resolve.
+                schemas Dict[str, NodeSchema]: A dictionary of Node Kind name, NodeSchema
+                depth (int): The depth left to resolve the relationships of the peer.
+                ancestors (Tuple[str, ...]): The ids of the nodes being resolved, from the host node to the peer.
+
+            Returns:
+                Dict[str, Any]: A dictionary mapping attribute names to their respective values.
+            """
+            return self._resolve_memoized(
+                node_id=peer.id,
+                kind=peer._schema.kind,
+                depth=depth,
+                ancestors=ancestors,
+                resolve=lambda attrs: self.resolve_node_mapping(
+                    node=peer, attrs=attrs, schemas=schemas, depth=depth, ancestors=ancestors
+                ),
+            )
+
+        def _resolve_memoized(
+            self,
+            node_id: str,
+            kind: str,
+            depth: int,
+            ancestors: Tuple[str, ...],
+            resolve: Callable[[List[str]], Optional[Dict[str, Any]]],
+        ) -> Optional[Dict[str, Any]]:
+            if node_id in ancestors:
+                self.cycles_cut += 1
+                return {"id": node_id}
+            attrs = self.get_peer_attributes(kind=kind, depth=depth)
+            key = (node_id, attrs, max(depth, 0))
+            if key in self.resolved_peers:
+                return self.resolved_peers[key]
+
+            cycles_cut = self.cycles_cut
+            resolved = resolve(list(attrs))
+            # Cut cycles depend on the ancestors, a peer is only shared if none was cut while resolving it
+            if self.cycles_cut == cycles_cut:
+                self.resolved_peers[key] = resolved
+            return resolved
+
+        def _collect_peer_ids(
+            self, node: InfrahubNodeSync, attr: str, ids_by_kind: Dict[str, Set[str]], missing_only: bool = True
+        ) -> None:
+            node_attr = getattr(node, attr)
+            related_nodes = node_attr.peers if node_attr.schema.cardinality == "many" else [node_attr]
+            for related_node in related_nodes:
+                if not related_node.id:
+                    continue
+                # typename is the concrete kind of the peer, even when the relationship points to a generic
+                peer_kind = related_node.typename
+                if not peer_kind:
+                    implementations = self.get_implementations(kind=node_attr.schema.peer)
+                    if len(implementations) != 1:
+                        continue
+                    peer_kind = implementations[0]
+                if missing_only and self.client.is_in_store(node_id=related_node.id, kind=peer_kind):
+                    continue
+                ids_by_kind[peer_kind].add(related_node.id)
+
+        def prefetch_peers(
+            self,
+            nodes: List[InfrahubNodeSync],
+            attrs_by_kind: Dict[str, List[str]],
+            depths_by_kind: Optional[Dict[str, Dict[str, int]]] = None,
+        ) -> None:
+            """
+            Load in the store the peers of the relationships of the given nodes which are not in the store yet.
+            The peers are grouped by their concrete kind and fetched with an "ids" filter, one query per kind and page,
+            instead of one query per node and per relationship. The peers of the peers are then loaded the same way,
+            level by level, up to max_depth.
+
+            Parameters:
+                nodes (List[InfrahubNodeSync]): The nodes for which the peers will be resolved.
+                attrs_by_kind (Dict[str, List[str]]): A dictionary of Node Kind name, attributes/relationships to resolve.
+                depths_by_kind (Optional[Dict[str, Dict[str, int]]]): A dictionary of Node Kind name, depth of some
+                    relationships overriding max_depth.
+            """
+            depths_by_kind = depths_by_kind or {}
+            # Each node along with the depth of its relationships to resolve
+            level = []
+            for node in nodes:
+                kind = node._schema.kind
+                depths = depths_by_kind.get(kind) or {}
+                relationships = [
+                    attr for attr in attrs_by_kind.get(kind, []) if attr in node._schema.relationship_names
+                ]
+                level.append((node, {attr: depths.get(attr, self.max_depth) for attr in relationships}))
+
+            visited: Set[Tuple[str, int]] = set()
+            while level:
+                ids_by_kind: Dict[str, Set[str]] = defaultdict(set)
+                for node, depths in level:
+                    for attr in depths:
+                        self._collect_peer_ids(node=node, attr=attr, ids_by_kind=ids_by_kind)
+                if ids_by_kind:
+                    peers_by_kind = self.client.fetch_nodes_by_ids(
+                        ids_by_kind={kind: sorted(ids) for kind, ids in ids_by_kind.items()}
+                    )
+                    for kind, peers in peers_by_kind.items():
+                        self.client.metrics.record_nodes(kind=kind, count=len(peers))
+
+                next_level = []
+                for node, depths in level:
+                    for attr, depth in depths.items():
+                        if depth <= 1:
+                            continue
+                        for peer in self.get_peers(node=node, attr=attr):
+                            if (peer.id, depth) in visited:
+                                continue
+                            visited.add((peer.id, depth))
+                            relationships = self.get_peer_attributes(kind=peer._schema.kind, depth=depth - 1)
+                            next_level.append(
+                                (
+                                    peer,
+                                    {rel: depth - 1 for rel in relationships if rel in peer._schema.relationship_names},
+                                )
+                            )
+                level = next_level
+
+        def resolve_lean_mapping(
+            self,
+            node: Dict[str, Any],
+            attrs: List[str],
+            schema: Union[NodeSchema, GenericSchema],
+            *,
+            depth: Optional[int] = None,
+            depths: Optional[Dict[str, int]] = None,
+            ancestors: Tuple[str, ...] = (),
+        ) -> Dict[str, Any]:
+            """
+            Same as resolve_node_mapping, for a node fetched in lean mode as a plain dict.
+            The peers are read from lean_peers, populated beforehand by prefetch_lean_peers.
+
+            Parameters:
+                node (Dict[str, Any]): The node to which attributes/relationships are to be mapped.
+                attrs (List[str]): A list of attribute names that should be fetched for the node.
+                schema (Union[NodeSchema, GenericSchema]): The schema of the node.
+                depth (Optional[int]): The depth up to which the relationships are resolved. Defaults to max_depth.
+                depths (Optional[Dict[str, int]]): The depth of some relationships, overriding depth.
+                ancestors (Tuple[str, ...]): The ids of the nodes being resolved, from the host node to this node.
+
+            Returns:
+                Dict[str, Any]: A dictionary mapping attribute/relationship names to their respective values.
+                        For relationship with "many" cardinality, it will be a List (of related nodes)
+            """
+            depth = self.max_depth if depth is None else depth
+            ancestors = (*ancestors, node["id"])
+            attribute_dict = {}
+            for attr in attrs:
+                if attr in schema.attribute_names:
+                    value = node.get(attr)
+                    attribute_dict[attr] = str(value) if value else value
+                elif attr in schema.relationship_names:
+                    peer_depth = (depths or {}).get(attr, depth) - 1
+                    related = node.get(attr)
+                    if isinstance(related, list):
+                        peers = [self.lean_peers.get(peer.get("id")) for peer in related]
+                        attribute_dict[attr] = [
+                            self.resolve_lean_peer(peer=peer, depth=peer_depth, ancestors=ancestors)
+                            for peer in peers
+                            if peer
+                        ]
+                    else:
+                        peer = self.lean_peers.get((related or {}).get("id"))
+                        attribute_dict[attr] = (
+                            self.resolve_lean_peer(peer=peer, depth=peer_depth, ancestors=ancestors) if peer else None
+                        )
+            return attribute_dict
+
+        def resolve_lean_peer(
+            self, peer: Dict[str, Any], depth: int = 0, ancestors: Tuple[str, ...] = ()
+        ) -> Optional[Dict[str, Any]]:
+            """
+            Same as resolve_peer, for a peer fetched in lean mode as a plain dict.
+
+            Parameters:
+                peer (Dict[str, Any]): The peer to resolve.
+                depth (int): The depth left to resolve the relationships of the peer.
+                ancestors (Tuple[str, ...]): The ids of the nodes being resolved, from the host node to the peer.
+
+            Returns:
+                Dict[str, Any]: A dictionary mapping attribute names to their respective values.
+            """
+            return self._resolve_memoized(
+                node_id=peer["id"],
+                kind=peer["__typename"],
+                depth=depth,
+                ancestors=ancestors,
+                resolve=lambda attrs: self.resolve_lean_mapping(
+                    node=peer,
+                    attrs=attrs,
+                    schema=self.get_schema(kind=peer["__typename"]),
+                    depth=depth,
+                    ancestors=ancestors,
+                ),
+            )
+
+        def _lean_peer_refs(self, node: Dict[str, Any], attr: str, schema: Union[NodeSchema, GenericSchema]) -> List:
+            related = node.get(attr)
+            refs = []
+            for peer in related if isinstance(related, list) else [related]:
+                if not peer or not peer.get("id"):
+                    continue
+                peer_kind = peer.get("__typename")
+                if not peer_kind:
+                    implementations = self.get_implementations(kind=schema.get_relationship(name=attr).peer)
+                    if len(implementations) != 1:
+                        continue
+                    peer_kind = implementations[0]
+                refs.append((peer_kind, peer["id"]))
+            return refs
+
+        def prefetch_lean_peers(
+            self,
+            nodes: List[Dict[str, Any]],
+            attrs_by_kind: Dict[str, List[str]],
+            depths_by_kind: Optional[Dict[str, Dict[str, int]]] = None,
+        ) -> None:
+            """
+            Same as prefetch_peers, for nodes fetched in lean mode as plain dicts. The peers are fetched in lean mode
+            too and kept in lean_peers, they aren't added to the store.
+
+            Parameters:
+                nodes (List[Dict[str, Any]]): The nodes for which the peers will be resolved.
+                attrs_by_kind (Dict[str, List[str]]): A dictionary of Node Kind name, attributes/relationships to resolve.
+                depths_by_kind (Optional[Dict[str, Dict[str, int]]]): A dictionary of Node Kind name, depth of some
+                    relationships overriding max_depth.
+            """
+            depths_by_kind = depths_by_kind or {}
+            level = []
+            for node in nodes:
+                kind = node["__typename"]
+                schema = self.get_schema(kind=kind)
+                depths = depths_by_kind.get(kind) or {}
+                relationships = [attr for attr in attrs_by_kind.get(kind, []) if attr in schema.relationship_names]
+                level.append((node, schema, {attr: depths.get(attr, self.max_depth) for attr in relationships}))
+
+            visited: Set[Tuple[str, int]] = set()
+            while level:
+                ids_by_kind: Dict[str, Set[str]] = defaultdict(set)
+                for node, schema, depths in level:
+                    for attr, depth in depths.items():
+                        for peer_kind, peer_id in self._lean_peer_refs(node=node, attr=attr, schema=schema):
+                            peer = self.lean_peers.get(peer_id)
+                            # A peer fetched with its attributes only is fetched again to resolve its relationships
+                            if peer is None or (depth > 1 and "__relationships__" not in peer):
+                                ids_by_kind[peer_kind].add(peer_id)
+                if ids_by_kind:
+                    with_relationships = any(depth > 1 for _, _, depths in level for depth in depths.values())
+                    options = {
+                        kind: {"attrs": list(self.get_peer_attributes(kind=kind, depth=int(with_relationships)))}
+                        for kind in ids_by_kind
+                    }
+                    peers_by_kind = self.client.fetch_nodes_by_ids(
+                        ids_by_kind={kind: sorted(ids) for kind, ids in ids_by_kind.items()}, options=options
+                    )
+                    for kind, peers in peers_by_kind.items():
+                        self.client.metrics.record_nodes(kind=kind, count=len(peers))
+                        for peer in peers:
+                            if with_relationships:
+                                peer["__relationships__"] = True
+                            self.lean_peers[peer["id"]] = peer
+
+                next_level = []
+                for node, schema, depths in level:
+                    for attr, depth in depths.items():
+                        if depth <= 1:
+                            continue
+                        for _, peer_id in self._lean_peer_refs(node=node, attr=attr, schema=schema):
+                            peer = self.lean_peers.get(peer_id)
+                            if not peer or (peer_id, depth) in visited:
+                                continue
+                            visited.add((peer_id, depth))
+                            peer_schema = self.get_schema(kind=peer["__typename"])
+                            relationships = self.get_peer_attributes(kind=peer["__typename"], depth=depth - 1)
+                            next_level.append(
+                                (
+                                    peer,
+                                    peer_schema,
+                                    {rel: depth - 1 for rel in relationships if rel in peer_schema.relationship_names},
+                                )
+                            )
+                level = next_level
+
+    class InfrahubNodesProcessor(InfrahubBaseProcessor):
+        def __init__(
+            self,
+            client: InfrahubclientWrapper,
+            max_depth: int = 1,
+            lazy_relationships: Optional[Dict[str, List[str]]] = None,
+        ):
+            """
+            Initializes InfrahubNodesProcessor.
+
+            Parameters:
+                client (InfrahubclientWrapper): The client used to fetch the schema and the nodes.
+                max_depth (int): Depth up to which the relationships are resolved.
+                lazy_relationships (Optional[Dict[str, List[str]]]): A dictionary of Node Kind name, relationships
+                    left out of the host node attributes, to be loaded on demand by the vars plugin.
+            """
+            super().__init__(client=client, max_depth=max_depth)
+            self.lazy_relationships = lazy_relationships or {}
+            # Host name patterns of the limit by Node Kind name, see apply_limit
+            self.limit_patterns: Dict[str, List[str]] = {}
+
+        @staticmethod
+        def get_related_nodes(schema: NodeSchema, attrs: List[str]) -> List[str]:
+            """
+            Build a list of Node Kind base on the relationships of a given schema
+
+            Parameters:
+                schema (NodeSchema): The schema from which relationship are loaded
+                attrs List[str]: list of attributes to compare to the schema
+
+            Returns:
+                List[str]: The node kind of the related nodes
+            """
+            relationship_schemas = [schema.peer for schema in schema.relationships if schema.name in attrs]
+            return list(set(relationship_schemas))
+
+        @staticmethod
+        def build_include_from_constructed(
+            compose: Dict, groups: List[Dict], conditionals: Optional[Dict] = None
+        ) -> List[str]:
+            """
+            Build a List of str, based on the compose and keyed_groups options.
+
+            The names are the variables referenced by the Jinja expressions, e.g. "platform" for
+            "platform.name | lower", so that only the attributes and relationships being used can be fetched.
+
+            Parameters:
+                compose (Dict): A dictionary containing the compose options details.
+                groups (List[Dict]): A list of dictionaries, each representing a group with specific attributes.
+                conditionals (Optional[Dict]): A dictionary containing the conditional groups (groups option).
+
+            Returns:
+                List[str]: A list of strings constructed based on the input parameters.
+
+            """
+            expressions = list((compose or {}).values())
+            expressions += [group["key"] for group in groups or [] if isinstance(group, dict) and "key" in group]
+            expressions += list((conditionals or {}).values())
+
+            include = []
+            for expression in expressions:
+                if not isinstance(expression, str):
+                    continue
+                names = [expression.split(".")[0].strip()]
+                if HAS_JINJA2:
+                    try:
+                        names = sorted(meta.find_undeclared_variables(Environment().parse(f"{{{{ {expression} }}}}")))
+                    except TemplateSyntaxError:
+                        pass
+                include += [name for name in names if name not in include]
+            return include
+
+        def apply_auto_include(
+            self, nodes: Dict[str, Any], compose: Dict, groups: List[Dict], conditionals: Optional[Dict] = None
+        ) -> Dict[str, Any]:
+            """
+            Restrict the attributes and relationships fetched for each node kind to the ones referenced by the
+            compose, keyed_groups and groups options, along with the ones listed in its include option.
+
+            Parameters:
+                nodes (Dict[str, Any]): The node kinds with their include and exclude options.
+                compose (Dict): A dictionary containing the compose options details.
+                groups (List[Dict]): A list of dictionaries, each representing a group with specific attributes.
+                conditionals (Optional[Dict]): A dictionary containing the conditional groups (groups option).
+
+            Returns:
+                Dict[str, Any]: The node kinds with their include option computed, and their exclude option holding
+                    the other attributes and relationships so that they aren't queried. A node kind is left untouched,
+                    all its attributes being fetched, if none of its attributes or relationships are referenced.
+            """
+            self.load_schemas()
+            referenced = self.build_include_from_constructed(compose=compose, groups=groups, conditionals=conditionals)
+
+            result = {}
+            for node_kind, options in nodes.items():
+                node_options = dict(options or {})
+                schema = self.get_schema(kind=node_kind)
+                names = set(schema.attribute_names) | set(schema.relationship_names)
+                exclude = node_options.get("exclude") or []
+                include = list(node_options.get("include") or [])
+                include += [name for name in referenced if name in names and name not in include]
+                include = [name for name in include if name not in exclude]
+                if include:
+                    node_options["include"] = include
+                    # The SDK only adds the cardinality many relationships included, the others are left out
+                    node_options["exclude"] = list(exclude) + sorted(
+                        name for name in names if name not in include and name not in exclude
+                    )
+                result[node_kind] = node_options
+            return result
+
+        def _build_limit_filter(self, schema: Union[NodeSchema, GenericSchema], key: str) -> Optional[str]:
+            """
+            Build the filter matching a selector of a limit expression, e.g. "role" or "site.name".
+            A relationship alone is matched on the default filter of its peer, or on its name.
+
+            Parameters:
+                schema (Union[NodeSchema, GenericSchema]): The schema of the node kind.
+                key (str): The attribute, relationship or relationship.attribute selected.
+
+            Returns:
+                Optional[str]: The name of the filter matching a single value, None if the node kind has no such
+                    attribute or relationship.
+            """
+            path = key.split(".")
+            if len(path) == 1 and path[0] in schema.attribute_names:
+                return f"{path[0]}__value"
+            if path[0] in schema.relationship_names and len(path) <= 2:  # noqa: PLR2004
+                if len(path) == 1:
+                    peer_schema = self.get_schema(kind=schema.get_relationship(name=path[0]).peer)
+                    path.append((peer_schema.default_filter or "name__value").split("__")[0])
+                return f"{path[0]}__{path[1]}__value"
+            return None
+
+        def apply_limit(self, nodes: Dict[str, Any], limit: List[str]) -> Dict[str, Any]:
+            """
+            Restrict the nodes fetched to the hosts matching a limit, by adding filters to the query of each node kind.
+            The limit is a list of host names and of selectors "<attribute>=<value>" or
+            "<relationship>[.<attribute>]=<value>". The host names are combined with OR, the selectors with AND,
+            the values of the same selector with OR.
+
+            Only the selectors are matched by Infrahub. The hosts are named after their display label, which may
+            differ from the default filter of their node kind: the host names, with or without wildcards (*, ? or [),
+            are matched on the name of the hosts once they are fetched, see limit_patterns.
+
+            Parameters:
+                nodes (Dict[str, Any]): The node kinds with their options.
+                limit (List[str]): The host names and selectors.
+
+            Returns:
+                Dict[str, Any]: The node kinds with their filters, without the node kinds which can't match the
+                    selectors.
+            """
+            self.load_schemas()
+            names: List[str] = []
+            selectors: Dict[str, List[str]] = defaultdict(list)
+            for expression in limit:
+                key, sep, value = (part.strip() for part in expression.partition("="))
+                if sep:
+                    selectors[key].append(value)
+                elif key:
+                    names.append(key)
+
+            result = {}
+            self.limit_patterns = {}
+            for node_kind, options in nodes.items():
+                node_options = dict(options or {})
+                schema = self.get_schema(kind=node_kind)
+                limit_filters: Dict[str, Any] = {}
+                for key, values in selectors.items():
+                    filter_name = self._build_limit_filter(schema=schema, key=key)
+                    if filter_name is None:
+                        break
+                    if len(values) == 1:
+                        limit_filters[filter_name] = values[0]
+                    else:
+                        limit_filters[f"{filter_name}s"] = values
+                else:
+                    if names:
+                        self.limit_patterns[node_kind] = names
+                    filters = dict(node_options.get("filters") or {})
+                    conflicts = set(filters) & set(limit_filters)
+                    if conflicts:
+                        raise Exception(
+                            f"The limit conflicts with the filters {', '.join(sorted(conflicts))} of {node_kind}"
+                        )
+                    filters.update(limit_filters)
+                    node_options["filters"] = filters
+                    result[node_kind] = node_options
+            return result
+
+        def match_limit(self, kind: str, host: str) -> bool:
+            """
+            Check whether a host matches the host name patterns of the limit left to match for its node kind.
+
+            Parameters:
+                kind (str): The node kind of the host.
+                host (str): The name of the host.
+
+            Returns:
+                bool: True if the host matches one of the patterns, or if the node kind has none.
+            """
+            patterns = self.limit_patterns.get(kind)
+            return not patterns or any(fnmatch.fnmatchcase(host.strip(), pattern) for pattern in patterns)
+
+        def get_node_attributes(self, node_kind: str, node_options: Optional[Dict[str, Any]] = None) -> List[str]:
+            """
+            Build the attributes/relationships to resolve for a node kind, based on its include and exclude options.
+
+            Parameters:
+                node_kind (str): The node kind.
+                node_options (Optional[Dict[str, Any]]): The options of the node kind (include, exclude, filters).
+
+            Returns:
+                List[str]: The attributes/relationships to resolve.
+            """
+            node_options = node_options or {}
+            include = node_options.get("include", None)
+            exclude = node_options.get("exclude", None)
+            lazy = self.lazy_relationships.get(node_kind)
+            if lazy:
+                include = [attr for attr in include or [] if attr not in lazy]
+                exclude = list(exclude or []) + list(lazy)
+            return include if include else self.get_attributes_for_schema(self.get_schema(kind=node_kind), exclude)
+
+        def set_lazy_relationships(self, result: Dict[str, Any], kind: str) -> None:
+            """
+            Tell the vars plugin which relationships of a host node it has to load on demand.
+
+            Parameters:
+                result (Dict[str, Any]): The processed host node attributes.
+                kind (str): The kind of the host node.
+            """
+            if kind in self.lazy_relationships:
+                result[LAZY_RELATIONSHIPS_VARIABLE] = {
+                    "kind": kind,
+                    "api_endpoint": self.client.client.address,
+                    "token": register_lazy_token(self.client.client.config.api_token),
+                    "branch": self.client.client.default_branch,
+                    "relationships": list(self.lazy_relationships[kind]),
+                }
+
+        @staticmethod
+        def get_relationship_depths(nodes: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+            """
+            Build the depth of the relationships overriding max_depth, from the max_depth_by_relationship node option.
+
+            Parameters:
+                nodes (Dict[str, Any]): A dictionary of node kind, options (include, exclude, filters...).
+
+            Returns:
+                Dict[str, Dict[str, int]]: A dictionary of Node Kind name, depth by relationship name.
+            """
+            return {
+                node_kind: {attr: int(depth) for attr, depth in node_options["max_depth_by_relationship"].items()}
+                for node_kind, node_options in nodes.items()
+                if node_options and node_options.get("max_depth_by_relationship")
+            }
+
+        def process_nodes(
+            self,
+            nodes: List[InfrahubNodeSync],
+            attrs_by_kind: Dict[str, List[str]],
+            depths_by_kind: Optional[Dict[str, Dict[str, int]]] = None,
+        ) -> Dict[str, Dict[str, Any]]:
+            """
+            Resolve the attributes and relationships of the host nodes, the peers being loaded beforehand.
+
+            Parameters:
+                nodes (List[InfrahubNodeSync]): The host nodes.
+                attrs_by_kind (Dict[str, List[str]]): A dictionary of Node Kind name, attributes/relationships to resolve.
+                depths_by_kind (Optional[Dict[str, Dict[str, int]]]): A dictionary of Node Kind name, depth of some
+                    relationships overriding max_depth.
+
+            Returns:
+                Dict[str, Dict[str, Any]]: A dictionary with processed host node attributes.
+            """
+            if self.limit_patterns:
+                nodes = [node for node in nodes if self.match_limit(kind=node._schema.kind, host=str(node))]
+            # Only the peers referenced by the host nodes are loaded, not every node of the related kinds
+            metrics = self.client.metrics
+            with metrics.phase("peers"):
+                self.prefetch_peers(nodes=nodes, attrs_by_kind=attrs_by_kind, depths_by_kind=depths_by_kind)
+
+            depths_by_kind = depths_by_kind or {}
+            host_node_attributes = {}
+            with metrics.phase("resolve"):
+                for host_node in nodes:
+                    result = self.resolve_node_mapping(
+                        node=host_node,
+                        attrs=attrs_by_kind[host_node._schema.kind],
+                        schemas=self.schemas,
+                        depths=depths_by_kind.get(host_node._schema.kind),
+                    )
+                    if result:
+                        result["id"] = host_node.id
+                        self.set_lazy_relationships(result=result, kind=host_node._schema.kind)
+                        host_node_attributes[str(host_node)] = result
+            if metrics.enabled:
+                for kind, count in Counter(node._schema.kind for node in nodes).items():
+                    metrics.record_nodes(kind=kind, count=count)
+            return host_node_attributes
+
+        def process_lean_nodes(
+            self,
+            nodes: List[Dict[str, Any]],
+            attrs_by_kind: Dict[str, List[str]],
+            depths_by_kind: Optional[Dict[str, Dict[str, int]]] = None,
+        ) -> Dict[str, Dict[str, Any]]:
+            """
+            Same as process_nodes, for host nodes fetched in lean mode as plain dicts.
+
+            Parameters:
+                nodes (List[Dict[str, Any]]): The host nodes.
+                attrs_by_kind (Dict[str, List[str]]): A dictionary of Node Kind name, attributes/relationships to resolve.
+                depths_by_kind (Optional[Dict[str, Dict[str, int]]]): A dictionary of Node Kind name, depth of some
+                    relationships overriding max_depth.
+
+            Returns:
+                Dict[str, Dict[str, Any]]: A dictionary with processed host node attributes.
+            """
+            if self.limit_patterns:
+                nodes = [
+                    node
+                    for node in nodes
+                    if self.match_limit(kind=node["__typename"], host=self._lean_host_name(node=node))
+                ]
+            metrics = self.client.metrics
+            with metrics.phase("peers"):
+                self.prefetch_lean_peers(nodes=nodes, attrs_by_kind=attrs_by_kind, depths_by_kind=depths_by_kind)
+
+            depths_by_kind = depths_by_kind or {}
+            host_node_attributes = {}
+            with metrics.phase("resolve"):
+                for host_node in nodes:
+                    kind = host_node["__typename"]
+                    result = self.resolve_lean_mapping(
+                        node=host_node,
+                        attrs=attrs_by_kind[kind],
+                        schema=self.get_schema(kind=kind),
+                        depths=depths_by_kind.get(kind),
+                    )
+                    if result:
+                        result["id"] = host_node["id"]
+                        self.set_lazy_relationships(result=result, kind=kind)
+                        host_node_attributes[self._lean_host_name(node=host_node)] = result
+            if metrics.enabled:
+                for kind, count in Counter(node["__typename"] for node in nodes).items():
+                    metrics.record_nodes(kind=kind, count=count)
+            return host_node_attributes
+
+        @staticmethod
+        def _lean_host_name(node: Dict[str, Any]) -> str:
+            # Same host name as str(InfrahubNodeSync)
+            return node.get("display_label") or f"{node['__typename']} ({node['id']}) "
+
+        def fetch_and_process(self, nodes: List[str], batch_query: bool = False) -> Optional[Dict[str, Any]]:
+            """
+            Fetches schemas and nodes for the given node kinds using the Infrahub client wrapper,
+            then processes and maps these nodes to their corresponding attributes.
+
+            Parameters:
+                nodes (List[str]): A list of node kinds to fetch and process.
+                batch_query (bool): Fetch all the node kinds with a single GraphQL query per page.
+
+            Returns:
+                Optional[Dict[str, Any]]: A dictionary with processed host node attributes, or None if no nodes were processed.
+            """
+            all_nodes: List[InfrahubNodeSync] = []
+            node_attributes_dict = {}
+
+            if not nodes:
+                return None
+            # The whole schema of the branch is loaded with a single request, lookups are then local
+            self.load_schemas()
+            for node_kind in nodes:
+                self.get_schema(kind=node_kind)
+
+            if batch_query:
+                nodes_by_kind = self.client.fetch_nodes_batch(kinds=nodes)
+            else:
+                nodes_by_kind = self.client.fetch_nodes_by_kinds(kinds=nodes)
+
+            for node_kind, nodes_from_kind in nodes_by_kind.items():
+                if not nodes_from_kind:
+                    continue
+                node_attributes_dict[node_kind] = self.get_node_attributes(node_kind, nodes.get(node_kind))
+                all_nodes.extend(nodes_from_kind)
+
+            if not all_nodes:
+                return None
+
+            return self.process_nodes(
+                nodes=all_nodes, attrs_by_kind=node_attributes_dict, depths_by_kind=self.get_relationship_depths(nodes)
+            )
+
+        def iter_process(self, nodes: Dict[str, Any], batch_query: bool = False) -> Iterator[Dict[str, Any]]:
+            """
+            Fetches and processes the nodes of the given node kinds page by page. The nodes of a page are released once
+            processed and the peers kept in the store are bounded, the memory used doesn't depend on the number of hosts.
+
+            Parameters:
+                nodes (Dict[str, Any]): A dictionary of node kind, options (include, exclude, filters).
+                batch_query (bool): Fetch all the node kinds with a single GraphQL query per page.
+
+            Yields:
+                Dict[str, Any]: A dictionary with the processed host node attributes of one page.
+            """
+            if not nodes:
+                return
+            with self.client.metrics.phase("schema"):
+                self.load_schemas()
+            attrs_by_kind = {
+                node_kind: self.get_node_attributes(node_kind, nodes.get(node_kind)) for node_kind in nodes
+            }
+            depths_by_kind = self.get_relationship_depths(nodes)
+            max_stored_nodes = MAX_STORED_PAGES * self.client.client.pagination_size
+
+            kinds, process = nodes, self.process_nodes
+            if self.client.lean:
+                kinds = {
+                    node_kind: dict(nodes[node_kind] or {}, attrs=attrs) for node_kind, attrs in attrs_by_kind.items()
+                }
+                process = self.process_lean_nodes
+
+            pages = self.client.iter_nodes_pages(kinds=kinds, batch_query=batch_query)
+            while True:
+                # The pages are fetched lazily, the time spent waiting for them is accounted separately
+                with self.client.metrics.phase("nodes"):
+                    page = next(pages, None)
+                if page is None:
+                    return
+                if page:
+                    yield process(nodes=page, attrs_by_kind=attrs_by_kind, depths_by_kind=depths_by_kind)
+                # In lean mode the peers aren't in the store, only lean_peers and resolved_peers hold them
+                if (
+                    self.client.release_store(max_size=max_stored_nodes)
+                    or len(self.resolved_peers) > max_stored_nodes
+                    or len(self.lean_peers) > max_stored_nodes
+                ):
+                    self.resolved_peers = {}
+                    self.lean_peers = {}
+
+        def fetch_state(self, nodes: Dict[str, Any]) -> Dict[str, Any]:
+            """
+            Fetches a digest of the host nodes of the given node kinds and of the peers they reference.
+            Stored along with the inventory, the state tells on the next run which hosts need to be processed again.
+
+            Parameters:
+                nodes (Dict[str, Any]): A dictionary of node kind, options (include, exclude, filters).
+
+            Returns:
+                Dict[str, Any]: The digests of the host nodes ("nodes") and of their peers ("peers"), by node id.
+            """
+            with self.client.metrics.phase("schema"):
+                self.load_schemas()
+            kinds = {
+                node_kind: {
+                    "attrs": self.get_node_attributes(node_kind, node_options),
+                    "filters": (node_options or {}).get("filters"),
+                }
+                for node_kind, node_options in nodes.items()
+            }
+            state: Dict[str, Any] = {"nodes": {}, "peers": {}}
+            peer_ids: Dict[str, Set[str]] = defaultdict(set)
+            with self.client.metrics.phase("state"):
+                digests_by_kind = self.client.fetch_nodes_digests(kinds=kinds)
+            for node_kind, digests in digests_by_kind.items():
+                for node_id, digest in digests.items():
+                    state["nodes"][node_id] = dict(digest, kind=node_kind)
+                    for peer_kind, ids in digest["peers"].items():
+                        peer_ids[peer_kind].update(ids)
+
+            # The peers are resolved with their attributes only at the default max_depth, see resolve_peer
+            peer_kinds = {
+                peer_kind: {"attrs": self.get_schema(kind=peer_kind).attribute_names, "ids": sorted(ids)}
+                for peer_kind, ids in peer_ids.items()
+            }
+            with self.client.metrics.phase("state"):
+                peer_digests_by_kind = self.client.fetch_nodes_digests(kinds=peer_kinds)
+            for digests in peer_digests_by_kind.values():
+                for peer_id, digest in digests.items():
+                    state["peers"][peer_id] = digest["digest"]
+            return state
+
+        def refresh_and_process(
+            self, nodes: Dict[str, Any], host_node_attributes: Dict[str, Any], state: Dict[str, Any]
+        ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+            """
+            Refresh previously processed host nodes, only the hosts which have been added or updated since the state
+            was fetched, or which reference an updated peer, are fetched and processed again.
+            The hosts which don't exist anymore, or don't match the filters anymore, are removed.
+
+            Parameters:
+                nodes (Dict[str, Any]): A dictionary of node kind, options (include, exclude, filters).
+                host_node_attributes (Dict[str, Any]): The host node attributes processed previously.
+                state (Dict[str, Any]): The state fetched along with the host node attributes, see fetch_state.
+
+            Returns:
+                Tuple[Dict[str, Any], Dict[str, Any]]: The refreshed host node attributes and the new state.
+            """
+            new_state = self.fetch_state(nodes=nodes)
+            changed_peers = {
+                peer_id for peer_id, digest in new_state["peers"].items() if state["peers"].get(peer_id) != digest
+            }
+
+            changed_ids_by_kind: Dict[str, List[str]] = defaultdict(list)
+            for node_id, node_state in new_state["nodes"].items():
+                previous = state["nodes"].get(node_id)
+                if (
+                    not previous
+                    or previous["digest"] != node_state["digest"]
+                    or any(peer_id in changed_peers for ids in node_state["peers"].values() for peer_id in ids)
+                ):
+                    changed_ids_by_kind[node_state["kind"]].append(node_id)
+
+            outdated_ids = {node_id for node_id in state["nodes"] if node_id not in new_state["nodes"]}
+            outdated_ids.update(node_id for ids in changed_ids_by_kind.values() for node_id in ids)
+            refreshed = {
+                host: attributes
+                for host, attributes in host_node_attributes.items()
+                if attributes.get("id") not in outdated_ids
+            }
+
+            if changed_ids_by_kind:
+                attrs_by_kind = {
+                    node_kind: self.get_node_attributes(node_kind, nodes.get(node_kind))
+                    for node_kind in changed_ids_by_kind
+                }
+                options = {
+                    node_kind: dict(nodes.get(node_kind) or {}, attrs=attrs)
+                    for node_kind, attrs in attrs_by_kind.items()
+                }
+                with self.client.metrics.phase("nodes"):
+                    nodes_by_kind = self.client.fetch_nodes_by_ids(ids_by_kind=changed_ids_by_kind, options=options)
+                all_nodes = [node for nodes_from_kind in nodes_by_kind.values() for node in nodes_from_kind]
+                process = self.process_lean_nodes if self.client.lean else self.process_nodes
+                refreshed.update(
+                    process(
+                        nodes=all_nodes,
+                        attrs_by_kind=attrs_by_kind,
+                        depths_by_kind=self.get_relationship_depths(nodes),
+                    )
+                )
+
+            return refreshed, new_state
+
+    class QueryNamespaceVisitor(Visitor):
+        """
+        Prefix the variables and the fragments of a GraphQL document, so that it can be merged with other documents.
+        """
+
+        def __init__(self, prefix: str):
+            super().__init__()
+            self.prefix = prefix
+
+        def leave_variable(self, node: VariableNode, *args: Any) -> VariableNode:
+            return VariableNode(name=NameNode(value=f"{self.prefix}{node.name.value}"))
+
+        def leave_fragment_spread(self, node: Any, *args: Any) -> Any:
+            return self._rename(node)
+
+        def leave_fragment_definition(self, node: FragmentDefinitionNode, *args: Any) -> FragmentDefinitionNode:
+            return self._rename(node)
+
+        def _rename(self, node: Any) -> Any:
+            renamed = copy.copy(node)
+            renamed.name = NameNode(value=f"{self.prefix}{node.name.value}")
+            return renamed
+
+    class InfrahubQueryProcessor(InfrahubBaseProcessor):
+        def __init__(
+            self,
+            client: InfrahubclientWrapper,
+            max_depth: int = 1,
+            result_cache: Optional[InfrahubResultCache] = None,
+        ):
+            """
+            Initializes InfrahubQueryProcessor.
+
+            Parameters:
+                client (InfrahubclientWrapper): The client used to send the queries.
+                max_depth (int): See InfrahubBaseProcessor.
+                result_cache (Optional[InfrahubResultCache]): Reuse the results of the identical queries, by endpoint,
+                    token, branch, normalized query and variables, see get_result_cache. The mutations are never cached.
+            """
+            super().__init__(client=client, max_depth=max_depth)
+            self.result_cache = result_cache
+
+        def _get_result_key(self, query: str, variables: Optional[Dict[str, Any]]) -> Optional[str]:
+            """
+            Build the key of a query in the result cache.
+
+            Parameters:
+                query (str): A GraphQL formatted query string
+                variables (Optional[Dict[str, Any]]): The variables of the query
+
+            Returns:
+                Optional[str]: The key, or None if the cache is disabled or the query isn't read-only.
+            """
+            if self.result_cache is None:
+                return None
+            try:
+                document = parse(query)
+            except GraphQLError:
+                # Left to the server to report
+                return None
+            if any(
+                isinstance(item, OperationDefinitionNode) and item.operation != OperationType.QUERY
+                for item in document.definitions
+            ):
+                return None
+            return self.result_cache.get_key(
+                api_endpoint=self.client.client.address,
+                token=self.client.client.config.api_token,
+                branch=self.client.client.default_branch,
+                query=print_ast(document),
+                variables=variables,
+            )
+
+        def _execute_cached(self, query: str, variables: Optional[Dict[str, Any]]) -> List[Any]:
+            """
+            Execute a query and collect its edges, or reuse the edges of the identical query from the result cache.
+            """
+            key = self._get_result_key(query=query, variables=variables)
+            if key is not None:
+                try:
+                    return self.result_cache.get(key)
+                except KeyError:
+                    pass
+            results = self._collect_edges(response=self.client.execute_graphql(query=query, variables=variables))
+            if key is not None:
+                self.result_cache.set(key, results)
+            return results
+
+        def fetch_and_process(
+            self, query: Union[dict, str], variables: Optional[Dict[str, Any]] = None
+        ) -> Optional[Dict[str, Any]]:
+            """
+            Fetches nodes for the given GraphQl query using the Infrahub client wrapper,
+            then processes and maps these nodes to their corresponding attributes.
 
             Parameters:
                 query (str): A GraphQL formatted query string
@@ -491,7 +2701,6 @@ if HAS_INFRAHUBCLIENT:
             if not query:
                 return None
 
-            results = []
             if isinstance(query, Dict):
                 query_str = self.client._render_query(query=query, variables=variables)
             elif isinstance(query, str):
@@ -502,19 +2711,173 @@ if HAS_INFRAHUBCLIENT:
             else:
                 raise Exception("query is neither a string nor a Dict")
 
-            response = self.client.execute_graphql(query=query_str, variables=variables)
+            return self._execute_cached(query=query_str, variables=variables)
+
+        @staticmethod
+        def _collect_edges(response: Dict[str, Any]) -> List[Any]:
+            results = []
             for kind in response:
                 if response[kind]["edges"]:
                     results += response[kind]["edges"]
             return results
 
+        @staticmethod
+        def _namespace_query(
+            query: str, variables: Optional[Dict[str, Any]], prefix: str
+        ) -> Optional[Tuple[OperationDefinitionNode, List[Any], Dict[str, Any]]]:
+            """
+            Prefix the root fields (with an alias), the variables and the fragments of a GraphQL query.
+
+            Parameters:
+                query (str): A GraphQL formatted query string
+                variables (Optional[Dict[str, Any]]): The variables of the query
+                prefix (str): The prefix, a valid GraphQL name
+
+            Returns:
+                Optional[Tuple[OperationDefinitionNode, List[Any], Dict[str, Any]]]: The query operation, its fragments
+                    and the variables it declares, or None if the document can't be merged with others: a mutation,
+                    several operations, root fragments or an invalid document.
+            """
+            try:
+                document = visit(parse(query), QueryNamespaceVisitor(prefix=prefix))
+            except GraphQLError:
+                # Sent on its own, left to the server to report
+                return None
+            operations = [item for item in document.definitions if isinstance(item, OperationDefinitionNode)]
+            if len(operations) != 1 or operations[0].operation != OperationType.QUERY:
+                return None
+            operation = operations[0]
+            if not all(isinstance(selection, FieldNode) for selection in operation.selection_set.selections):
+                return None
+
+            fields = []
+            for field in operation.selection_set.selections:
+                aliased = copy.copy(field)
+                aliased.alias = NameNode(value=f"{prefix}{(field.alias or field.name).value}")
+                fields.append(aliased)
+            operation = copy.copy(operation)
+            operation.selection_set = SelectionSetNode(selections=tuple(fields))
+            fragments = [item for item in document.definitions if isinstance(item, FragmentDefinitionNode)]
+            declared = {definition.variable.name.value for definition in operation.variable_definitions or ()}
+            prefixed_variables = {
+                f"{prefix}{name}": value for name, value in (variables or {}).items() if f"{prefix}{name}" in declared
+            }
+            return operation, fragments, prefixed_variables
+
+        def fetch_and_process_many(
+            self, queries: List[Tuple[Union[dict, str], Optional[Dict[str, Any]]]]
+        ) -> List[List[Any]]:
+            """
+            Fetches the results of several GraphQL queries with a single request. The queries are merged into one
+            document, the root fields, the variables and the fragments of the query at index N being prefixed with
+            "qN_", and the response is split back per query. The queries which can't be merged are sent on their own,
+            after the queries which precede them, so that the queries are run in order. The queries found in the result
+            cache aren't sent.
+
+            Parameters:
+                queries (List[Tuple[Union[dict, str], Optional[Dict[str, Any]]]]): List of query (a GraphQL formatted
+                    query string, or a Dict), variables
+
+            Returns:
+                List[List[Any]]: The edges returned for each query, in the same order as the queries
+            """
+            results: List[List[Any]] = [[] for _ in queries]
+            merged: Dict[int, Tuple[OperationDefinitionNode, List[Any], Dict[str, Any]]] = {}
+            result_keys: Dict[int, Optional[str]] = {}
+            for idx, (query, variables) in enumerate(queries):
+                if isinstance(query, Dict):
+                    query_str = self.client._render_query(query=query, variables=variables)
+                elif isinstance(query, str):
+                    query_str = query
+                else:
+                    raise Exception("query is neither a string nor a Dict")
+
+                result_keys[idx] = self._get_result_key(query=query_str, variables=variables)
+                if result_keys[idx] is not None:
+                    try:
+                        results[idx] = self.result_cache.get(result_keys[idx])
+                        continue
+                    except KeyError:
+                        pass
+                namespaced = self._namespace_query(query=query_str, variables=variables, prefix=f"q{idx}_")
+                if namespaced is None:
+                    self._flush_merged(queries=merged, result_keys=result_keys, results=results)
+                    results[idx] = self._execute_cached(query=query_str, variables=variables)
+                else:
+                    merged[idx] = namespaced
+
+            self._flush_merged(queries=merged, result_keys=result_keys, results=results)
+            return results
+
+        def _flush_merged(
+            self,
+            queries: Dict[int, Tuple[OperationDefinitionNode, List[Any], Dict[str, Any]]],
+            result_keys: Dict[int, Optional[str]],
+            results: List[List[Any]],
+        ) -> None:
+            """
+            Execute the queries merged so far, if any, store their edges in results and in the result cache, then
+            empty queries.
+            """
+            if not queries:
+                return
+            for idx, response in self._execute_merged(queries=queries).items():
+                results[idx] = self._collect_edges(response=response)
+                if result_keys[idx] is not None:
+                    self.result_cache.set(result_keys[idx], results[idx])
+            queries.clear()
+
+        def _execute_merged(
+            self, queries: Dict[int, Tuple[OperationDefinitionNode, List[Any], Dict[str, Any]]]
+        ) -> Dict[int, Dict[str, Any]]:
+            """
+            Execute the queries prefixed by _namespace_query as a single document, and split the response per query.
+
+            Parameters:
+                queries (Dict[int, Tuple[OperationDefinitionNode, List[Any], Dict[str, Any]]]): Dict of index of the
+                    query, (operation, fragments, variables) as returned by _namespace_query
+
+            Returns:
+                Dict[int, Dict[str, Any]]: Dict of index of the query, response with the names of the query
+            """
+            variable_definitions: List[Any] = []
+            fields: List[Any] = []
+            fragments: List[Any] = []
+            variables: Dict[str, Any] = {}
+            # alias of a root field: index of the query, name of the field in the query
+            aliases: Dict[str, Tuple[int, str]] = {}
+            for idx, (operation, query_fragments, query_variables) in queries.items():
+                variable_definitions.extend(operation.variable_definitions or ())
+                fields.extend(operation.selection_set.selections)
+                fragments.extend(query_fragments)
+                variables.update(query_variables)
+                for field in operation.selection_set.selections:
+                    aliases[field.alias.value] = (idx, field.alias.value[len(f"q{idx}_") :])
+
+            operation = OperationDefinitionNode(
+                operation=OperationType.QUERY,
+                variable_definitions=tuple(variable_definitions),
+                directives=(),
+                selection_set=SelectionSetNode(selections=tuple(fields)),
+            )
+            document = DocumentNode(definitions=(operation, *fragments))
+            response = self.client.execute_graphql(query=print_ast(document), variables=variables or None)
+            responses: Dict[int, Dict[str, Any]] = {idx: {} for idx in queries}
+            for alias, value in response.items():
+                idx, name = aliases[alias]
+                responses[idx][name] = value
+            return responses
+
 
 if not HAS_INFRAHUBCLIENT:
 
-    class InfrahubclientWrapper:
+    class InfrahubclientWrapper:  # noqa: PLR0904
+        pass
+
+    class InfrahubclientWrapper:  # noqa: PLR0904
         pass
 
-    class InfrahubclientWrapper:
+    class InfrahubclientAsyncWrapper:
         pass
 
     class InfrahubNodesProcessor:
@@ -522,3 +2885,9 @@ if not HAS_INFRAHUBCLIENT:
 
     class InfrahubQueryProcessor:
         pass
+
+    def get_shared_client(*args, **kwargs):
+        pass
+
+    def close_shared_clients():
+        pass
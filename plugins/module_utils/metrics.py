@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+METRICS_REPORT_VERSION = 1
+
+
+class InfrahubMetrics:
+    """
+    Collects the wall time, the number of requests, the bytes received and the number of nodes of each phase
+    (schema, nodes, peers...) and of each node kind.
+
+    The time of a phase excludes the time of the phases nested in it. The requests are attributed to the phase
+    running when they are sent, including the requests sent concurrently by other threads.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Initializes InfrahubMetrics.
+
+        Parameters:
+            enabled (bool): Collect the metrics. Nothing is recorded if False.
+        """
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stack: List[List[Any]] = []
+        self.phases: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"time": 0.0, "requests": 0, "bytes": 0})
+        self.kinds: Dict[str, Dict[str, int]] = defaultdict(lambda: {"requests": 0, "bytes": 0, "nodes": 0})
+        self._kind_names: Dict[str, str] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Attribute the time spent, and the requests sent, in the block to a phase.
+
+        Parameters:
+            name (str): Name of the phase.
+        """
+        if not self.enabled:
+            yield
+            return
+        # name, start time, time spent in the nested phases
+        current = [name, time.perf_counter(), 0.0]
+        self._stack.append(current)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - current[1]
+            self.phases[name]["time"] += elapsed - current[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def record_request(self, size: int, tracker: Optional[str] = None) -> None:
+        """
+        Record a request and the size of its response.
+
+        Parameters:
+            size (int): Number of bytes received.
+            tracker (Optional[str]): Tracker of the query, giving its node kind.
+        """
+        if not self.enabled:
+            return
+        phase = self._stack[-1][0] if self._stack else "other"
+        with self._lock:
+            self.phases[phase]["requests"] += 1
+            self.phases[phase]["bytes"] += size
+            # e.g. "query-infradevice-offset0", the batch queries and the other requests have no kind
+            if tracker and tracker.count("-") > 1:
+                kind = tracker.split("-", 2)[1]
+                if kind != "batch":
+                    self.kinds[kind]["requests"] += 1
+                    self.kinds[kind]["bytes"] += size
+
+    def record_nodes(self, kind: str, count: int) -> None:
+        """
+        Record the nodes fetched for a node kind, host nodes or peers.
+
+        Parameters:
+            kind (str): The node kind.
+            count (int): Number of nodes.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._kind_names[kind.lower()] = kind
+            self.kinds[kind.lower()]["nodes"] += count
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Build the report of the metrics collected so far.
+
+        Returns:
+            Dict[str, Any]: The total time and, for each phase and each node kind, the time, the number of requests,
+                the bytes received and the number of nodes. The kinds are lowercased when only known from a tracker.
+        """
+        return {
+            "version": METRICS_REPORT_VERSION,
+            "timestamp": self.started_at,
+            "total_time": round(time.perf_counter() - self._start, 6),
+            "total_requests": sum(phase["requests"] for phase in self.phases.values()),
+            "total_bytes": sum(phase["bytes"] for phase in self.phases.values()),
+            "phases": {name: dict(phase, time=round(phase["time"], 6)) for name, phase in self.phases.items()},
+            "kinds": {self._kind_names.get(kind, kind): dict(stats) for kind, stats in self.kinds.items()},
+        }
+
+    def summary(self) -> List[str]:
+        """
+        Build a human readable summary of the metrics collected so far.
+
+        Returns:
+            List[str]: One line for the total, one for each phase and one for each node kind.
+        """
+        report = self.report()
+        lines = [
+            f"Total: {report['total_time']:.3f}s, {report['total_requests']} requests, "
+            f"{report['total_bytes'] / 1024:.1f} KiB"
+        ]
+        for name, phase in report["phases"].items():
+            lines.append(
+                f"Phase {name}: {phase['time']:.3f}s, {phase['requests']} requests, {phase['bytes'] / 1024:.1f} KiB"
+            )
+        for kind, stats in report["kinds"].items():
+            lines.append(
+                f"Kind {kind}: {stats['nodes']} nodes, {stats['requests']} requests, {stats['bytes'] / 1024:.1f} KiB"
+            )
+        return lines
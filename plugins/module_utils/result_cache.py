@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Cache of the results of the read-only GraphQL queries, shared by the lookups and the query_graphql actions.
+
+The results are kept in memory, the most recently used first, and optionally on disk so that the forks of the
+controller share them. An entry expires ttl seconds after it has been written, the age of a file being given by its
+modification time.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from ansible_collections.opsmill.infrahub.plugins.module_utils.cache_utils import (
+    decode_cache_payload,
+    encode_cache_payload,
+)
+
+# Number of results kept in memory by each process
+MAX_MEMORY_ENTRIES = 1000
+# Maximum size of the results kept on disk, in MiB
+DEFAULT_MAX_SIZE = 100
+RESULT_FILE_PREFIX = "result-"
+# Caches shared by the plugins running in the same process, see get_result_cache
+RESULT_CACHES: Dict[Tuple[Any, ...], "InfrahubResultCache"] = {}
+RESULT_CACHES_LOCK = threading.Lock()
+
+
+class InfrahubResultCache:
+    """
+    Two tiers cache of query results, by key: a LRU cache in memory, and files in a directory.
+    """
+
+    def __init__(
+        self,
+        ttl: int,
+        cache_dir: Optional[str] = None,
+        max_size: int = DEFAULT_MAX_SIZE,
+        max_entries: int = MAX_MEMORY_ENTRIES,
+    ):
+        """
+        Initializes InfrahubResultCache.
+
+        Parameters:
+            ttl (int): Seconds during which a result is reused.
+            cache_dir (Optional[str]): Directory where the results are shared between processes. Memory only if None.
+            max_size (int): Maximum size of the results kept in cache_dir, in MiB. The oldest are removed first.
+            max_entries (int): Maximum number of results kept in memory. The least recently used are removed first.
+        """
+        self.ttl = ttl
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.max_size = max_size * 1024 * 1024
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key: expiration time, result
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    @staticmethod
+    def get_key(
+        api_endpoint: str, token: str, branch: str, query: str, variables: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Build the key of a query, the results of different users are never shared.
+
+        Parameters:
+            api_endpoint (str): API endpoint of Infrahub.
+            token (str): Infrahub API token.
+            branch (str): Branch in which the query is made.
+            query (str): The GraphQL query, normalized.
+            variables (Optional[Dict[str, Any]]): The variables of the query.
+
+        Returns:
+            str: The key.
+        """
+        data = [api_endpoint, hashlib.sha256((token or "").encode()).hexdigest(), branch, query, variables or {}]
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{RESULT_FILE_PREFIX}{key}")
+
+    def get(self, key: str) -> Any:
+        """
+        Return the result of a query, from memory or else from the disk.
+
+        Parameters:
+            key (str): The key of the query, see get_key.
+
+        Returns:
+            Any: A copy of the result.
+
+        Raises:
+            KeyError: If the result isn't cached or has expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return copy.deepcopy(entry[1])
+            self._entries.pop(key, None)
+        if not self.cache_dir:
+            raise KeyError(key)
+
+        try:
+            path = self._path(key)
+            expires_at = os.stat(path).st_mtime + self.ttl
+            if expires_at <= now:
+                raise KeyError(key)
+            with open(path, encoding="utf-8") as cache_file:
+                result = decode_cache_payload(cache_file.read())
+        except (OSError, ValueError) as exc:
+            raise KeyError(key) from exc
+        self._remember(key=key, expires_at=expires_at, result=result)
+        return copy.deepcopy(result)
+
+    def set(self, key: str, result: Any) -> None:
+        """
+        Store the result of a query, in memory and on the disk.
+
+        Parameters:
+            key (str): The key of the query, see get_key.
+            result (Any): The result, serializable to JSON.
+        """
+        self._remember(key=key, expires_at=time.time() + self.ttl, result=copy.deepcopy(result))
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as cache_file:
+                cache_file.write(encode_cache_payload(result, compact=True))
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except (OSError, TypeError, ValueError):
+            # The cache is an optimization only, the result has been fetched anyway
+            pass
+
+    def _remember(self, key: str, expires_at: float, result: Any) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict(self) -> None:
+        """
+        Remove the expired results from cache_dir, then the oldest ones until its size is below max_size.
+        """
+        now = time.time()
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.name.startswith(RESULT_FILE_PREFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if mtime + self.ttl > now and total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                # Already removed by another process
+                pass
+            total_size -= size
+
+
+def get_result_cache(
+    ttl: Optional[int], cache_dir: Optional[str] = None, max_size: Optional[int] = None
+) -> Optional[InfrahubResultCache]:
+    """
+    Return the result cache shared by the plugins running in the current process for the same options,
+    created on first use.
+
+    Parameters:
+        ttl (Optional[int]): Seconds during which a result is reused. The cache is disabled if not set or 0.
+        cache_dir (Optional[str]): Directory where the results are shared between processes. Memory only if None.
+        max_size (Optional[int]): Maximum size of the results kept in cache_dir, in MiB. DEFAULT_MAX_SIZE if None.
+
+    Returns:
+        Optional[InfrahubResultCache]: The shared cache, or None if disabled.
+
+    Raises:
+        ValueError: If max_size isn't a positive number.
+    """
+    if not ttl or int(ttl) <= 0:
+        return None
+    max_size = DEFAULT_MAX_SIZE if max_size is None else int(max_size)
+    if max_size <= 0:
+        raise ValueError(f"The maximum size of the result cache must be a positive number of MiB, got {max_size}")
+    key = (int(ttl), cache_dir, max_size)
+    with RESULT_CACHES_LOCK:
+        if key not in RESULT_CACHES:
+            RESULT_CACHES[key] = InfrahubResultCache(ttl=key[0], cache_dir=cache_dir, max_size=key[2])
+        return RESULT_CACHES[key]
@@ -50,6 +50,25 @@ options:
             - Branch in which the request is made
         type: str
         default: main
+    schema_cache_dir:
+        required: False
+        description:
+            - Directory where the schema of the branch is persisted between runs, optional env=INFRAHUB_SCHEMA_CACHE_DIR
+            - The schema is downloaded again only when its hash on the Infrahub server has changed.
+        type: str
+    broker_socket:
+        required: False
+        description:
+            - Path of the unix socket of a local broker sharing the connections to Infrahub, and the responses of the
+              identical queries, between the forks of the controller, optional env=INFRAHUB_BROKER_SOCKET
+            - The broker is started on demand and exits once idle. Disabled when not set.
+        type: str
+    use_async:
+        required: False
+        description:
+            - Send the requests through the async client of the Infrahub SDK, optional env=INFRAHUB_USE_ASYNC
+        type: bool
+        default: False
     validate_certs:
         description:
             - Whether or not to validate SSL of the Infrahub instance
@@ -108,7 +127,10 @@ def main():
             token=dict(required=False, type="str", no_log=True, default=None),
             timeout=dict(required=False, type="int", default=10),
             validate_certs=dict(required=False, type="bool", default=True),
+            broker_socket=dict(required=False, type="str", default=None),
+            use_async=dict(required=False, type="bool", default=False),
             branch=dict(required=False, type="str", default="main"),
+            schema_cache_dir=dict(required=False, type="str", default=None),
             artifact_name=dict(required=True, type="str"),
             target_id=dict(required=True, type="str"),
         ),
@@ -51,6 +51,40 @@ options:
             - Branch in which the request is made
         type: str
         default: main
+    broker_socket:
+        required: False
+        description:
+            - Path of the unix socket of a local broker sharing the connections to Infrahub, and the responses of the
+              identical queries, between the forks of the controller, optional env=INFRAHUB_BROKER_SOCKET
+            - The broker is started on demand and exits once idle. Disabled when not set.
+        type: str
+    use_async:
+        required: False
+        description:
+            - Send the requests through the async client of the Infrahub SDK, optional env=INFRAHUB_USE_ASYNC
+        type: bool
+        default: False
+    result_cache_ttl:
+        required: False
+        description:
+            - Seconds during which the results of the identical queries are reused, optional
+              env=INFRAHUB_RESULT_CACHE_TTL. Disabled when 0.
+            - The results are cached by endpoint, token, branch, query and variables. The mutations are never cached.
+        type: int
+        default: 0
+    result_cache_dir:
+        required: False
+        description:
+            - Directory where the cached results are shared between the forks of the controller, optional
+              env=INFRAHUB_RESULT_CACHE_DIR. Memory only when not set.
+        type: str
+    result_cache_max_size:
+        required: False
+        description:
+            - Maximum size of the results kept in O(result_cache_dir), in MiB, optional
+              env=INFRAHUB_RESULT_CACHE_MAX_SIZE. The oldest results are removed first. Must be positive.
+        type: int
+        default: 100
     validate_certs:
         description:
             - Whether or not to validate SSL of the Infrahub instance
@@ -122,6 +156,11 @@ def main():
             token=dict(required=False, type="str", no_log=True, default=None),
             timeout=dict(required=False, type="int", default=10),
             validate_certs=dict(required=False, type="bool", default=True),
+            broker_socket=dict(required=False, type="str", default=None),
+            use_async=dict(required=False, type="bool", default=False),
+            result_cache_ttl=dict(required=False, type="int", default=0),
+            result_cache_dir=dict(required=False, type="str", default=None),
+            result_cache_max_size=dict(required=False, type="int", default=100),
             branch=dict(required=False, type="str", default="main"),
             query=dict(required=True, type="str"),
             graph_variables=dict(required=False, type="dict", default={}),
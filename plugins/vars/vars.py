@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+DOCUMENTATION = """
+    name: vars
+    short_description: Loads on demand the relationships of the Infrahub hosts left out of the inventory
+    description:
+        - Companion of the opsmill.infrahub.inventory plugin, loading the relationships listed in its
+          lazy_relationships node option, only for the hosts used by a play.
+        - The relationships of a host are fetched along with the ones of the other hosts of its smallest group
+          which aren't loaded yet, with one query per node kind, so that the hosts of a play are loaded in a few
+          batches.
+        - The relationships loaded are kept for the rest of the run, and in a cache plugin if O(cache) is enabled.
+        - Must be enabled with the vars_plugins_enabled setting, e.g. C(ANSIBLE_VARS_ENABLED=host_group_vars,opsmill.infrahub.vars).
+    options:
+        api_endpoint:
+            description:
+                - Endpoint of the Infrahub API.
+                - Used for the hosts of an inventory which doesn't set it, the endpoint of the inventory is used
+                  otherwise.
+            required: False
+            env:
+                - name: INFRAHUB_ADDRESS
+            ini:
+                - section: infrahub
+                  key: api_endpoint
+        token:
+            required: False
+            description:
+                - Infrahub API token to be able to read against Infrahub.
+                - Used for the hosts of an inventory which doesn't set it, the token of the inventory is used
+                  otherwise.
+            env:
+                - name: INFRAHUB_API_TOKEN
+        timeout:
+            required: False
+            description: Timeout for Infrahub requests in seconds
+            type: int
+            default: 10
+            env:
+                - name: INFRAHUB_TIMEOUT
+            ini:
+                - section: infrahub
+                  key: timeout
+        batch_size:
+            required: False
+            description:
+                - Maximum number of hosts whose relationships are fetched at once.
+            type: int
+            default: 500
+            env:
+                - name: INFRAHUB_VARS_BATCH_SIZE
+            ini:
+                - section: infrahub
+                  key: vars_batch_size
+        use_async:
+            required: False
+            description:
+                - Send the requests through the async client of the Infrahub SDK.
+            type: bool
+            default: False
+            env:
+                - name: INFRAHUB_USE_ASYNC
+            ini:
+                - section: infrahub
+                  key: use_async
+        stage:
+            description:
+                - Control when this vars plugin may be executed, see the vars_plugin_staging documentation.
+                - Runs only when demanded by a task by default, the relationships aren't loaded by C(ansible-inventory).
+            type: str
+            choices: ['all', 'task', 'inventory']
+            default: task
+            env:
+                - name: INFRAHUB_VARS_STAGE
+            ini:
+                - section: infrahub
+                  key: vars_stage
+        cache:
+            description:
+                - Keep the relationships loaded in a cache plugin, the same as the inventory by default.
+            type: bool
+            default: False
+            env:
+                - name: ANSIBLE_INVENTORY_CACHE
+            ini:
+                - section: inventory
+                  key: cache
+        cache_plugin:
+            description:
+                - Cache plugin to use for the relationships loaded.
+            type: str
+            default: memory
+            env:
+                - name: ANSIBLE_CACHE_PLUGIN
+                - name: ANSIBLE_INVENTORY_CACHE_PLUGIN
+            ini:
+                - section: defaults
+                  key: fact_caching
+                - section: inventory
+                  key: cache_plugin
+        cache_timeout:
+            description:
+                - Cache duration in seconds
+            type: int
+            default: 3600
+            env:
+                - name: ANSIBLE_CACHE_PLUGIN_TIMEOUT
+                - name: ANSIBLE_INVENTORY_CACHE_TIMEOUT
+            ini:
+                - section: defaults
+                  key: fact_caching_timeout
+                - section: inventory
+                  key: cache_timeout
+        cache_connection:
+            description:
+                - Cache connection data or path, read cache plugin documentation for specifics.
+            type: str
+            env:
+                - name: ANSIBLE_CACHE_PLUGIN_CONNECTION
+                - name: ANSIBLE_INVENTORY_CACHE_CONNECTION
+            ini:
+                - section: defaults
+                  key: fact_caching_connection
+                - section: inventory
+                  key: cache_connection
+        cache_prefix:
+            description:
+                - Prefix to use for cache plugin files/tables
+            type: str
+            default: ansible_inventory_
+            env:
+                - name: ANSIBLE_CACHE_PLUGIN_PREFIX
+                - name: ANSIBLE_INVENTORY_CACHE_PLUGIN_PREFIX
+            ini:
+                - section: defaults
+                  key: fact_caching_prefix
+                - section: inventory
+                  key: cache_prefix
+"""
+
+EXAMPLES = """
+# inventory.yml, the interfaces of the devices are left out of the inventory
+plugin: opsmill.infrahub.inventory
+nodes:
+  InfraDevice:
+    include:
+      - name
+      - platform
+    lazy_relationships:
+      - interfaces
+
+# ansible.cfg, the interfaces are loaded only for the devices targeted by the play
+# [defaults]
+# vars_plugins_enabled = host_group_vars,opsmill.infrahub.vars
+"""
+
+import hashlib
+import json
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from ansible.errors import AnsibleError
+from ansible.inventory.host import Host
+from ansible.module_utils.six import raise_from
+from ansible.plugins.loader import cache_loader
+from ansible.plugins.vars import BaseVarsPlugin
+from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
+    HAS_INFRAHUBCLIENT,
+    LAZY_RELATIONSHIPS_VARIABLE,
+    LAZY_TOKENS,
+    InfrahubNodesProcessor,
+    get_shared_client,
+    register_lazy_token,
+)
+
+
+class VarsModule(BaseVarsPlugin):
+    """
+    VarsModule(BaseVarsPlugin) is defined by Ansible
+
+    Parameters:
+        BaseVarsPlugin (BaseVarsPlugin): Ansible Vars Plugin
+    """
+
+    # Shared by the instances created for each host, for the whole run: relationships loaded by cache key,
+    # processors by endpoint, token key and branch
+    _loaded: Dict[str, Dict[str, Any]] = {}
+    _processors: Dict[Tuple[str, str, str], InfrahubNodesProcessor] = {}
+
+    def get_vars(self, loader, path, entities, cache=True):
+        """
+        Return the relationships left out of the inventory for the given hosts, loading them if needed.
+
+        Parameters:
+            loader (DataLoader): Ansible data loader
+            path (str): Path of the inventory source or of the play
+            entities (List[Union[Host, Group]]): The hosts and groups to return the variables of
+            cache (bool): Use the relationships already loaded
+
+        Returns:
+            Dict[str, Any]: The relationships of the hosts, by relationship name
+        """
+        super(VarsModule, self).get_vars(loader, path, entities)
+
+        hosts = [entity for entity in entities if isinstance(entity, Host) and self._get_lazy(entity)]
+        if not hosts:
+            return {}
+        if not HAS_INFRAHUBCLIENT:
+            raise (AnsibleError("infrahub_sdk must be installed to use this plugin"))
+
+        data: Dict[str, Any] = {}
+        for host in hosts:
+            key = self._get_cache_key(host)
+            if not cache or key not in self._loaded:
+                try:
+                    self._load(hosts=self._get_batch(host=host))
+                except AnsibleError:
+                    raise
+                except Exception as exp:
+                    raise_from(AnsibleError(str(exp)), exp)
+            data.update(self._loaded.get(key) or {})
+        return data
+
+    @staticmethod
+    def _get_lazy(host: Host) -> Dict[str, Any]:
+        """
+        Read the relationships to load for a host, set by the inventory plugin.
+        """
+        lazy = host.vars.get(LAZY_RELATIONSHIPS_VARIABLE)
+        return lazy if isinstance(lazy, dict) and host.vars.get("id") else {}
+
+    def _get_source(self, host: Host) -> Tuple[str, str, str]:
+        """
+        Return the endpoint, the token key and the branch the relationships of a host are loaded from: the ones of
+        its inventory, the options of this plugin for the hosts of an inventory which doesn't set them.
+
+        Parameters:
+            host (Host): The host.
+
+        Returns:
+            Tuple[str, str, str]: The endpoint, the token key, see register_lazy_token, and the branch.
+        """
+        lazy = self._get_lazy(host)
+        api_endpoint = lazy.get("api_endpoint") or self.get_option("api_endpoint")
+        if not api_endpoint:
+            raise AnsibleError(f"Unable to load the relationships of {host.name}: api_endpoint isn't set")
+        token_key = lazy.get("token")
+        if token_key not in LAZY_TOKENS:
+            token_key = register_lazy_token(self.get_option("token"))
+        return api_endpoint.strip("/"), token_key, lazy.get("branch") or "main"
+
+    def _get_cache_key(self, host: Host) -> str:
+        """
+        Build the cache key of the relationships of a host, from the endpoint, the token, the branch and the node.
+
+        Parameters:
+            host (Host): The host.
+
+        Returns:
+            str: The cache key.
+        """
+        lazy = self._get_lazy(host)
+        api_endpoint, token_key, branch = self._get_source(host)
+        config = {
+            "api_endpoint": api_endpoint,
+            "token": token_key,
+            "branch": branch,
+            "kind": lazy.get("kind"),
+            "id": host.vars["id"],
+            "relationships": sorted(lazy.get("relationships") or []),
+        }
+        config_hash = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+        return f"infrahub_vars_{config_hash[:32]}"
+
+    def _get_batch(self, host: Host) -> List[Host]:
+        """
+        Select the hosts whose relationships are loaded along with the ones of the given host: the hosts of its
+        smallest group, as the hosts targeted by a play usually share a group.
+
+        Parameters:
+            host (Host): The host whose relationships are requested.
+
+        Returns:
+            List[Host]: The hosts to load, starting with the given one.
+        """
+        batch_size = self.get_option("batch_size")
+        batch = {host.name: host}
+        groups = [group for group in host.get_groups() if group.name not in ("all", "ungrouped")]
+        if not groups:
+            return list(batch.values())
+        for other in min(groups, key=lambda group: len(group.hosts)).get_hosts():
+            if len(batch) >= batch_size:
+                break
+            if other.name not in batch and self._get_lazy(other) and self._get_cache_key(other) not in self._loaded:
+                batch[other.name] = other
+        return list(batch.values())
+
+    def _get_processor(self, api_endpoint: str, token_key: str, branch: str) -> InfrahubNodesProcessor:
+        """
+        Return the processor of an endpoint, token and branch, created once per run.
+        """
+        source = (api_endpoint, token_key, branch)
+        if source not in self._processors:
+            client = get_shared_client(
+                api_endpoint=api_endpoint,
+                token=LAZY_TOKENS[token_key],
+                branch=branch,
+                timeout=self.get_option("timeout"),
+                use_async=self.get_option("use_async"),
+            )
+            processor = InfrahubNodesProcessor(client=client)
+            processor.load_schemas()
+            self._processors[source] = processor
+        return self._processors[source]
+
+    def _load(self, hosts: List[Host]) -> None:
+        """
+        Load the relationships of the given hosts, from the cache plugin if enabled or from Infrahub,
+        with one query per endpoint, token, branch, node kind and set of relationships.
+
+        Parameters:
+            hosts (List[Host]): The hosts to load.
+        """
+        cache_plugin = self._get_cache_plugin()
+        requests: Dict[Tuple[Tuple[str, str, str], str, Tuple[str, ...]], Dict[str, str]] = defaultdict(dict)
+        for host in hosts:
+            key = self._get_cache_key(host)
+            if cache_plugin is not None:
+                try:
+                    self._loaded[key] = cache_plugin.get(key)
+                    continue
+                except KeyError:
+                    pass
+            lazy = self._get_lazy(host)
+            relationships = tuple(lazy.get("relationships") or [])
+            requests[self._get_source(host), lazy["kind"], relationships][host.vars["id"]] = key
+
+        for ((api_endpoint, token_key, branch), kind, relationships), keys_by_id in requests.items():
+            self._display.vvv(f"Loading {', '.join(relationships)} of {len(keys_by_id)} {kind} from {api_endpoint}")
+            processor = self._get_processor(api_endpoint=api_endpoint, token_key=token_key, branch=branch)
+            nodes_by_kind = processor.client.fetch_nodes_by_ids(
+                ids_by_kind={kind: list(keys_by_id)}, options={kind: {"include": list(relationships)}}
+            )
+            host_node_attributes = processor.process_nodes(
+                nodes=nodes_by_kind.get(kind) or [], attrs_by_kind={kind: list(relationships)}
+            )
+            for attributes in host_node_attributes.values():
+                key = keys_by_id[attributes.pop("id")]
+                self._loaded[key] = attributes
+                if cache_plugin is not None:
+                    cache_plugin.set(key, attributes)
+            # The nodes which don't exist anymore have no relationships
+            for key in keys_by_id.values():
+                self._loaded.setdefault(key, {})
+
+    def _get_cache_plugin(self):
+        """
+        Load the cache plugin if O(cache) is enabled.
+
+        Returns:
+            Optional[BaseCacheModule]: The cache plugin, None if the cache is disabled.
+        """
+        if not self.get_option("cache"):
+            return None
+        cache_options = {
+            name: self.get_option(option)
+            for name, option in (
+                ("_uri", "cache_connection"),
+                ("_timeout", "cache_timeout"),
+                ("_prefix", "cache_prefix"),
+            )
+            if self.get_option(option) is not None
+        }
+        cache_plugin = cache_loader.get(self.get_option("cache_plugin"), **cache_options)
+        if cache_plugin is None:
+            raise AnsibleError(f"Unable to load the cache plugin {self.get_option('cache_plugin')}")
+        return cache_plugin
@@ -0,0 +1,370 @@
+"""
+Offline benchmarks of the collection against the stub Infrahub server of stub_server.py.
+
+Each scenario runs in its own Python process, against a stub server holding the given number of devices,
+and reports its duration, its throughput, the number of requests and bytes sent by the server, and its peak memory.
+
+Each scenario has a budget of requests for its number of devices, exceeding it fails the run. Given the report of a
+previous run with --baseline, a scenario also fails when it's slower, or uses more memory, than in that report beyond
+the tolerance, or sends more requests.
+
+Usage (from the root of the repository):
+    python tests/performance/benchmark.py
+    python tests/performance/benchmark.py --scales 1000 --scenarios inventory,inventory_lean --output report.json
+    python tests/performance/benchmark.py --scales 1000 --baseline report.json --tolerance 0.5
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.request import urlopen
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from stub_server import StubInfrahub  # noqa: E402
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+TOKEN = "benchmark"  # noqa: S105
+DEVICE_ATTRIBUTES = ["name", "role", "primary_address", "platform", "site", "tags"]
+INVENTORY_CONFIG = """
+plugin: opsmill.infrahub.inventory
+api_endpoint: {endpoint}
+token: {token}
+nodes:
+  InfraDevice:
+    include: {include}
+compose:
+  hostname: name
+  platform: platform.ansible_network_os
+keyed_groups:
+  - prefix: site
+    key: site.name
+"""
+QUERY = """
+query {
+  InfraDevice {
+    edges {
+      node {
+        name { value }
+        role { value }
+        site { node { display_label } }
+        platform { node { ansible_network_os { value } } }
+      }
+    }
+  }
+}
+"""
+# Queries sent together by the lookup, one per site
+SITE_QUERY = 'query { LocationSite(name__value: "site-%d") { edges { node { name { value } } } } }'
+BATCHED_QUERIES = 10
+# Evaluations of the same query, as when a lookup is templated for every task and host
+CACHED_EVALUATIONS = 50
+# The artifacts are fetched one by one, as the artifact_fetch action does
+MAX_ARTIFACTS = 200
+
+
+def _client(endpoint: str, use_async: bool = False, **options: Any) -> Any:
+    from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
+        InfrahubclientAsyncWrapper,
+        InfrahubclientWrapper,
+    )
+
+    wrapper_class = InfrahubclientAsyncWrapper if use_async else InfrahubclientWrapper
+    return wrapper_class(api_endpoint=endpoint, branch="main", token=TOKEN, timeout=60, **options)
+
+
+def run_nodes_processor(endpoint: str, devices: int) -> int:
+    from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import InfrahubNodesProcessor
+
+    processor = InfrahubNodesProcessor(client=_client(endpoint))
+    return len(processor.fetch_and_process(nodes={"InfraDevice": {"include": DEVICE_ATTRIBUTES}}) or {})
+
+
+def _run_inventory(endpoint: str, extra_config: str = "") -> int:
+    from ansible.inventory.data import InventoryData
+    from ansible.parsing.dataloader import DataLoader
+    from ansible.plugins.loader import inventory_loader
+
+    config = INVENTORY_CONFIG.format(endpoint=endpoint, token=TOKEN, include=json.dumps(DEVICE_ATTRIBUTES))
+    with tempfile.NamedTemporaryFile("w", suffix=".yml", delete=False, encoding="utf-8") as config_file:
+        config_file.write(config + extra_config)
+    try:
+        inventory = InventoryData()
+        plugin = inventory_loader.get("opsmill.infrahub.inventory")
+        plugin.parse(inventory, DataLoader(), config_file.name, cache=False)
+    finally:
+        os.unlink(config_file.name)
+    return len(inventory.hosts)
+
+
+def run_inventory(endpoint: str, devices: int) -> int:
+    return _run_inventory(endpoint=endpoint)
+
+
+def run_inventory_lean(endpoint: str, devices: int) -> int:
+    return _run_inventory(endpoint=endpoint, extra_config="lean_query: true\nmax_concurrency: 4\n")
+
+
+def run_inventory_async(endpoint: str, devices: int) -> int:
+    return _run_inventory(endpoint=endpoint, extra_config="use_async: true\nmax_concurrency: 4\n")
+
+
+def run_query_processor(endpoint: str, devices: int, use_async: bool = False) -> int:
+    from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import InfrahubQueryProcessor
+
+    processor = InfrahubQueryProcessor(client=_client(endpoint, use_async=use_async))
+    return len(processor.fetch_and_process(query=QUERY) or [])
+
+
+def run_query_processor_async(endpoint: str, devices: int) -> int:
+    return run_query_processor(endpoint=endpoint, devices=devices, use_async=True)
+
+
+def run_query_processor_batch(endpoint: str, devices: int) -> int:
+    from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import InfrahubQueryProcessor
+
+    processor = InfrahubQueryProcessor(client=_client(endpoint))
+    queries = [(SITE_QUERY % idx, None) for idx in range(BATCHED_QUERIES)]
+    return len(processor.fetch_and_process_many(queries=queries))
+
+
+def run_query_processor_cached(endpoint: str, devices: int) -> int:
+    from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import InfrahubQueryProcessor
+    from ansible_collections.opsmill.infrahub.plugins.module_utils.result_cache import get_result_cache
+
+    client = _client(endpoint)
+    result_cache = get_result_cache(ttl=60)
+    count = 0
+    for _ in range(CACHED_EVALUATIONS):
+        processor = InfrahubQueryProcessor(client=client, result_cache=result_cache)
+        count += len(processor.fetch_and_process(query=QUERY) or [])
+    return count
+
+
+def run_artifact_fetch(endpoint: str, devices: int, use_async: bool = False) -> int:
+    client = _client(endpoint, use_async=use_async)
+    count = min(devices, MAX_ARTIFACTS)
+    for idx in range(count):
+        device = client.fetch_single_node(kind="InfraDevice", filters={"name__value": f"device-{idx:06d}"})
+        client.fetch_single_artifact(filters={"name__value": "startup-config", "object__ids": [device.id]})
+    return count
+
+
+def run_artifact_fetch_async(endpoint: str, devices: int) -> int:
+    return run_artifact_fetch(endpoint=endpoint, devices=devices, use_async=True)
+
+
+SCENARIOS: Dict[str, Callable[[str, int], int]] = {
+    "nodes_processor": run_nodes_processor,
+    "inventory": run_inventory,
+    "inventory_lean": run_inventory_lean,
+    "inventory_async": run_inventory_async,
+    "query_processor": run_query_processor,
+    "query_processor_async": run_query_processor_async,
+    "query_processor_batch": run_query_processor_batch,
+    "query_processor_cached": run_query_processor_cached,
+    "artifact_fetch": run_artifact_fetch,
+    "artifact_fetch_async": run_artifact_fetch_async,
+}
+
+
+def _paged_budget(devices: int) -> int:
+    # The devices and the peers they reference are fetched in pages of 50 nodes, about 47 requests per 1000 devices
+    return devices // 20 + 5
+
+
+# Maximum number of requests sent by each scenario, for a number of devices
+REQUEST_BUDGETS: Dict[str, Callable[[int], int]] = {
+    "nodes_processor": _paged_budget,
+    "inventory": _paged_budget,
+    "inventory_lean": _paged_budget,
+    "inventory_async": _paged_budget,
+    "query_processor": lambda devices: 1,
+    "query_processor_async": lambda devices: 1,
+    "query_processor_batch": lambda devices: 1,
+    "query_processor_cached": lambda devices: 1,
+    # The device, the artifact and its content, plus the schema
+    "artifact_fetch": lambda devices: 3 * min(devices, MAX_ARTIFACTS) + 1,
+    "artifact_fetch_async": lambda devices: 3 * min(devices, MAX_ARTIFACTS) + 1,
+}
+DEFAULT_TOLERANCE = 0.25
+
+
+def check_result(result: Dict[str, Any], baseline: Optional[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Return the reasons why a result is a regression, against the budget of requests and the baseline."""
+    failures = []
+    budget = REQUEST_BUDGETS[result["scenario"]](result["scale"])
+    if result["requests"] > budget:
+        failures.append(f"{result['requests']} requests sent, the budget is {budget}")
+    if baseline and "error" not in baseline:
+        if result["requests"] > baseline["requests"]:
+            failures.append(f"{result['requests']} requests sent, {baseline['requests']} in the baseline")
+        for key, unit in (("duration", "s"), ("peak_memory_mb", " MiB")):
+            if result[key] > baseline[key] * (1 + tolerance):
+                failures.append(f"{key} {result[key]}{unit}, {baseline[key]}{unit} in the baseline")
+    return failures
+
+
+def run_worker(scenario: str, endpoint: str, devices: int) -> None:
+    """Run one scenario in the current process and print its result as JSON."""
+    from ansible.plugins.loader import init_plugin_loader
+
+    # Makes the collection importable, from ANSIBLE_COLLECTIONS_PATH
+    init_plugin_loader()
+    start = time.perf_counter()
+    count = SCENARIOS[scenario](endpoint, devices)
+    duration = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "count": count,
+                "duration": round(duration, 3),
+                "throughput": round(count / duration, 1) if duration else None,
+                # Kilobytes on Linux
+                "peak_memory_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            }
+        )
+    )
+
+
+def _collections_path() -> str:
+    """Expose the repository as the opsmill.infrahub collection."""
+    root = tempfile.mkdtemp(prefix="infrahub-benchmark-")
+    namespace = os.path.join(root, "ansible_collections", "opsmill")
+    os.makedirs(namespace)
+    os.symlink(REPOSITORY, os.path.join(namespace, "infrahub"))
+    return root
+
+
+def _stats(endpoint: str, reset: bool = False) -> Dict[str, Any]:
+    with urlopen(f"{endpoint}/__stats{'?reset=1' if reset else ''}") as response:  # noqa: S310
+        return json.loads(response.read())
+
+
+def _load_baseline(path: Optional[str]) -> Dict[Any, Dict[str, Any]]:
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as report:
+        return {(result["scale"], result["scenario"]): result for result in json.load(report)["results"]}
+
+
+def run_benchmarks(
+    scales: List[int],
+    scenarios: List[str],
+    latency: float,
+    baseline: Optional[Dict[Any, Dict[str, Any]]] = None,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> List[Dict[str, Any]]:
+    collections_path = _collections_path()
+    env = dict(os.environ, ANSIBLE_COLLECTIONS_PATH=collections_path)
+    env.pop("INFRAHUB_METRICS_REPORT", None)
+
+    results = []
+    for devices in scales:
+        print(f"Generating {devices} devices...", file=sys.stderr)
+        with StubInfrahub(devices=devices, latency=latency) as stub:
+            for scenario in scenarios:
+                _stats(stub.address, reset=True)
+                process = subprocess.run(
+                    [
+                        sys.executable,
+                        __file__,
+                        "--worker",
+                        scenario,
+                        "--endpoint",
+                        stub.address,
+                        "--scales",
+                        str(devices),
+                    ],
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    text=True,
+                    check=False,
+                )
+                result: Dict[str, Any] = {"scale": devices, "scenario": scenario}
+                if process.returncode:
+                    result["error"] = (process.stderr.strip().splitlines() or ["unknown error"])[-1]
+                else:
+                    result.update(json.loads(process.stdout.strip().splitlines()[-1]))
+                    stats = _stats(stub.address)
+                    result.update(requests=stats["total_requests"], bytes=stats["bytes_sent"])
+                    failures = check_result(
+                        result=result, baseline=(baseline or {}).get((devices, scenario)), tolerance=tolerance
+                    )
+                    if failures:
+                        result["failures"] = failures
+                results.append(result)
+                print(_format_result(result), file=sys.stderr)
+    return results
+
+
+def _format_result(result: Dict[str, Any]) -> str:
+    if "error" in result:
+        return f"{result['scale']:>8} {result['scenario']:<22} failed: {result['error']}"
+    line = (
+        f"{result['scale']:>8} {result['scenario']:<22} {result['duration']:>9.2f}s {result['throughput']:>10.1f}/s "
+        f"{result['requests']:>7} req {result['bytes'] / 1024 / 1024:>9.1f} MiB {result['peak_memory_mb']:>8.1f} MiB RSS"
+    )
+    for failure in result.get("failures") or []:
+        line += f"\n{'':>8} regression: {failure}"
+    return line
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES), help="Numbers of devices")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Among {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added by the server to every response")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results with this report of a previous run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Ratio by which the duration and memory may exceed the baseline",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--endpoint", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    scales = [int(scale) for scale in args.scales.split(",")]
+    if args.worker:
+        run_worker(scenario=args.worker, endpoint=args.endpoint, devices=scales[0])
+        return
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(
+        scales=scales,
+        scenarios=scenarios,
+        latency=args.latency,
+        baseline=_load_baseline(args.baseline),
+        tolerance=args.tolerance,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(
+                {"timestamp": time.time(), "python": sys.version.split()[0], "results": results}, output, indent=2
+            )
+    if any("error" in result or "failures" in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,700 @@
+"""
+Offline stand-in for an Infrahub instance, used by the benchmarks.
+
+Serves a synthetic schema and a configurable number of generated devices (with sites, platforms,
+interfaces, IP addresses, tags and artifacts) through the subset of the REST and GraphQL API used by the collection.
+
+Besides the Infrahub API, it exposes:
+    GET /__stats[?reset=1]: number of requests and bytes sent since the last reset.
+    GET /__update?id=<id>&name=<name>&value=<value>[&json=1]: update an attribute or relationship of a node.
+    GET /__delete?id=<id>: delete a node.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import argparse
+import datetime
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+PROPERTY_FIELDS = ["is_visible", "is_protected", "is_default", "is_from_profile", "is_inherited", "updated_at"]
+PROPERTY_OBJECTS = ["source", "owner"]
+
+
+def _attribute(name: str, kind: str = "Text") -> Dict[str, Any]:
+    return {"name": name, "kind": kind, "optional": True}
+
+
+def _relationship(name: str, peer: str, cardinality: str = "one", kind: str = "Generic") -> Dict[str, Any]:
+    return {"name": name, "peer": peer, "cardinality": cardinality, "kind": kind, "identifier": f"{peer}__{name}"}
+
+
+SCHEMA: Dict[str, List[Dict[str, Any]]] = {
+    "generics": [
+        {
+            "name": "IPAddress",
+            "namespace": "Builtin",
+            "attributes": [_attribute("address", "IPHost")],
+            "relationships": [],
+            "used_by": ["IpamIPAddress"],
+        },
+    ],
+    "nodes": [
+        {
+            "name": "Tag",
+            "namespace": "Builtin",
+            "default_filter": "name__value",
+            "attributes": [_attribute("name"), _attribute("description")],
+            "relationships": [],
+        },
+        {
+            "name": "Site",
+            "namespace": "Location",
+            "default_filter": "name__value",
+            "attributes": [_attribute("name"), _attribute("description"), _attribute("city")],
+            "relationships": [_relationship("tags", "BuiltinTag", "many")],
+        },
+        {
+            "name": "Platform",
+            "namespace": "Infra",
+            "default_filter": "name__value",
+            "attributes": [_attribute("name"), _attribute("ansible_network_os"), _attribute("nornir_platform")],
+            "relationships": [],
+        },
+        {
+            "name": "IPAddress",
+            "namespace": "Ipam",
+            "inherit_from": ["BuiltinIPAddress"],
+            "attributes": [_attribute("address", "IPHost"), _attribute("description")],
+            "relationships": [_relationship("interface", "InfraInterface")],
+        },
+        {
+            "name": "Interface",
+            "namespace": "Infra",
+            "attributes": [_attribute("name"), _attribute("enabled", "Boolean"), _attribute("speed", "Number")],
+            "relationships": [
+                _relationship("device", "InfraDevice", kind="Parent"),
+                _relationship("ip_addresses", "IpamIPAddress", "many", kind="Component"),
+            ],
+        },
+        {
+            "name": "Device",
+            "namespace": "Infra",
+            "default_filter": "name__value",
+            "inherit_from": ["CoreArtifactTarget"],
+            "attributes": [_attribute("name"), _attribute("description"), _attribute("type"), _attribute("role")],
+            "relationships": [
+                _relationship("site", "LocationSite"),
+                _relationship("platform", "InfraPlatform"),
+                _relationship("primary_address", "BuiltinIPAddress"),
+                _relationship("interfaces", "InfraInterface", "many", kind="Component"),
+                _relationship("tags", "BuiltinTag", "many"),
+            ],
+        },
+        {
+            "name": "Artifact",
+            "namespace": "Core",
+            "attributes": [
+                _attribute("name"),
+                _attribute("storage_id"),
+                _attribute("content_type"),
+                _attribute("checksum"),
+            ],
+            "relationships": [_relationship("object", "InfraDevice")],
+        },
+    ],
+    "profiles": [],
+}
+
+
+def _add_filters(schema: Dict[str, Any]) -> None:
+    filters = [{"name": "ids", "kind": "Text"}]
+    for attribute in schema["attributes"]:
+        filters.append({"name": f"{attribute['name']}__value", "kind": attribute["kind"]})
+        filters.append({"name": f"{attribute['name']}__values", "kind": attribute["kind"]})
+    for relationship in schema["relationships"]:
+        filters.append({"name": f"{relationship['name']}__ids", "kind": "Text"})
+        filters.append({"name": f"{relationship['name']}__name__value", "kind": "Text"})
+        filters.append({"name": f"{relationship['name']}__name__values", "kind": "Text"})
+    schema["filters"] = filters
+
+
+for _schema in SCHEMA["generics"] + SCHEMA["nodes"]:
+    _add_filters(_schema)
+
+CREATED_AT = "2024-01-01T00:00:00+00:00"
+SCHEMA_HASH = hashlib.md5(json.dumps(SCHEMA, sort_keys=True).encode()).hexdigest()  # noqa: S324
+
+ROLES = ["edge", "core", "spine", "leaf"]
+PLATFORMS = [
+    ("cisco_ios", "cisco.ios.ios"),
+    ("arista_eos", "arista.eos.eos"),
+    ("juniper_junos", "junipernetworks.junos.junos"),
+]
+
+
+def _schemas_by_kind() -> Dict[str, Dict[str, Any]]:
+    schemas = {}
+    for section in ("generics", "nodes"):
+        for schema in SCHEMA[section]:
+            schemas[schema["namespace"] + schema["name"]] = schema
+    return schemas
+
+
+SCHEMAS_BY_KIND = _schemas_by_kind()
+
+
+class Dataset:
+    """Deterministic synthetic data indexed by kind and by id."""
+
+    def __init__(self, devices: int, interfaces_per_device: int = 2, devices_per_site: int = 250, tags: int = 10):
+        self.by_kind: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in SCHEMAS_BY_KIND}
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self._counter = 0
+
+        tag_nodes = [self._add("BuiltinTag", f"tag-{idx}", name=f"tag-{idx}") for idx in range(tags)]
+        platform_nodes = [
+            self._add("InfraPlatform", name, name=name, ansible_network_os=network_os, nornir_platform=name)
+            for name, network_os in PLATFORMS
+        ]
+        site_nodes = [
+            self._add(
+                "LocationSite",
+                f"site-{idx}",
+                name=f"site-{idx}",
+                city=f"city-{idx % 7}",
+                tags=[tag_nodes[idx % tags]["id"]],
+            )
+            for idx in range(max(1, devices // devices_per_site))
+        ]
+
+        for idx in range(devices):
+            name = f"device-{idx:06d}"
+            device = self._add(
+                "InfraDevice",
+                name,
+                name=name,
+                description=f"Synthetic device {idx}",
+                type="generic",
+                role=ROLES[idx % len(ROLES)],
+                site=site_nodes[idx % len(site_nodes)]["id"],
+                platform=platform_nodes[idx % len(platform_nodes)]["id"],
+                tags=[tag_nodes[idx % tags]["id"], tag_nodes[(idx + 1) % tags]["id"]],
+                interfaces=[],
+            )
+            for intf_idx in range(interfaces_per_device):
+                interface = self._add(
+                    "InfraInterface",
+                    f"{name}::Ethernet{intf_idx}",
+                    name=f"Ethernet{intf_idx}",
+                    enabled=True,
+                    speed=1000,
+                    device=device["id"],
+                    ip_addresses=[],
+                )
+                address = self._add(
+                    "IpamIPAddress",
+                    f"10.{idx // 65536 % 256}.{idx // 256 % 256}.{idx % 256}/{24 + intf_idx}",
+                    address=f"10.{idx // 65536 % 256}.{idx // 256 % 256}.{idx % 256}/{24 + intf_idx}",
+                    interface=interface["id"],
+                )
+                interface["data"]["ip_addresses"].append(address["id"])
+                device["data"]["interfaces"].append(interface["id"])
+                if intf_idx == 0:
+                    device["data"]["primary_address"] = address["id"]
+            self._add(
+                "CoreArtifact",
+                f"{name}-startup-config",
+                name="startup-config",
+                storage_id=str(uuid.UUID(int=10**12 + idx)),
+                content_type="text/plain",
+                checksum="0" * 32,
+                object=device["id"],
+            )
+
+    def _add(self, kind: str, label: str, **data: Any) -> Dict[str, Any]:
+        self._counter += 1
+        node = {
+            "id": str(uuid.UUID(int=self._counter)),
+            "kind": kind,
+            "display_label": label,
+            "data": data,
+            "updated": {},
+        }
+        self.by_kind[kind].append(node)
+        self.by_id[node["id"]] = node
+        return node
+
+    def update(self, node_id: str, name: str, value: Any) -> None:
+        node = self.by_id[node_id]
+        node["data"][name] = value
+        node["updated"][name] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        if name in ("name", "address"):
+            node["display_label"] = value
+
+    def delete(self, node_id: str) -> None:
+        node = self.by_id.pop(node_id)
+        self.by_kind[node["kind"]].remove(node)
+
+    def nodes_for(self, kind: str) -> List[Dict[str, Any]]:
+        schema = SCHEMAS_BY_KIND.get(kind)
+        if schema and "used_by" in schema:
+            nodes: List[Dict[str, Any]] = []
+            for child in schema["used_by"]:
+                nodes.extend(self.by_kind[child])
+            return nodes
+        return self.by_kind.get(kind, [])
+
+
+# ---------------------------------------------------------------------------
+# Minimal GraphQL parser (selection sets, aliases, arguments, variables, inline fragments)
+# ---------------------------------------------------------------------------
+TOKEN_RE = re.compile(
+    r'\s*(?:(\.\.\.)|([{}()\[\]:,!$=@])|("(?:[^"\\]|\\.)*")|(-?\d+(?:\.\d+)?)|([_A-Za-z][_0-9A-Za-z]*))'
+)
+
+
+class GraphQLSyntaxError(Exception):
+    pass
+
+
+def _tokenize(query: str) -> List[Tuple[str, str]]:
+    query = re.sub(r"#[^\n]*", "", query)
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        if not query[pos:].strip():
+            break
+        match = TOKEN_RE.match(query, pos)
+        if not match:
+            raise GraphQLSyntaxError(f"Unexpected character at {pos}: {query[pos:pos + 20]!r}")
+        spread, punct, string, number, name = match.groups()
+        if spread:
+            tokens.append(("spread", spread))
+        elif punct:
+            tokens.append(("punct", punct))
+        elif string is not None:
+            tokens.append(("value", json.loads(string)))
+        elif number is not None:
+            tokens.append(("value", float(number) if "." in number else int(number)))
+        else:
+            tokens.append(("name", name))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, query: str, variables: Optional[Dict[str, Any]] = None):
+        self.tokens = _tokenize(query)
+        self.pos = 0
+        self.variables = variables or {}
+
+    def _peek(self) -> Tuple[Optional[str], Any]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None, None
+
+    def _next(self) -> Tuple[str, Any]:
+        token = self._peek()
+        if token[0] is None:
+            raise GraphQLSyntaxError("Unexpected end of the query")
+        self.pos += 1
+        return token  # type: ignore[return-value]
+
+    def _expect(self, value: str) -> None:
+        _, token_value = self._next()
+        if token_value != value:
+            raise GraphQLSyntaxError(f"Expected {value!r}, got {token_value!r}")
+
+    def parse_document(self) -> List[Dict[str, Any]]:
+        kind, value = self._peek()
+        if kind == "name" and value in ("query", "mutation"):
+            self._next()
+            if self._peek()[0] == "name":
+                self._next()
+            if self._peek()[1] == "(":
+                self._skip_variable_definitions()
+        return self.parse_selection_set()
+
+    def _skip_variable_definitions(self) -> None:
+        depth = 0
+        while True:
+            _, value = self._next()
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def parse_selection_set(self) -> List[Dict[str, Any]]:
+        self._expect("{")
+        selections = []
+        while self._peek()[1] != "}":
+            if self._peek()[0] == "spread":
+                self._next()
+                self._expect("on")
+                _, type_condition = self._next()
+                selections.append({"fragment": type_condition, "selections": self.parse_selection_set()})
+                continue
+            _, name = self._next()
+            alias = name
+            if self._peek()[1] == ":":
+                self._next()
+                _, name = self._next()
+            arguments = self._parse_arguments() if self._peek()[1] == "(" else {}
+            children = self.parse_selection_set() if self._peek()[1] == "{" else None
+            selections.append({"alias": alias, "name": name, "arguments": arguments, "selections": children})
+        self._next()
+        return selections
+
+    def _parse_arguments(self) -> Dict[str, Any]:
+        self._expect("(")
+        arguments = {}
+        while self._peek()[1] != ")":
+            if self._peek()[1] == ",":
+                self._next()
+                continue
+            _, name = self._next()
+            self._expect(":")
+            arguments[name] = self._parse_value()
+        self._next()
+        return arguments
+
+    def _parse_value(self) -> Any:
+        kind, value = self._next()
+        if kind == "value":
+            return value
+        if value == "$":
+            _, name = self._next()
+            return self.variables.get(name)
+        if value == "[":
+            items = []
+            while self._peek()[1] != "]":
+                if self._peek()[1] == ",":
+                    self._next()
+                    continue
+                items.append(self._parse_value())
+            self._next()
+            return items
+        if value == "{":
+            obj = {}
+            while self._peek()[1] != "}":
+                if self._peek()[1] == ",":
+                    self._next()
+                    continue
+                _, key = self._next()
+                self._expect(":")
+                obj[key] = self._parse_value()
+            self._next()
+            return obj
+        if kind == "name":
+            return {"true": True, "false": False, "null": None}.get(value, value)
+        raise GraphQLSyntaxError(f"Unexpected value token {value!r}")
+
+
+def parse_query(query: str, variables: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    return _Parser(query=query, variables=variables).parse_document()
+
+
+# ---------------------------------------------------------------------------
+# Resolution
+# ---------------------------------------------------------------------------
+class Resolver:
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        self.schemas = SCHEMAS_BY_KIND
+
+    def execute(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = {}
+        for selection in parse_query(query=query, variables=variables):
+            data[selection["alias"]] = self._resolve_root(selection)
+        return {"data": data}
+
+    def _resolve_root(self, selection: Dict[str, Any]) -> Dict[str, Any]:
+        kind = selection["name"]
+        if kind not in self.schemas:
+            raise GraphQLSyntaxError(f"Unknown root field {kind}")
+        arguments = dict(selection["arguments"])
+        offset = int(arguments.pop("offset", 0) or 0)
+        limit = arguments.pop("limit", None)
+        arguments.pop("partial_match", None)
+        # Look the nodes up by id rather than scanning the whole kind, the peers are fetched that way
+        ids = arguments.pop("ids", None)
+        if ids is None:
+            nodes = self.dataset.nodes_for(kind)
+        else:
+            kinds = set(self.schemas[kind].get("used_by") or [kind])
+            nodes = [self.dataset.by_id[node_id] for node_id in ids if node_id in self.dataset.by_id]
+            nodes = [node for node in nodes if node["kind"] in kinds]
+        if arguments:
+            nodes = [node for node in nodes if self._match(node, arguments)]
+        page = nodes[offset : offset + int(limit)] if limit is not None else nodes[offset:]
+        return self._resolve_connection(selection["selections"] or [], page, len(nodes))
+
+    def _match(self, node: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+        for key, expected in filters.items():
+            parts = key.split("__")
+            value = node["data"].get(parts[0])
+            if len(parts) > 2:  # noqa: PLR2004
+                # <relationship>__<attribute>__value(s)
+                peers = value if isinstance(value, list) else [value]
+                values = [self.dataset.by_id[peer]["data"].get(parts[1]) for peer in peers if peer]
+                accepted = (expected or []) if parts[-1] == "values" else [expected]
+                if not set(values) & set(accepted):
+                    return False
+            elif parts[-1] == "ids":
+                peers = value if isinstance(value, list) else [value]
+                if not set(peers) & set(expected or []):
+                    return False
+            elif parts[-1] == "values":
+                if value not in (expected or []):
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    def _resolve_connection(
+        self,
+        selections: List[Dict[str, Any]],
+        nodes: List[Dict[str, Any]],
+        count: int,
+        updated_at: Optional[str] = None,
+    ) -> Dict:
+        result: Dict[str, Any] = {}
+        for selection in selections:
+            if selection["name"] == "count":
+                result[selection["alias"]] = count
+            elif selection["name"] == "edges":
+                result[selection["alias"]] = [
+                    self._resolve_edge(selection["selections"] or [], node, updated_at) for node in nodes
+                ]
+        return result
+
+    def _resolve_edge(
+        self, selections: List[Dict[str, Any]], node: Dict[str, Any], updated_at: Optional[str] = None
+    ) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for selection in selections:
+            if selection["name"] == "node":
+                result[selection["alias"]] = self._resolve_node(selection["selections"] or [], node)
+            else:
+                result[selection["alias"]] = self._resolve_properties(selection["selections"], updated_at)
+        return result
+
+    def _resolve_properties(
+        self, selections: Optional[List[Dict[str, Any]]], updated_at: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        if selections is None:
+            return None
+        return {
+            selection["alias"]: updated_at if selection["name"] == "updated_at" else None for selection in selections
+        }
+
+    def _resolve_node(self, selections: List[Dict[str, Any]], node: Dict[str, Any]) -> Dict[str, Any]:
+        schema = self.schemas[node["kind"]]
+        relationships = {rel["name"]: rel for rel in schema["relationships"]}
+        result: Dict[str, Any] = {}
+        for selection in selections:
+            if "fragment" in selection:
+                if selection["fragment"] == node["kind"]:
+                    result.update(self._resolve_node(selection["selections"], node))
+                continue
+            name = selection["name"]
+            alias = selection["alias"]
+            if name == "id":
+                result[alias] = node["id"]
+            elif name == "display_label":
+                result[alias] = node["display_label"]
+            elif name == "__typename":
+                result[alias] = node["kind"]
+            elif name == "hfid":
+                result[alias] = [node["display_label"]] if schema.get("default_filter") else None
+            elif name in relationships:
+                result[alias] = self._resolve_relationship(
+                    selection, relationships[name], node["data"].get(name), node["updated"].get(name, CREATED_AT)
+                )
+            else:
+                result[alias] = self._resolve_attribute(
+                    selection["selections"], node["data"].get(name), node["updated"].get(name, CREATED_AT)
+                )
+        return result
+
+    def _resolve_attribute(self, selections: Optional[List[Dict[str, Any]]], value: Any, updated_at: str) -> Any:
+        if selections is None:
+            return value
+        result = {}
+        for selection in selections:
+            if selection["name"] == "value":
+                result[selection["alias"]] = value
+            elif selection["name"] == "updated_at":
+                result[selection["alias"]] = updated_at
+            elif selection["selections"]:
+                result[selection["alias"]] = None
+            else:
+                result[selection["alias"]] = None
+        return result
+
+    def _resolve_relationship(
+        self, selection: Dict[str, Any], relationship: Dict[str, Any], value: Any, updated_at: str
+    ) -> Any:
+        selections = selection["selections"] or []
+        if relationship["cardinality"] == "one":
+            if not value:
+                return None
+            return self._resolve_edge(selections, self.dataset.by_id[value], updated_at)
+        peers = [self.dataset.by_id[peer_id] for peer_id in value or []]
+        return self._resolve_connection(selections, peers, len(peers), updated_at)
+
+
+# ---------------------------------------------------------------------------
+# HTTP layer
+# ---------------------------------------------------------------------------
+class Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.bytes_sent = 0
+
+    def record(self, kind: str, size: int) -> None:
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes_sent += size
+
+    def reset(self) -> None:
+        with self.lock:
+            self.requests = {}
+            self.bytes_sent = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "total_requests": sum(self.requests.values()),
+                "bytes_sent": self.bytes_sent,
+            }
+
+
+def make_handler(resolver: Resolver, stats: Stats, latency: float = 0.0):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # The headers and the body are written separately, Nagle's algorithm would delay the body on kept-alive
+        # connections until the client acknowledges the headers
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+        def _send(self, kind: str, body: Any, content_type: str = "application/json", status: int = 200) -> None:
+            if latency:
+                time.sleep(latency)
+            payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+            stats.record(kind=kind, size=len(payload))
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):  # noqa: N802
+            url = urlparse(self.path)
+            if url.path == "/__stats":
+                payload = json.dumps(stats.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                if parse_qs(url.query).get("reset"):
+                    stats.reset()
+            elif url.path in ("/__update", "/__delete"):
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                with stats.lock:
+                    if url.path == "/__update":
+                        value = json.loads(params["value"]) if params.get("json") else params["value"]
+                        resolver.dataset.update(params["id"], params["name"], value)
+                    else:
+                        resolver.dataset.delete(params["id"])
+                payload = b"{}"
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            elif url.path.rstrip("/") == "/api/schema":
+                self._send("schema", SCHEMA)
+            elif url.path.rstrip("/") == "/api/schema/summary":
+                self._send("schema_summary", {"main": SCHEMA_HASH, "nodes": {}, "generics": {}})
+            elif url.path.startswith("/api/storage/object/"):
+                storage_id = url.path.rsplit("/", 1)[-1]
+                self._send("storage", f"hostname {storage_id}\n".encode(), content_type="text/plain")
+            elif url.path.rstrip("/") == "/api/config":
+                self._send("config", {"main": {"default_branch": "main"}})
+            else:
+                self._send("not_found", {"errors": [{"message": "not found"}]}, status=404)
+
+        def do_POST(self):  # noqa: N802
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not url.path.startswith("/graphql"):
+                self._send("not_found", {"errors": [{"message": "not found"}]}, status=404)
+                return
+            try:
+                response = resolver.execute(query=body.get("query", ""), variables=body.get("variables"))
+            except GraphQLSyntaxError as exc:
+                response = {"data": None, "errors": [{"message": str(exc)}]}
+            self._send("graphql", response)
+
+    return StubHandler
+
+
+class StubInfrahub:
+    """Run the stub server in a background thread."""
+
+    def __init__(
+        self, devices: int = 100, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, **dataset_options: Any
+    ):
+        self.dataset = Dataset(devices=devices, **dataset_options)
+        self.stats = Stats()
+        self.server = ThreadingHTTPServer((host, port), make_handler(Resolver(self.dataset), self.stats, latency))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StubInfrahub":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    stub = StubInfrahub(devices=args.devices, host=args.host, port=args.port, latency=args.latency)
+    print(f"Serving {args.devices} synthetic devices on {stub.address}")
+    stub.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
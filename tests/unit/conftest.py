@@ -0,0 +1,73 @@
+"""
+Shared fixtures of the unit tests.
+
+The collection is imported as ansible_collections.opsmill.infrahub, from its location if the repository is checked out
+as ansible_collections/opsmill/infrahub, through a temporary symlink otherwise, removed at the end of the session.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+from ansible.plugins.loader import init_plugin_loader
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPOSITORY, "tests", "performance"))
+
+
+TEMPORARY_ROOT = None
+
+
+def _collections_path() -> str:
+    global TEMPORARY_ROOT  # noqa: PLW0603
+    if REPOSITORY.endswith(os.path.join("ansible_collections", "opsmill", "infrahub")):
+        return os.path.dirname(os.path.dirname(os.path.dirname(REPOSITORY)))
+    TEMPORARY_ROOT = tempfile.mkdtemp(prefix="infrahub-unit-")
+    namespace = os.path.join(TEMPORARY_ROOT, "ansible_collections", "opsmill")
+    os.makedirs(namespace)
+    os.symlink(REPOSITORY, os.path.join(namespace, "infrahub"))
+    return TEMPORARY_ROOT
+
+
+# The collection must be importable when the test modules are collected, before any fixture runs
+init_plugin_loader([_collections_path()])
+
+
+def pytest_unconfigure(config):
+    if TEMPORARY_ROOT:
+        shutil.rmtree(TEMPORARY_ROOT, ignore_errors=True)
+
+
+from stub_server import StubInfrahub  # noqa: E402
+
+STUB_DEVICES = 20
+
+
+@pytest.fixture(scope="session")
+def stub():
+    """Stub Infrahub server holding STUB_DEVICES devices, see tests/performance/stub_server.py."""
+    with StubInfrahub(devices=STUB_DEVICES) as server:
+        yield server
+
+
+@pytest.fixture
+def client_factory(stub):
+    """Build clients of the stub server, closed at teardown."""
+    from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import InfrahubclientWrapper
+
+    clients = []
+
+    def factory(wrapper_class=InfrahubclientWrapper, **options):
+        client = wrapper_class(api_endpoint=stub.address, branch="main", token="unit", timeout=10, **options)  # noqa: S106
+        clients.append(client)
+        return client
+
+    yield factory
+    for client in clients:
+        client.close()
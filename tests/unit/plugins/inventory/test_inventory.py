@@ -0,0 +1,234 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import fcntl
+import json
+import os
+import sys
+
+import pytest
+from ansible.errors import AnsibleUndefinedVariable
+from ansible.inventory.data import InventoryData
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.inventory import Constructable
+from ansible.plugins.loader import inventory_loader
+from ansible.template import Templar
+
+
+@pytest.fixture
+def inventory():
+    plugin = inventory_loader.get("opsmill.infrahub.inventory")
+    plugin.templar = Templar(loader=DataLoader())
+    plugin._attribute_paths = {"value": ("value",), "site.name": ("site", "name")}
+    return plugin
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        False,
+        0,
+        65001,
+        1.5,
+        "",
+        "edge",
+        "None",
+        "True",
+        "42",
+        "{name}",
+        "{'a': 1}",
+        "[1, 2]",
+        "a{{ 1 }}",
+        "{# comment #}",
+        {"a": 1},
+        [1, 2],
+    ],
+)
+def test_compose_attribute_path_same_as_jinja(inventory, value):
+    variables = {"value": value}
+
+    result = inventory._compose("value", variables)
+    expected = Constructable._compose(inventory, "value", variables)
+
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+def test_compose_attribute_path_without_jinja(inventory, monkeypatch):
+    def render(*args, **kwargs):
+        raise AssertionError("rendered by Jinja")
+
+    monkeypatch.setattr(Constructable, "_compose", render)
+
+    assert inventory._compose("site.name", {"site": {"name": "paris"}}) == "paris"
+
+
+def test_compose_missing_attribute_path(inventory):
+    # Left to Jinja, with the same error
+    with pytest.raises(AnsibleUndefinedVariable):
+        inventory._compose("site.name", {"site": None})
+
+
+@pytest.fixture
+def cached_inventory(inventory, monkeypatch):
+    inventory._cache = {}
+    inventory.use_cache = True
+    inventory.user_cache_setting = True
+    inventory.cache_format = "json"
+    inventory.cache_timeout = 100
+    inventory.cache_soft_ttl = 30
+    monkeypatch.setattr(inventory, "_get_cache_key", lambda: "inventory")
+    return inventory
+
+
+def _at(monkeypatch, timestamp):
+    module = sys.modules[inventory_loader.get("opsmill.infrahub.inventory", class_only=True).__module__]
+    monkeypatch.setattr(module.time, "time", lambda: timestamp)
+
+
+def test_incremental_refresh_keeps_the_cache_timeout(cached_inventory, monkeypatch):
+    hosts = {"device-000001": {"name": "device-000001"}}
+    _at(monkeypatch, 1000)
+    cached_inventory._store_in_cache(host_node_attributes=hosts)
+    _at(monkeypatch, 1080)
+    cached_inventory._store_in_cache(host_node_attributes=hosts, state={}, incremental=True)
+
+    assert cached_inventory._get_cache_meta()["timestamp"] == 1000  # noqa: PLR2004
+    _at(monkeypatch, 1099)
+    assert cached_inventory._fetch_from_cache() == (hosts, False)
+    # The soft TTL counts from the last refresh, the hard one from the last full build
+    _at(monkeypatch, 1101)
+    assert not cached_inventory._is_cache_stale()
+    assert cached_inventory._fetch_from_cache() == (None, True)
+
+    cached_inventory._store_in_cache(host_node_attributes=hosts)
+    assert cached_inventory._get_cache_meta()["timestamp"] == 1101  # noqa: PLR2004
+
+
+def test_is_cache_stale(cached_inventory, monkeypatch):
+    hosts = {"device-000001": {"name": "device-000001"}}
+    assert cached_inventory._is_cache_stale()
+
+    _at(monkeypatch, 1000)
+    cached_inventory._store_in_cache(host_node_attributes=hosts)
+    _at(monkeypatch, 1030)
+    assert not cached_inventory._is_cache_stale()
+    _at(monkeypatch, 1031)
+    assert cached_inventory._is_cache_stale()
+
+    # Counted from the last refresh
+    cached_inventory._store_in_cache(host_node_attributes=hosts, state={}, incremental=True)
+    _at(monkeypatch, 1060)
+    assert not cached_inventory._is_cache_stale()
+
+
+def test_refresh_with_lock(cached_inventory, monkeypatch, tmp_path):
+    hosts = {"device-000001": {"name": "device-000001"}}
+    cached_inventory.incremental_refresh = False
+    monkeypatch.setattr(cached_inventory, "_load_from_api", lambda **kwargs: (iter([hosts]), None))
+    monkeypatch.setattr(cached_inventory, "set_cache_plugin", lambda: None)
+    lock_path = str(tmp_path / "inventory.lock")
+
+    with open(lock_path, "a", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert not cached_inventory._refresh_with_lock(lock_path=lock_path, host_node_attributes={})
+        assert cached_inventory._fetch_from_cache() == (None, True)
+
+    assert cached_inventory._refresh_with_lock(lock_path=lock_path, host_node_attributes={})
+    assert cached_inventory._fetch_from_cache() == (hosts, False)
+
+
+def test_refresh_requires_a_persistent_cache(cached_inventory, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(cached_inventory, "get_option", {"cache_plugin": "ansible.builtin.memory"}.get)
+    monkeypatch.setattr(cached_inventory.display, "warning", warnings.append)
+    monkeypatch.setattr(os, "fork", lambda: pytest.fail("refreshed in the background"))
+
+    cached_inventory._refresh_in_background(host_node_attributes={})
+
+    assert "persistent cache plugin" in warnings[0]
+
+
+def test_corrupted_cache_is_a_miss(cached_inventory):
+    cached_inventory.cache_format = "compact"
+    cached_inventory._store_in_cache(host_node_attributes={"device-000001": {"name": "device-000001"}})
+    cached_inventory._cache["inventory"] = cached_inventory._cache["inventory"][:-10]
+
+    assert cached_inventory._fetch_from_cache() == (None, True)
+
+
+def test_pack_hosts_stores_each_peer_once(inventory):
+    site = {"id": "site-0", "name": "paris"}
+    tags = [{"id": "tag-0", "name": "red"}, {"id": "tag-1", "name": "blue"}]
+    hosts = {
+        "device-1": {"name": "device-1", "site": site, "tags": tags, "asn": 65001},
+        "device-2": {"name": "device-2", "site": dict(site), "tags": [], "asn": None},
+    }
+
+    packed = inventory._pack_hosts(hosts)
+
+    assert packed["version"] == inventory.CACHE_FORMAT_VERSION
+    assert len(packed["peers"]) == 3  # noqa: PLR2004
+    assert packed["hosts"]["device-1"]["site"] == packed["hosts"]["device-2"]["site"]
+
+    unpacked = inventory._unpack_hosts(json.loads(json.dumps(packed)))
+    assert unpacked == hosts
+    # The hosts share the peers once unpacked
+    assert unpacked["device-1"]["site"] is unpacked["device-2"]["site"]
+
+
+def test_unpack_hosts_of_a_previous_version(inventory):
+    hosts = {"device-1": {"name": "device-1", "site": {"id": "site-0"}}}
+
+    assert inventory._unpack_hosts(hosts) == hosts
+
+
+def test_cache_key_by_configuration(inventory, monkeypatch):
+    options = {"groups": {"edge": "role == 'edge'"}}
+    monkeypatch.setattr(inventory, "get_option", options.get)
+    monkeypatch.setattr(inventory, "get_cache_key", lambda path: "infrahub")
+    for name, value in {
+        "api_endpoint": "http://infrahub",
+        "branch": "main",
+        "nodes": {"InfraDevice": {"include": ["name", "role"]}},
+        "compose": {},
+        "keyed_groups": [],
+        "auto_include": True,
+        "max_depth": 1,
+        "limit": None,
+    }.items():
+        monkeypatch.setattr(inventory, name, value, raising=False)
+    key = inventory._get_cache_key()
+
+    inventory.nodes = {"InfraDevice": {"include": ["role", "name"]}}
+    assert inventory._get_cache_key() == key
+    # A conditional may use other attributes, fetched with auto_include
+    options["groups"] = {"edge": "platform.name == 'eos'"}
+    assert inventory._get_cache_key() != key
+
+
+def test_incremental_refresh_requires_the_cache(monkeypatch, stub, tmp_path):
+    plugin = inventory_loader.get("opsmill.infrahub.inventory")
+    path = tmp_path / "infrahub.yml"
+    path.write_text(
+        json.dumps(
+            {
+                "plugin": "opsmill.infrahub.inventory",
+                "api_endpoint": stub.address,
+                "token": "unit",
+                "nodes": {"InfraDevice": {"include": ["name"]}},
+                "incremental_refresh": True,
+            }
+        )
+    )
+    processor_class = sys.modules[type(plugin).__module__].InfrahubNodesProcessor
+    monkeypatch.setattr(processor_class, "fetch_state", lambda *args, **kwargs: pytest.fail("state fetched"))
+    inventory = InventoryData()
+
+    plugin.parse(inventory=inventory, loader=DataLoader(), path=str(path), cache=False)
+
+    assert not plugin.incremental_refresh
+    assert len(inventory.hosts) == 20  # noqa: PLR2004
@@ -0,0 +1,95 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import asyncio
+
+import pytest
+from ansible_collections.opsmill.infrahub.plugins.module_utils.broker import (
+    InfrahubBroker,
+    send_to_broker,
+    start_broker,
+)
+
+GRAPHQL_URL = "http://infrahub/graphql/main"
+
+
+def _request(method="POST", url=GRAPHQL_URL, query=None, **headers):
+    return {"method": method, "url": url, "headers": headers, "payload": {"query": query} if query else None}
+
+
+@pytest.mark.parametrize(
+    ("request_", "read_only"),
+    [
+        (_request(method="get", url="http://infrahub/api/schema"), True),
+        (_request(query="query { InfraDevice { count } }"), True),
+        (_request(query="  { InfraDevice { count } }"), True),
+        (_request(query="query GetDevices($name: String) { InfraDevice(name__value: $name) { count } }"), True),
+        (_request(query='mutation { TagCreate(data: {name: {value: "a"}}) { ok } }'), False),
+        (_request(url="http://infrahub/api/auth/login"), False),
+        (_request(method="DELETE", url="http://infrahub/api/storage/object"), False),
+        (_request(), False),
+    ],
+)
+def test_is_read_only(request_, read_only):
+    assert InfrahubBroker.is_read_only(request_) is read_only
+
+
+def test_get_key():
+    request = _request(query="{ InfraDevice { count } }", **{"X-INFRAHUB-KEY": "token-1", "Accept": "json"})
+
+    assert InfrahubBroker.get_key(request) == InfrahubBroker.get_key(dict(request, method="post"))
+    # Only the headers telling who sends the request are part of the key
+    assert InfrahubBroker.get_key(request) == InfrahubBroker.get_key(
+        dict(request, headers={"x-infrahub-key": "token-1"})
+    )
+    assert InfrahubBroker.get_key(request) != InfrahubBroker.get_key(
+        dict(request, headers={"x-infrahub-key": "token-2"})
+    )
+    assert InfrahubBroker.get_key(request) != InfrahubBroker.get_key(
+        dict(request, payload={"query": "{ LocationSite { count } }"})
+    )
+    assert InfrahubBroker.get_key(request) != InfrahubBroker.get_key(dict(request, verify=False))
+
+
+def test_fetch_shares_the_read_only_responses(monkeypatch, tmp_path):
+    broker = InfrahubBroker(socket_path=str(tmp_path / "broker.sock"))
+    sent = []
+
+    async def send(request):
+        sent.append(request)
+        await asyncio.sleep(0.01)
+        return {"status": 200, "headers": {}, "content": ""}
+
+    monkeypatch.setattr(broker, "_send", send)
+    query = _request(query="{ InfraDevice { count } }")
+    mutation = _request(query='mutation { TagCreate(data: {name: {value: "a"}}) { ok } }')
+
+    async def fetch_all():
+        # Sent concurrently, the identical queries are coalesced
+        await asyncio.gather(*(broker.fetch(request) for request in (query, query, mutation, mutation)))
+        # then reused from the cache
+        await broker.fetch(query)
+
+    asyncio.run(fetch_all())
+
+    assert sent.count(query) == 1
+    assert sent.count(mutation) == 2  # noqa: PLR2004
+    assert broker.stats == {"requests": 5, "upstream": 0, "cached": 1, "coalesced": 1}
+
+
+def test_requests_sent_through_the_broker(client_factory, tmp_path):
+    socket_path = str(tmp_path / "broker.sock")
+    start_broker(socket_path=socket_path, idle_timeout=5)
+    client = client_factory(broker_socket=socket_path)
+
+    first = client.execute_graphql(query="{ LocationSite { count } }")
+    second = client.execute_graphql(query="{ LocationSite { count } }")
+
+    assert first == second
+    assert client.broker_socket == socket_path
+    stats = send_to_broker(socket_path=socket_path, request={"method": "STATS"})
+    # The query sent again is cached
+    assert stats["requests"] == 2  # noqa: PLR2004
+    assert stats["upstream"] == 1
+    assert stats["cached"] == 1
@@ -0,0 +1,75 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+
+import pytest
+from ansible_collections.opsmill.infrahub.plugins.module_utils import cache_utils
+from ansible_collections.opsmill.infrahub.plugins.module_utils.cache_utils import (
+    CACHE_HEADER,
+    decode_cache_payload,
+    encode_cache_payload,
+)
+
+DATA = {"device-1": {"name": "device-1", "asn": 65001, "site": None, "tags": ["red", "blue"], "ratio": 1.5}}
+
+
+def test_plain_payload():
+    encoded = encode_cache_payload(DATA)
+
+    # Readable by the previous versions
+    assert json.loads(encoded) == DATA
+    assert decode_cache_payload(encoded) == DATA
+
+
+def test_compact_payload():
+    encoded = encode_cache_payload(DATA, compact=True)
+
+    assert encoded.startswith(f"{CACHE_HEADER}/1/")
+    assert decode_cache_payload(encoded) == DATA
+
+
+@pytest.mark.parametrize("serializer", list(cache_utils.SERIALIZERS))
+@pytest.mark.parametrize("compressor", list(cache_utils.COMPRESSORS))
+def test_compact_payload_codecs(monkeypatch, serializer, compressor):
+    monkeypatch.setattr(cache_utils, "SERIALIZERS", {serializer: cache_utils.SERIALIZERS[serializer]})
+    monkeypatch.setattr(cache_utils, "COMPRESSORS", {compressor: cache_utils.COMPRESSORS[compressor]})
+
+    encoded = encode_cache_payload(DATA, compact=True)
+
+    assert encoded.startswith(f"{CACHE_HEADER}/1/{serializer}/{compressor}:")
+    assert decode_cache_payload(encoded) == DATA
+
+
+def test_compact_payload_of_another_version():
+    encoded = encode_cache_payload(DATA, compact=True).replace(f"{CACHE_HEADER}/1/", f"{CACHE_HEADER}/2/", 1)
+
+    with pytest.raises(ValueError, match="version 2"):
+        decode_cache_payload(encoded)
+
+
+def test_compact_payload_without_its_codecs(monkeypatch):
+    encoded = encode_cache_payload(DATA, compact=True)
+    monkeypatch.setattr(cache_utils, "COMPRESSORS", {})
+
+    with pytest.raises(ValueError, match="codecs are not available"):
+        decode_cache_payload(encoded)
+
+
+@pytest.mark.parametrize("compressor", list(cache_utils.COMPRESSORS))
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda encoded: encoded[: len(encoded) // 2],
+        lambda encoded: encoded[:-8] + "AAAAAAAA",
+        lambda encoded: encoded.split(":", 1)[0] + ":not base64!",
+        lambda encoded: encoded.replace("/1/", "/one/", 1),
+    ],
+)
+def test_corrupted_compact_payload(monkeypatch, compressor, corrupt):
+    monkeypatch.setattr(cache_utils, "COMPRESSORS", {compressor: cache_utils.COMPRESSORS[compressor]})
+    encoded = encode_cache_payload(DATA, compact=True)
+
+    with pytest.raises(ValueError, match="cache"):
+        decode_cache_payload(corrupt(encoded))
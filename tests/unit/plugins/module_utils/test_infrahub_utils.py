@@ -0,0 +1,448 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import threading
+import time
+
+import pytest
+import stub_server
+from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
+    InfrahubNodesProcessor,
+    InfrahubQueryProcessor,
+    close_shared_clients,
+    get_arg_or_env,
+    get_shared_client,
+)
+from ansible_collections.opsmill.infrahub.plugins.module_utils.metrics import InfrahubMetrics
+from graphql import print_ast
+
+
+@pytest.fixture
+def nodes_processor(client_factory):
+    return InfrahubNodesProcessor(client=client_factory())
+
+
+def _fetch_hosts(processor, nodes):
+    hosts = {}
+    for page in processor.iter_process(nodes=nodes):
+        hosts.update(page)
+    return sorted(host.strip() for host in hosts)
+
+
+def test_apply_limit_plain_names(nodes_processor):
+    nodes = nodes_processor.apply_limit(
+        nodes={"InfraInterface": {}, "InfraDevice": {}, "LocationSite": {}}, limit=["device-000001", "site-0"]
+    )
+
+    # The hosts are named by their display label, the names are matched once fetched
+    assert all(not options["filters"] for options in nodes.values())
+    assert nodes_processor.limit_patterns == {kind: ["device-000001", "site-0"] for kind in nodes}
+
+
+def test_apply_limit_display_label(nodes_processor, stub):
+    device = stub.dataset.by_kind["InfraDevice"][1]
+    device["display_label"] = "edge-router"
+    try:
+        nodes = nodes_processor.apply_limit(nodes={"InfraDevice": {"include": ["name"]}}, limit=["edge-router"])
+        assert _fetch_hosts(nodes_processor, nodes) == ["edge-router"]
+    finally:
+        device["display_label"] = device["data"]["name"]
+
+
+def test_apply_limit_wildcards_only(nodes_processor):
+    nodes = nodes_processor.apply_limit(nodes={"InfraDevice": {}, "LocationSite": {}}, limit=["device-00001*"])
+
+    assert nodes == {"InfraDevice": {"filters": {}}, "LocationSite": {"filters": {}}}
+    assert nodes_processor.limit_patterns == {"InfraDevice": ["device-00001*"], "LocationSite": ["device-00001*"]}
+    assert _fetch_hosts(nodes_processor, nodes) == [f"device-0000{idx}" for idx in range(10, 20)]
+
+
+def test_apply_limit_mixed_names(nodes_processor):
+    nodes = nodes_processor.apply_limit(
+        nodes={"InfraDevice": {"include": ["name"]}, "LocationSite": {"include": ["name"]}},
+        limit=["device-000001", "site-0", "device-00001[0-2]"],
+    )
+
+    assert nodes["InfraDevice"]["filters"] == {}
+    assert nodes_processor.match_limit(kind="InfraDevice", host="device-000001")
+    assert not nodes_processor.match_limit(kind="InfraDevice", host="device-000002")
+    assert _fetch_hosts(nodes_processor, nodes) == [
+        "device-000001",
+        "device-000010",
+        "device-000011",
+        "device-000012",
+        "site-0",
+    ]
+
+
+def test_apply_limit_mixed_names_lean(client_factory):
+    processor = InfrahubNodesProcessor(client=client_factory(lean=True))
+    nodes = processor.apply_limit(
+        nodes={"InfraDevice": {"include": ["name"]}}, limit=["device-000001", "device-00001*"]
+    )
+
+    assert len(_fetch_hosts(processor, nodes)) == 11  # noqa: PLR2004
+
+
+def test_apply_limit_selectors(nodes_processor):
+    nodes = nodes_processor.apply_limit(
+        nodes={"InfraDevice": {}, "LocationSite": {}}, limit=["role=edge", "role=core", "site=site-0"]
+    )
+
+    # LocationSite has no role, it can't match the selectors
+    assert nodes == {
+        "InfraDevice": {"filters": {"role__values": ["edge", "core"], "site__name__value": "site-0"}},
+    }
+    assert not nodes_processor.limit_patterns
+
+
+def test_apply_auto_include_queries_the_fields_used_only(nodes_processor):
+    nodes = nodes_processor.apply_auto_include(
+        nodes={"InfraDevice": {"include": ["tags"], "exclude": ["description"]}},
+        compose={"hostname": "name", "network_os": "platform.ansible_network_os"},
+        groups=[{"prefix": "site", "key": "site.name"}],
+    )
+    options = nodes["InfraDevice"]
+
+    assert sorted(options["include"]) == ["name", "platform", "site", "tags"]
+    assert sorted(options["exclude"]) == ["description", "interfaces", "primary_address", "role", "type"]
+
+    query = nodes_processor.client.build_nodes_query(
+        kind="InfraDevice", include=options["include"], exclude=options["exclude"]
+    )
+    assert sorted(query["InfraDevice"]["edges"]["node"]) == sorted(
+        ["id", "hfid", "display_label", "__typename", "name", "platform", "site", "tags"]
+    )
+
+
+def test_apply_auto_include_nothing_referenced(nodes_processor):
+    nodes = nodes_processor.apply_auto_include(nodes={"InfraDevice": None}, compose={"x": "'a'"}, groups=[])
+
+    assert nodes == {"InfraDevice": {}}
+
+
+def _stored_node_ids(client):
+    return {node_id for nodes in client.client.store._store.values() for node_id in nodes}
+
+
+def test_shared_client_releases_the_store(stub):
+    options = {"api_endpoint": stub.address, "branch": "main", "token": "shared", "timeout": 10}
+    client = get_shared_client(**options)
+    device = client.fetch_single_node(kind="InfraDevice", filters={"name__value": "device-000001"})
+    client.fetch_single_artifact(filters={"name__value": "startup-config", "object__ids": [device.id]})
+    sites = client.fetch_nodes(kind="LocationSite")
+
+    assert {device.id, *(site.id for site in sites)} <= _stored_node_ids(client)
+
+    assert get_shared_client(**options) is client
+    assert not _stored_node_ids(client)
+    assert client.stored_nodes == 0
+
+
+def test_shared_clients_closed_at_exit(stub):
+    options = {"api_endpoint": stub.address, "branch": "main", "token": "closed", "timeout": 10}
+    client = get_shared_client(**options)
+
+    close_shared_clients()
+
+    assert client.http_client.is_closed
+    assert get_shared_client(**options) is not client
+
+
+def test_requests_sent_through_the_pool(client_factory):
+    metrics = InfrahubMetrics()
+    with client_factory(metrics=metrics) as client:
+        # The SDK hook is used, its request method is left as is
+        assert client.client.config.sync_requester == client._send_request
+        client.fetch_nodes(kind="LocationSite")
+        http_client = client.http_client
+        assert not http_client.is_closed
+
+    assert http_client.is_closed
+    assert metrics.report()["total_requests"] == 2  # noqa: PLR2004
+
+
+DEVICES_QUERY = "query ($name: String) { InfraDevice(name__value: $name) { edges { node { id } } } }"
+SITES_QUERY = "{ sites: LocationSite { edges { node { id } } } }"
+
+
+def test_namespace_query():
+    operation, fragments, variables = InfrahubQueryProcessor._namespace_query(
+        query=DEVICES_QUERY, variables={"name": "device-000001", "unused": 1}, prefix="q3_"
+    )
+
+    assert print_ast(operation) == (
+        "query ($q3_name: String) {\n  q3_InfraDevice: InfraDevice(name__value: $q3_name) {\n"
+        "    edges {\n      node {\n        id\n      }\n    }\n  }\n}"
+    )
+    assert fragments == []
+    assert variables == {"q3_name": "device-000001"}
+    assert [field.alias.value for field in operation.selection_set.selections] == ["q3_InfraDevice"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        'mutation { TagCreate(data: {name: {value: "a"}}) { ok } }',
+        "query a { InfraDevice { count } } query b { LocationSite { count } }",
+        "query { ...root } fragment root on Query { InfraDevice { count } }",
+        "query { InfraDevice { count }",
+    ],
+)
+def test_namespace_query_not_mergeable(query):
+    assert InfrahubQueryProcessor._namespace_query(query=query, variables=None, prefix="q0_") is None
+
+
+@pytest.fixture
+def sent_queries(client_factory, monkeypatch):
+    """Query processor of the stub server, and the queries it sends."""
+    processor = InfrahubQueryProcessor(client=client_factory())
+    queries = []
+    execute_graphql = processor.client.execute_graphql
+
+    def record(query, variables=None):
+        queries.append(query)
+        return execute_graphql(query=query, variables=variables)
+
+    monkeypatch.setattr(processor.client, "execute_graphql", record)
+    return processor, queries
+
+
+def test_fetch_and_process_many_same_as_single_queries(sent_queries):
+    processor, queries = sent_queries
+    terms = [
+        (DEVICES_QUERY, {"name": "device-000001"}),
+        (SITES_QUERY, None),
+        ({"InfraDevice": {"@filters": {"name__value": "$name"}, "edges": {"node": {"id": None}}}}, {"name": "x"}),
+    ]
+
+    results = processor.fetch_and_process_many(queries=terms)
+
+    assert len(queries) == 1
+    assert len(results[0]) == 1
+    assert results[0] == processor.fetch_and_process(query=terms[2][0], variables={"name": "device-000001"})
+    assert results[1] == processor.fetch_and_process(query=SITES_QUERY)
+    assert results[2] == []
+
+
+def test_fetch_and_process_many_in_order(sent_queries):
+    processor, queries = sent_queries
+    invalid = "query { InfraDevice { count }"
+
+    with pytest.raises(Exception):  # noqa: B017, PT011
+        processor.fetch_and_process_many(queries=[(DEVICES_QUERY, None), (invalid, None), (SITES_QUERY, None)])
+
+    # The query preceding the invalid one is sent first, the invalid one on its own, reported by the server
+    assert len(queries) == 2  # noqa: PLR2004
+    assert "q0_InfraDevice" in queries[0]
+    assert "LocationSite" not in queries[0]
+    assert queries[1] == invalid
+
+
+@pytest.mark.parametrize(
+    ("args", "expected"),
+    [({}, "true"), ({"use_async": None}, "true"), ({"use_async": False}, False), ({"use_async": True}, True)],
+)
+def test_get_arg_or_env(monkeypatch, args, expected):
+    monkeypatch.setenv("INFRAHUB_USE_ASYNC", "true")
+
+    assert get_arg_or_env(args, "use_async", "INFRAHUB_USE_ASYNC") == expected
+
+
+@pytest.fixture
+def memoizing_processor(nodes_processor, monkeypatch):
+    """Processor resolving any peer with its name only, and the ids of the peers it resolves."""
+    monkeypatch.setattr(nodes_processor, "get_peer_attributes", lambda kind, depth: ("name",))
+    resolved = []
+
+    def resolve(node_id, ancestors=(), cut=None):
+        def resolve_attrs(attrs):
+            resolved.append(node_id)
+            if cut:
+                nodes_processor._resolve_memoized(
+                    node_id=cut, kind="InfraDevice", depth=0, ancestors=(*ancestors, node_id), resolve=resolve_attrs
+                )
+            return {"id": node_id, "attrs": attrs}
+
+        return nodes_processor._resolve_memoized(
+            node_id=node_id, kind="InfraDevice", depth=1, ancestors=ancestors, resolve=resolve_attrs
+        )
+
+    return resolve, resolved
+
+
+def test_resolve_memoized_shares_the_peers(memoizing_processor):
+    resolve, resolved = memoizing_processor
+
+    first = resolve("peer-1", ancestors=("host-1",))
+    assert resolve("peer-1", ancestors=("host-2",)) is first
+    assert resolved == ["peer-1"]
+    assert first == {"id": "peer-1", "attrs": ["name"]}
+
+
+def test_resolve_memoized_cuts_the_cycles(memoizing_processor, nodes_processor):
+    resolve, resolved = memoizing_processor
+
+    assert resolve("host-1", ancestors=("host-1",)) == {"id": "host-1"}
+    assert nodes_processor.cycles_cut == 1
+    assert not resolved
+
+    # The peer refers back to its ancestor: the cut depends on the ancestors, the peer isn't shared
+    resolve("peer-1", ancestors=("host-1",), cut="host-1")
+    resolve("peer-1", ancestors=("host-2",))
+    assert nodes_processor.cycles_cut == 2  # noqa: PLR2004
+    assert resolved == ["peer-1", "peer-1"]
+
+
+def test_resolve_cycles_on_the_server(client_factory):
+    processor = InfrahubNodesProcessor(client=client_factory(), max_depth=2)
+    hosts = {}
+    for page in processor.iter_process(nodes={"InfraDevice": {"include": ["name", "interfaces"]}}):
+        hosts.update(page)
+
+    device = hosts["device-000001"]
+    assert device["interfaces"]
+    for interface in device["interfaces"]:
+        # The interface's device is the host itself, not resolved again
+        assert interface["device"] == {"id": device["id"]}
+    assert processor.cycles_cut >= len(hosts)
+
+
+def test_refresh_fetches_the_changed_hosts_only(nodes_processor, stub, monkeypatch):
+    nodes = {"InfraDevice": {"include": ["name", "role", "site"]}}
+    state = nodes_processor.fetch_state(nodes=nodes)
+    stub.stats.reset()
+    hosts = {}
+    for page in nodes_processor.iter_process(nodes=nodes):
+        hosts.update(page)
+    full_build = stub.stats.snapshot()
+
+    fetched = []
+    fetch_nodes_by_ids = nodes_processor.client.fetch_nodes_by_ids
+
+    def spy(ids_by_kind, **kwargs):
+        fetched.extend(node_id for ids in ids_by_kind.values() for node_id in ids)
+        return fetch_nodes_by_ids(ids_by_kind=ids_by_kind, **kwargs)
+
+    monkeypatch.setattr(nodes_processor.client, "fetch_nodes_by_ids", spy)
+    device = stub.dataset.by_kind["InfraDevice"][3]
+    role = device["data"]["role"]
+    stub.dataset.update(device["id"], "role", "spine")
+    try:
+        stub.stats.reset()
+        refreshed, _ = nodes_processor.refresh_and_process(nodes=nodes, host_node_attributes=hosts, state=state)
+        refresh = stub.stats.snapshot()
+    finally:
+        stub.dataset.update(device["id"], "role", role)
+
+    assert fetched == [device["id"]]
+    assert refreshed["device-000003"]["role"] == "spine"
+    assert {host: attributes for host, attributes in refreshed.items() if host != "device-000003"} == {
+        host: attributes for host, attributes in hosts.items() if host != "device-000003"
+    }
+    # The state and the changed host only, instead of all the hosts and their peers
+    assert refresh["bytes_sent"] < full_build["bytes_sent"]
+
+
+def _process_pages(processor, nodes, **options):
+    return [dict(page) for page in processor.iter_process(nodes=nodes, **options)]
+
+
+def _merge(pages):
+    return {host: attributes for page in pages for host, attributes in page.items()}
+
+
+def test_batch_query_same_hosts_in_fewer_requests(client_factory, stub):
+    nodes = {"InfraDevice": {"include": ["name", "site"]}, "LocationSite": {"include": ["name"]}}
+    stub.stats.reset()
+    hosts = _merge(_process_pages(InfrahubNodesProcessor(client=client_factory()), nodes))
+    requests = stub.stats.snapshot()["requests"]["graphql"]
+
+    stub.stats.reset()
+    batched = _merge(_process_pages(InfrahubNodesProcessor(client=client_factory()), nodes, batch_query=True))
+
+    assert batched == hosts
+    assert stub.stats.snapshot()["requests"]["graphql"] < requests
+
+
+def test_max_concurrency(client_factory, monkeypatch):
+    nodes = {"InfraDevice": {"include": ["name"]}}
+    client = client_factory(max_concurrency=3)
+    client.client.pagination_size = 2
+    lock = threading.Lock()
+    running = []
+    concurrency = []
+    fetch_page = client._fetch_page
+
+    def spy(**kwargs):
+        with lock:
+            running.append(None)
+            concurrency.append(len(running))
+        time.sleep(0.02)
+        try:
+            return fetch_page(**kwargs)
+        finally:
+            with lock:
+                running.pop()
+
+    monkeypatch.setattr(client, "_fetch_page", spy)
+    hosts = _merge(_process_pages(InfrahubNodesProcessor(client=client), nodes))
+
+    assert 1 < max(concurrency) <= 3  # noqa: PLR2004
+    assert hosts == _merge(_process_pages(InfrahubNodesProcessor(client=client_factory(max_concurrency=1)), nodes))
+
+
+def test_schema_loaded_once_before_the_threads(client_factory, stub):
+    client = client_factory(max_concurrency=4)
+    ids_by_kind = {
+        kind: [stub.dataset.by_kind[kind][0]["id"]] for kind in ("InfraDevice", "LocationSite", "BuiltinTag")
+    }
+    stub.stats.reset()
+
+    nodes_by_kind = client.fetch_nodes_by_ids(ids_by_kind=ids_by_kind)
+
+    assert all(len(nodes) == 1 for nodes in nodes_by_kind.values())
+    assert stub.stats.snapshot()["requests"]["schema"] == 1
+
+
+def test_schema_disk_cache(client_factory, stub, tmp_path):
+    stub.stats.reset()
+    client = client_factory(schema_cache_dir=str(tmp_path))
+    client.load_schema()
+    assert stub.stats.snapshot()["requests"] == {"schema_summary": 1, "schema": 1}
+    (cache_path,) = tmp_path.iterdir()
+
+    # Only the hash of the schema is requested by the next runs
+    stub.stats.reset()
+    cached = client_factory(schema_cache_dir=str(tmp_path))
+    cached.load_schema()
+    assert stub.stats.snapshot()["requests"] == {"schema_summary": 1}
+    assert sorted(cached.client.schema.cache["main"]) == sorted(client.client.schema.cache["main"])
+
+    # Loaded again once the schema has changed
+    cache_path.write_text(cache_path.read_text().replace(stub_server.SCHEMA_HASH, "previous"))
+    stub.stats.reset()
+    client_factory(schema_cache_dir=str(tmp_path)).load_schema()
+    assert stub.stats.snapshot()["requests"] == {"schema_summary": 1, "schema": 1}
+
+
+def test_iter_process_streams_the_pages(client_factory):
+    nodes = {"InfraDevice": {"include": ["name", "site"]}}
+    client = client_factory()
+    client.client.pagination_size = 5
+    pages = _process_pages(InfrahubNodesProcessor(client=client), nodes)
+
+    assert [len(page) for page in pages] == [5, 5, 5, 5]
+    assert _merge(pages) == _merge(_process_pages(InfrahubNodesProcessor(client=client_factory()), nodes))
+
+
+def test_metrics_of_the_processing(client_factory):
+    metrics = InfrahubMetrics()
+    processor = InfrahubNodesProcessor(client=client_factory(metrics=metrics))
+    _process_pages(processor, {"InfraDevice": {"include": ["name", "site"]}})
+
+    report = metrics.report()
+    assert report["kinds"]["InfraDevice"]["nodes"] == 20  # noqa: PLR2004
+    assert report["kinds"]["InfraDevice"]["requests"] >= 1
+    assert report["total_requests"] == sum(phase["requests"] for phase in report["phases"].values())
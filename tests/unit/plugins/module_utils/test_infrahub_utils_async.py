@@ -0,0 +1,121 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import gc
+import warnings
+
+import pytest
+from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
+    InfrahubclientAsyncWrapper,
+    InfrahubNodesProcessor,
+    InfrahubQueryProcessor,
+)
+
+DEVICE_ATTRIBUTES = ["name", "role", "primary_address", "platform", "site", "tags"]
+# Smaller than the number of devices of the stub, so that the nodes are fetched in several pages
+PAGINATION_SIZE = 7
+
+
+@pytest.fixture
+def clients(client_factory):
+    sync_client = client_factory(max_concurrency=4)
+    async_client = client_factory(InfrahubclientAsyncWrapper, max_concurrency=4)
+    for client in (sync_client, async_client):
+        client.client.pagination_size = PAGINATION_SIZE
+    return sync_client, async_client
+
+
+def _fetch_hosts(client, **processor_options):
+    processor = InfrahubNodesProcessor(client=client, **processor_options)
+    hosts = {}
+    for page in processor.iter_process(nodes={"InfraDevice": {"include": DEVICE_ATTRIBUTES}}):
+        hosts.update(page)
+    return hosts
+
+
+def test_fetch_nodes(clients):
+    sync_nodes, async_nodes = (client.fetch_nodes(kind="InfraDevice") for client in clients)
+
+    assert len(sync_nodes) > PAGINATION_SIZE
+    assert [(node.id, str(node)) for node in async_nodes] == [(node.id, str(node)) for node in sync_nodes]
+
+
+def test_fetch_nodes_by_ids(clients):
+    ids = [node.id for node in clients[0].fetch_nodes(kind="LocationSite")]
+
+    sync_nodes, async_nodes = (client.fetch_nodes_by_ids(ids_by_kind={"LocationSite": ids}) for client in clients)
+
+    assert sorted(node.id for node in async_nodes["LocationSite"]) == sorted(ids)
+    assert sorted(node.id for node in sync_nodes["LocationSite"]) == sorted(ids)
+
+
+@pytest.mark.parametrize("lean", [False, True])
+@pytest.mark.parametrize("max_depth", [1, 2])
+def test_iter_process(client_factory, lean, max_depth):
+    sync_client = client_factory(lean=lean)
+    with client_factory(InfrahubclientAsyncWrapper, lean=lean, max_concurrency=4) as async_client:
+        for client in (sync_client, async_client):
+            client.client.pagination_size = PAGINATION_SIZE
+
+        assert _fetch_hosts(async_client, max_depth=max_depth) == _fetch_hosts(sync_client, max_depth=max_depth)
+
+
+def test_fetch_and_process(clients):
+    query = {
+        "InfraDevice": {
+            "@filters": {"role__value": "$role"},
+            "edges": {"node": {"id": None, "name": {"value": None}, "site": {"node": {"display_label": None}}}},
+        }
+    }
+
+    sync_result, async_result = (
+        InfrahubQueryProcessor(client=client).fetch_and_process(query=query, variables={"role": "edge"})
+        for client in clients
+    )
+
+    assert sync_result
+    assert async_result == sync_result
+
+
+def test_execute_graphql_responses(clients):
+    query = 'query { InfraDevice(role__value: "edge") { count edges { node { id name { value } } } } }'
+
+    sync_response, async_response = (client.execute_graphql(query=query) for client in clients)
+
+    assert sync_response["InfraDevice"]["count"] > 0
+    assert async_response == sync_response
+
+
+def test_fetch_single_artifact(clients):
+    sync_client, async_client = clients
+    device = sync_client.fetch_single_node(kind="InfraDevice", filters={"name__value": "device-000003"})
+    filters = {"name__value": "startup-config", "object__ids": [device.id]}
+
+    assert async_client.fetch_single_artifact(filters=filters) == sync_client.fetch_single_artifact(filters=filters)
+
+
+def test_close(client_factory):
+    with client_factory(InfrahubclientAsyncWrapper) as client:
+        client.load_schema()
+
+    assert client.loop.is_closed()
+    assert client.async_http_client.is_closed
+    # Closing twice is harmless
+    client.close()
+
+
+def test_connections_released_with_the_client(stub):
+    # e.g. a shared client, never closed
+    client = InfrahubclientAsyncWrapper(api_endpoint=stub.address, branch="main", token="unit")  # noqa: S106
+    client.fetch_nodes(kind="LocationSite")
+    loop, http_client = client.loop, client.async_http_client
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        del client
+        gc.collect()
+
+    assert loop.is_closed()
+    assert http_client.is_closed
+    assert not [warning for warning in caught if issubclass(warning.category, ResourceWarning)]
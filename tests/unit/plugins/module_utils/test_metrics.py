@@ -0,0 +1,68 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+from ansible_collections.opsmill.infrahub.plugins.module_utils import metrics as metrics_module
+from ansible_collections.opsmill.infrahub.plugins.module_utils.metrics import InfrahubMetrics
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(metrics_module.time, "perf_counter", lambda: now[0])
+    return now
+
+
+def test_nested_phases(clock):
+    metrics = InfrahubMetrics()
+    with metrics.phase("nodes"):
+        clock[0] += 1
+        with metrics.phase("peers"):
+            clock[0] += 2
+        clock[0] += 3
+
+    # The time of the nested phases is excluded
+    assert metrics.report()["phases"]["nodes"]["time"] == 4  # noqa: PLR2004
+    assert metrics.report()["phases"]["peers"]["time"] == 2  # noqa: PLR2004
+
+
+def test_record_request():
+    metrics = InfrahubMetrics()
+    with metrics.phase("nodes"):
+        metrics.record_request(size=100, tracker="query-infradevice-offset0")
+        metrics.record_request(size=50, tracker="query-batch-offset0")
+    metrics.record_request(size=10)
+    metrics.record_nodes(kind="InfraDevice", count=20)
+
+    report = metrics.report()
+    assert report["total_requests"] == 3  # noqa: PLR2004
+    assert report["total_bytes"] == 160  # noqa: PLR2004
+    assert report["phases"]["nodes"]["requests"] == 2  # noqa: PLR2004
+    assert report["phases"]["other"]["bytes"] == 10  # noqa: PLR2004
+    # The batch queries have no kind, the kind of a tracker takes the case of the nodes recorded
+    assert report["kinds"] == {"InfraDevice": {"requests": 1, "bytes": 100, "nodes": 20}}
+
+
+def test_disabled():
+    metrics = InfrahubMetrics(enabled=False)
+    with metrics.phase("nodes"):
+        metrics.record_request(size=100, tracker="query-infradevice-offset0")
+    metrics.record_nodes(kind="InfraDevice", count=20)
+
+    report = metrics.report()
+    assert report["total_requests"] == 0
+    assert report["phases"] == {}
+    assert report["kinds"] == {}
+
+
+def test_summary():
+    metrics = InfrahubMetrics()
+    with metrics.phase("nodes"):
+        metrics.record_request(size=2048, tracker="query-infradevice-offset0")
+    metrics.record_nodes(kind="InfraDevice", count=20)
+
+    lines = metrics.summary()
+    assert lines[0].endswith("1 requests, 2.0 KiB")
+    assert lines[1].startswith("Phase nodes: ")
+    assert lines[2] == "Kind InfraDevice: 20 nodes, 1 requests, 2.0 KiB"
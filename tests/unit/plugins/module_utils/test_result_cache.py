@@ -0,0 +1,132 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import time
+
+import pytest
+from ansible_collections.opsmill.infrahub.plugins.module_utils import result_cache
+from ansible_collections.opsmill.infrahub.plugins.module_utils.result_cache import (
+    RESULT_FILE_PREFIX,
+    InfrahubResultCache,
+    get_result_cache,
+)
+
+RESULT = [{"node": {"id": "device-1", "name": {"value": "device-1"}}}]
+
+
+def _result_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.startswith(RESULT_FILE_PREFIX))
+
+
+def _age(cache, key, seconds):
+    mtime = time.time() - seconds
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+def test_get_returns_a_copy():
+    cache = InfrahubResultCache(ttl=60)
+    cache.set("key", RESULT)
+
+    result = cache.get("key")
+    result[0]["node"]["id"] = "device-2"
+
+    assert cache.get("key") == RESULT
+    with pytest.raises(KeyError):
+        cache.get("other")
+
+
+def test_memory_ttl(monkeypatch):
+    cache = InfrahubResultCache(ttl=60)
+    monkeypatch.setattr(result_cache.time, "time", lambda: 1000)
+    cache.set("key", RESULT)
+
+    monkeypatch.setattr(result_cache.time, "time", lambda: 1059)
+    assert cache.get("key") == RESULT
+    monkeypatch.setattr(result_cache.time, "time", lambda: 1060)
+    with pytest.raises(KeyError):
+        cache.get("key")
+    assert not cache._entries
+
+
+def test_memory_keeps_the_most_recently_used():
+    cache = InfrahubResultCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert list(cache._entries) == ["a", "c"]
+    with pytest.raises(KeyError):
+        cache.get("b")
+
+
+def test_disk_shared_between_processes(tmp_path):
+    InfrahubResultCache(ttl=60, cache_dir=str(tmp_path)).set("key", RESULT)
+
+    # Another process starts with an empty memory
+    cache = InfrahubResultCache(ttl=60, cache_dir=str(tmp_path))
+    assert cache.get("key") == RESULT
+    assert "key" in cache._entries
+
+
+def test_disk_ttl(tmp_path):
+    InfrahubResultCache(ttl=60, cache_dir=str(tmp_path)).set("key", RESULT)
+    cache = InfrahubResultCache(ttl=60, cache_dir=str(tmp_path))
+    _age(cache, "key", 61)
+
+    with pytest.raises(KeyError):
+        cache.get("key")
+
+
+def test_disk_unreadable_result(tmp_path):
+    cache = InfrahubResultCache(ttl=60, cache_dir=str(tmp_path))
+    (tmp_path / f"{RESULT_FILE_PREFIX}key").write_text("{not json")
+
+    with pytest.raises(KeyError):
+        cache.get("key")
+
+
+def test_evict_expired_results(tmp_path):
+    cache = InfrahubResultCache(ttl=60, cache_dir=str(tmp_path))
+    cache.set("old", RESULT)
+    _age(cache, "old", 61)
+    (tmp_path / "unrelated").write_text("kept")
+
+    cache.set("new", RESULT)
+
+    assert _result_files(tmp_path) == [f"{RESULT_FILE_PREFIX}new"]
+    assert (tmp_path / "unrelated").exists()
+
+
+def test_evict_the_oldest_results_above_max_size(tmp_path):
+    cache = InfrahubResultCache(ttl=60, cache_dir=str(tmp_path))
+    for idx, key in enumerate(("a", "b", "c")):
+        # Not compressible, the files have about the same size
+        cache.set(key, os.urandom(1000).hex())
+        _age(cache, key, 30 - idx)
+    size = os.path.getsize(cache._path("a"))
+    cache.max_size = int(size * 2.5)
+
+    cache.set("d", os.urandom(1000).hex())
+
+    assert _result_files(tmp_path) == [f"{RESULT_FILE_PREFIX}{key}" for key in ("c", "d")]
+
+
+def test_get_result_cache():
+    assert get_result_cache(ttl=0) is None
+    assert get_result_cache(ttl=None) is None
+
+    cache = get_result_cache(ttl=60, cache_dir="/tmp/infrahub-results")  # noqa: S108
+    assert get_result_cache(ttl="60", cache_dir="/tmp/infrahub-results") is cache  # noqa: S108
+    assert get_result_cache(ttl=60) is not cache
+    assert cache.cache_dir == "/tmp/infrahub-results"  # noqa: S108
+    assert cache.max_size == result_cache.DEFAULT_MAX_SIZE * 1024 * 1024
+    assert get_result_cache(ttl=60, max_size="1").max_size == 1024 * 1024
+
+
+@pytest.mark.parametrize("max_size", [0, "0", -1])
+def test_get_result_cache_without_disk_space(max_size):
+    with pytest.raises(ValueError, match="positive"):
+        get_result_cache(ttl=60, max_size=max_size)
@@ -0,0 +1,106 @@
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+from ansible.inventory.group import Group
+from ansible.inventory.host import Host
+from ansible.plugins.loader import vars_loader
+from ansible_collections.opsmill.infrahub.plugins.module_utils.infrahub_utils import (
+    LAZY_RELATIONSHIPS_VARIABLE,
+    InfrahubNodesProcessor,
+    close_shared_clients,
+)
+
+
+@pytest.fixture
+def hosts(client_factory):
+    """The devices of the stub as set by the inventory, their interfaces left to the vars plugin."""
+    processor = InfrahubNodesProcessor(client=client_factory(), lazy_relationships={"InfraDevice": ["interfaces"]})
+    edge, core = Group("edge"), Group("core")
+    result = {}
+    for page in processor.iter_process(nodes={"InfraDevice": {"include": ["name", "interfaces"]}}):
+        for name, attributes in page.items():
+            host = Host(name)
+            for key, value in attributes.items():
+                host.set_variable(key, value)
+            (edge if int(name[-2:]) < 5 else core).add_host(host)  # noqa: PLR2004
+            result[name] = host
+    return result
+
+
+@pytest.fixture
+def plugin(monkeypatch, stub):
+    plugin = vars_loader.get("opsmill.infrahub.vars")
+    monkeypatch.setattr(type(plugin), "_loaded", {})
+    monkeypatch.setattr(type(plugin), "_processors", {})
+    plugin.set_options(direct={"api_endpoint": "http://unused", "token": "unused", "batch_size": 100})  # noqa: S106
+    yield plugin
+    close_shared_clients()
+
+
+def test_hosts_set_the_source(hosts, stub):
+    lazy = hosts["device-000001"].vars[LAZY_RELATIONSHIPS_VARIABLE]
+
+    assert lazy["api_endpoint"] == stub.address
+    assert lazy["relationships"] == ["interfaces"]
+    # A key of the token, not the token itself
+    assert lazy["token"] != "unit"
+    assert "interfaces" not in hosts["device-000001"].vars
+
+
+def test_get_vars_loads_the_group_at_once(plugin, hosts, stub):
+    stub.stats.reset()
+    data = plugin.get_vars(loader=None, path="", entities=[hosts["device-000001"]])
+
+    assert len(data["interfaces"]) == 2  # noqa: PLR2004
+    # The schema, then the 5 devices of the edge group and their interfaces, from the endpoint of the inventory
+    assert stub.stats.snapshot()["total_requests"] == 3  # noqa: PLR2004
+    assert len(plugin._loaded) == 5  # noqa: PLR2004
+    assert list(plugin._processors) == [
+        (stub.address, hosts["device-000001"].vars[LAZY_RELATIONSHIPS_VARIABLE]["token"], "main")
+    ]
+
+    plugin.get_vars(loader=None, path="", entities=[hosts["device-000002"]])
+    assert stub.stats.snapshot()["total_requests"] == 3  # noqa: PLR2004
+
+
+def test_get_batch(plugin, hosts):
+    batch = plugin._get_batch(host=hosts["device-000010"])
+
+    assert batch[0].name == "device-000010"
+    assert sorted(host.name for host in batch) == [f"device-0000{idx:02d}" for idx in range(5, 20)]
+
+    plugin.set_option("batch_size", 3)
+    assert len(plugin._get_batch(host=hosts["device-000010"])) == 3  # noqa: PLR2004
+
+    # The hosts already loaded aren't loaded again
+    plugin.set_option("batch_size", 100)
+    plugin.get_vars(loader=None, path="", entities=[hosts["device-000005"]])
+    assert [host.name for host in plugin._get_batch(host=hosts["device-000010"])] == ["device-000010"]
+
+
+def test_get_batch_without_group(plugin):
+    host = Host("device-000001")
+
+    assert plugin._get_batch(host=host) == [host]
+
+
+def test_cache_plugin(plugin, hosts, stub, tmp_path, monkeypatch):
+    stub.stats.reset()
+    plugin.set_options(
+        direct={
+            "cache": True,
+            "cache_plugin": "ansible.builtin.jsonfile",
+            "cache_connection": str(tmp_path),
+            "batch_size": 100,
+        }
+    )
+    data = plugin.get_vars(loader=None, path="", entities=[hosts["device-000001"]])
+    assert len(list(tmp_path.iterdir())) == 5  # noqa: PLR2004
+
+    # A later run reads the relationships from the cache plugin
+    monkeypatch.setattr(type(plugin), "_loaded", {})
+    stub.stats.reset()
+    assert plugin.get_vars(loader=None, path="", entities=[hosts["device-000001"]]) == data
+    assert stub.stats.snapshot()["total_requests"] == 0